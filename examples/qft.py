@@ -1,4 +1,5 @@
 from surface_code_routing.dag import DAG
+from surface_code_routing.dag_template import DAGTemplate
 from surface_code_routing.instructions import INIT, CNOT, MEAS, X, Hadamard
 from surface_code_routing.synth_instructions import CPHASE_theta
 from surface_code_routing.lib_instructions import T_Factory
@@ -12,7 +13,7 @@ def qft(n_qubits, width, height, precision=10, gates=None, t_factory=None, **com
     if t_factory is None:
         t_factory = T_Factory()
     dag = DAG(f'qft_{n_qubits}_{height}')
-    instruction_cache = {i:CPHASE_theta(2, 2 ** i, precision=precision, **gates) for i in range(2, n_qubits + 1)} 
+    instruction_cache = {i:DAGTemplate(CPHASE_theta(2, 2 ** i, precision=precision, **gates)) for i in range(2, n_qubits + 1)} 
     for i in range(n_qubits):
         dag.add_gate(Hadamard(f'q_{i}')) 
         for j in range(i + 1, n_qubits):
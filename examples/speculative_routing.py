@@ -0,0 +1,72 @@
+'''
+    Times speculative routing in a process pool against routing the same gates serially
+    Gates are split into one independent cluster per worker, each on its own strip of the QCB
+'''
+import random
+import sys
+import time
+
+from surface_code_routing.dag import DAG
+from surface_code_routing.instructions import INIT, CNOT
+from surface_code_routing.symbol import Symbol
+
+from surface_code_routing.qcb import QCB
+from surface_code_routing.allocator import Allocator
+from surface_code_routing.qcb_graph import QCBGraph
+from surface_code_routing.qcb_tree import QCBTree
+from surface_code_routing.mapper import QCBMapper
+from surface_code_routing.circuit_model import PatchGraph
+from surface_code_routing.speculative_routing import SpeculativeRouter, init_worker, route_chunk
+
+def patch_graph(height, width, n_registers):
+    dag = DAG(Symbol('Benchmark'))
+    registers = [f'r{i}' for i in range(n_registers)]
+    dag.add_gate(INIT(*registers))
+    dag.add_gate(CNOT(registers[0], registers[1]))
+
+    qcb = QCB(height, width, dag)
+    allocator = Allocator(qcb)
+    graph = QCBGraph(qcb)
+    tree = QCBTree(graph)
+    mapper = QCBMapper(dag, tree)
+    return PatchGraph(qcb.shape, mapper, None)
+
+def benchmark(n_workers=2, height=16, width=32, n_registers=40, n_requests=200, repeats=5, seed=0):
+    circuit_model = patch_graph(height, width, n_registers)
+    speculative_router = SpeculativeRouter(circuit_model, n_workers)
+    init_worker(circuit_model.route_mask, circuit_model.coordinate_adjacency)
+
+    rng = random.Random(seed)
+    route_patches = [tuple(map(int, patch)) for patch in zip(*circuit_model.route_mask.nonzero())]
+    strip = width // n_workers
+    strips = [[patch for patch in route_patches if strip * i + 2 <= patch[1] < strip * (i + 1) - 2] for i in range(n_workers)]
+    requests = []
+    for key in range(n_requests):
+        start, end = rng.sample(strips[key % n_workers], 2)
+        requests.append((key, (start, end), [(start, end, None)]))
+
+    blocked = speculative_router.snapshot()
+    serial_time = float('inf')
+    for _ in range(repeats):
+        timer = time.perf_counter()
+        serial = dict(route_chunk(blocked, circuit_model.orientations, requests))
+        serial_time = min(serial_time, time.perf_counter() - timer)
+
+    try:
+        # Warm the pool before timing it
+        speculative_router(requests)
+        pool_time = float('inf')
+        for _ in range(repeats):
+            timer = time.perf_counter()
+            candidates = speculative_router(requests)
+            pool_time = min(pool_time, time.perf_counter() - timer)
+    finally:
+        speculative_router.shutdown()
+
+    # Routes may leave their strip, so candidates can differ from the serial routes
+    return serial_time, pool_time, len(serial), len(candidates)
+
+if __name__ == '__main__':
+    n_workers = int(sys.argv[1]) if len(sys.argv) > 1 else 2
+    serial_time, pool_time, n_serial, n_candidates = benchmark(n_workers)
+    print(f'serial {serial_time:.4f}s for {n_serial} gates, pool of {n_workers} {pool_time:.4f}s for {n_candidates} gates, speedup {serial_time / pool_time:.2f}x')
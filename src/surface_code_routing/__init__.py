@@ -3,13 +3,18 @@ from surface_code_routing import symbol
 from surface_code_routing import scope 
 from surface_code_routing import bind 
 from surface_code_routing import instructions
+from surface_code_routing import dag_core
 from surface_code_routing import dag
+from surface_code_routing import dag_template
 from surface_code_routing import qcb 
 from surface_code_routing import allocator
 from surface_code_routing import qcb_graph
 from surface_code_routing import qcb_tree
 from surface_code_routing import tree_slots
 from surface_code_routing import mapper 
+from surface_code_routing import schedule
+from surface_code_routing import dependency_tracker
+from surface_code_routing import checkpoint
 from surface_code_routing import router
 from surface_code_routing import compiled_qcb
 from surface_code_routing import lib_instructions
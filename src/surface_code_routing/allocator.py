@@ -2,6 +2,7 @@ from itertools import chain
 from typing import *
 import copy
 import pdb
+import time
 from surface_code_routing.qcb import Segment, SCPatch, QCB
 from surface_code_routing.dag import DAG
 import surface_code_routing.utils as utils 
@@ -29,7 +30,7 @@ class Allocator:
     VERTICAL_UP = AddrBind("Vertical Up")
     VERTICAL_DOWN = AddrBind("Vertical Down")
 
-    def __init__(self, qcb: QCB, *extern_templates, optimise=True, tikz_build=True, verbose=False, opt_space=False, opt_route=True):
+    def __init__(self, qcb: QCB, *extern_templates, optimise=True, tikz_build=True, verbose=False, opt_space=False, opt_route=True, deadline=None):
         self.qcb = qcb
         self.qcb.allocator = self
 
@@ -59,6 +60,9 @@ class Allocator:
         self.tikz_str = ""
         self.verbose = verbose
 
+        # Optimisation passes stop once this wall clock time is reached
+        self.deadline = deadline
+
         # optimise variables
         self.externs = []
         self.n_channels = 1
@@ -121,7 +125,8 @@ class Allocator:
         # Attempts to allocate either an extern or a new channel
         dag = self.qcb.operations
         self.debug_print("Attempting to optimise remaining space\n")
-        while self.optimise_invariant() is True:
+        # Each pass leaves a valid allocation, so passes may be cut short
+        while not self.past_deadline() and self.optimise_invariant() is True:
             self.build_tikz_str()
             self.global_merge_tl()
             self.debug_print('\n')
@@ -255,6 +260,9 @@ class Allocator:
         return
 
 
+    def past_deadline(self) -> bool:
+        return self.deadline is not None and time.time() > self.deadline
+
     def optimise_invariant(self) -> bool:
         '''
             Attempt an optimisation
@@ -265,15 +273,15 @@ class Allocator:
         
         def heuristic(new_extern):
             if new_extern:
-                return (new_extern, dag.compile(self.n_channels, *self.externs, new_extern)[0])
+                return (new_extern, dag.compile(self.n_channels, *self.externs, new_extern, count_only=True)[0])
             else:
-                return (new_extern, dag.compile(self.n_channels + 1, *self.externs)[0])
+                return (new_extern, dag.compile(self.n_channels + 1, *self.externs, count_only=True)[0])
 
         options = [new_extern.instantiate() for new_extern in self.extern_templates]
         options.append(None)
         options = sorted(map(heuristic, options), key=lambda opt:opt[1])
         self.debug_print(options)
-        curr_score = dag.compile(self.n_channels, *self.externs)[0]
+        curr_score = dag.compile(self.n_channels, *self.externs, count_only=True)[0]
 
         options = [opt[0] for opt in options if opt[1] < curr_score]
 
@@ -45,8 +45,8 @@ class Bind():
         return id(self)
 
     # Cycle functions
-    def cycle(self):
-        self.cycles_completed += 1
+    def cycle(self, n_cycles=1):
+        self.cycles_completed += n_cycles
         return self.cycles_completed
 
     def curr_cycle(self):
@@ -128,8 +128,8 @@ class ExternBind(Bind):
     def reset(self):
         self.obj.reset()
 
-    def cycle(self):
-        return self.obj.cycle()
+    def cycle(self, n_cycles=1):
+        return self.obj.cycle(n_cycles)
 
     def curr_cycle(self):
         return self.obj.curr_cycle()
@@ -0,0 +1,247 @@
+import os
+import json
+from array import array
+from heapq import heapify
+from itertools import count
+
+import numpy as np
+
+from surface_code_routing.bind import RouteBind, AddrBind
+from surface_code_routing.inject_teleportation_routes import ancillae_teleport
+
+CHECKPOINT_VERSION = 3
+
+class CheckpointError(Exception):
+    pass
+
+class GateTable():
+    '''
+        Gates are stored by their index in the DAG
+        Gates outside of the DAG are teleports, these are appended to the table along with their addresses
+    '''
+    def __init__(self, dag):
+        self.dag = dag
+        self.indices = {id(gate): idx for idx, gate in enumerate(dag.gates)}
+        self.codes = dict()
+        # Cycles completed by each bound DAG gate
+        self.cycles = dict()
+        self.teleports = []
+
+    def __call__(self, gate):
+        code = self.codes.get(id(gate), None)
+        if code is not None:
+            return code
+        code = self.indices.get(id(gate.obj), None)
+        if code is None:
+            code = len(self.dag.gates) + len(self.teleports)
+            self.teleports.append(coordinates(gate.addresses))
+        else:
+            self.cycles[code] = gate.cycles_completed
+        self.codes[id(gate)] = code
+        return code
+
+class GateLookup():
+    '''
+        Rebinds gates from a checkpoint, each DAG gate is bound once
+    '''
+    def __init__(self, dag, graph, cycles, teleports, n_gates):
+        self.dag = dag
+        self.binds = dict()
+        for code, cycles_completed in cycles:
+            gate = self.binds[code] = RouteBind(dag.gates[code], None)
+            gate.cycles_completed = cycles_completed
+        # Teleports follow the gates of the checkpointed DAG
+        for code, addresses in enumerate(teleports, n_gates):
+            self.binds[code] = RouteBind(ancillae_teleport(), patches(graph, addresses))
+
+    def __call__(self, code):
+        return self.binds[code]
+
+def coordinates(addresses):
+    if addresses is None:
+        return None
+    return [(patch.y, patch.x) for patch in addresses]
+
+def patches(graph, addresses):
+    if addresses is None:
+        return None
+    return [graph[tuple(address)] for address in addresses]
+
+def extern_segment_maps(router):
+    '''
+        Extern segment maps ordered by the first extern symbol in the DAG that uses them
+    '''
+    segment_maps = dict()
+    for symbol in router.dag.externs:
+        segment_map = router.mapper.segment_maps.get(symbol.predicate, None)
+        if segment_map is not None and id(segment_map) not in segment_maps:
+            segment_maps[id(segment_map)] = segment_map
+    return list(segment_maps.values())
+
+def register_map(mapper):
+    '''
+        Segment bounds and coordinates of each register, keyed on the register
+    '''
+    registers = dict()
+    for symbol, segment_map in mapper.map.items():
+        if symbol.is_extern():
+            continue
+        segment = segment_map.get_segment()
+        registers[repr(symbol)] = [segment.y_0, segment.x_0, segment.y_1, segment.x_1, *map(int, segment_map[symbol])]
+    return registers
+
+def checkpoint_state(router):
+    '''
+        State of the router between routing iterations
+        Gates, patches, segments and extern symbols are stored by index or coordinate rather than pickled
+        Returns a JSON serialisable dict and a dict of arrays
+    '''
+    dag = router.dag
+    graph = router.graph
+    layers = router.layers
+    gates = GateTable(dag)
+
+    # Extern symbols compare equal when they share a predicate, so each is indexed on its first occurrence
+    extern_indices = dict()
+    for idx, symbol in enumerate(dag.externs):
+        extern_indices.setdefault(symbol, idx)
+    symbol_index = lambda symbol: -1 if symbol is None else extern_indices[symbol]
+
+    # Lock owners that are no longer bound to a gate are stored as free
+    owner_codes = np.full(len(graph.lock_owners), -1, dtype=np.int64)
+    expiry = dict()
+    for owner, lock_state in enumerate(graph.lock_owners):
+        if isinstance(lock_state, RouteBind):
+            code = owner_codes[owner] = gates(lock_state)
+            expiry[code] = graph.gate_expiry[graph.lock_gates[owner]]
+
+    state = {
+        'version': CHECKPOINT_VERSION,
+        'n_gates': len(dag.gates),
+        'generation': graph.generation,
+        'routes_abandoned': graph.routes_abandoned,
+        'layers': {'n_layers': layers.n_layers, 'last_end': layers.last_end, 'offset': layers.offset},
+        'waiting': list(map(gates, router.ready_queue)),
+        'active': list(map(gates, router.active_gates)),
+        'resolved': list(map(gates, router.resolved)),
+        'routes': [(gates(gate.obj), coordinates(addresses)) for gate, addresses in router.routes.items()],
+        'completions': [(layer, start, n_cycles, gates(gate)) for layer, _, start, n_cycles, gate in sorted(router.completions)],
+        'active_starts': [(gates(gate), start) for gate, start in router.active_starts.items()],
+        'reservations': None,
+        'expiry': [(int(code), generation) for code, generation in expiry.items()],
+        'externs': [segment_map.checkpoint(symbol_index) for segment_map in extern_segment_maps(router)],
+        'registers': register_map(router.mapper),
+    }
+    if router.reservations is not None:
+        state['reservations'] = [(gates(gate), addresses, generation) for gate, (addresses, generation) in router.reservations.items()]
+
+    intervals = list(layers.intervals())
+    state['intervals'] = {
+        'gates': [gates(gate) for gate, _, _, _ in intervals],
+        'addresses': [coordinates(addresses) for _, _, _, addresses in intervals]
+    }
+    # Bound gates are recorded last, once every gate has been encoded
+    state['cycles'] = list(gates.cycles.items())
+    state['teleports'] = gates.teleports
+    # Latest DAG gate that the state depends on
+    state['max_gate'] = max(gates.cycles, default=-1)
+
+    arrays = {
+        'states': graph.states.copy(),
+        'locks': owner_codes[graph.locks],
+        'orientations': graph.orientations.copy(),
+        'last_used': graph.last_used.copy(),
+        'starts': np.array(layers.starts, dtype=np.int64),
+        'ends': np.array(layers.ends, dtype=np.int64)
+    }
+    return state, arrays
+
+def save_checkpoint(router, path):
+    '''
+        Writes the state of the router to a compressed numpy archive
+        The file is replaced atomically so an interrupted write leaves the previous checkpoint in place
+    '''
+    state, arrays = checkpoint_state(router)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as checkpoint_file:
+        np.savez_compressed(checkpoint_file, state=np.array(json.dumps(state)), **arrays)
+    os.replace(tmp_path, path)
+
+def load_checkpoint(router, path):
+    '''
+        Restores the state of the router from a checkpoint file
+        The router must be constructed over the same DAG and QCB layout as the router that wrote the checkpoint
+    '''
+    with np.load(path, allow_pickle=False) as checkpoint:
+        arrays = {key: checkpoint[key] for key in checkpoint.files}
+    state = json.loads(str(arrays.pop('state')))
+    if state['n_gates'] != len(router.dag.gates):
+        raise CheckpointError("Checkpoint does not match the DAG of this router")
+    restore_state(router, state, arrays)
+
+def restore_state(router, state, arrays):
+    '''
+        Restores the state of the router
+        DAG gates are matched by index, so the DAG may differ from the checkpointed DAG after the latest gate in the state
+    '''
+    dag = router.dag
+    graph = router.graph
+    if state['version'] != CHECKPOINT_VERSION:
+        raise CheckpointError(f"Unsupported checkpoint version {state['version']}")
+    if state['max_gate'] >= len(dag.gates) or not np.array_equal(arrays['states'], graph.states):
+        raise CheckpointError("Checkpoint does not match the DAG or QCB layout of this router")
+    if state['registers'] != register_map(router.mapper):
+        raise CheckpointError("Checkpoint does not match the register allocation of this router")
+
+    gates = GateLookup(dag, graph, state['cycles'], state['teleports'], state['n_gates'])
+
+    # Gate state
+    waiting = router.ready_queue
+    waiting.extend(map(gates, state['waiting']))
+    router.active_gates = set(map(gates, state['active']))
+    router.resolved = set(map(gates, state['resolved']))
+    for gate in router.resolved:
+        router.barrier.resolve(gate.obj)
+        for antecedent in gate.antecedents():
+            waiting.decrement(antecedent)
+    router.routes = {AddrBind(gates(code)): patches(graph, addresses) for code, addresses in state['routes']}
+
+    completions = [(layer, sequence, start, n_cycles, gates(code)) for sequence, (layer, start, n_cycles, code) in enumerate(state['completions'])]
+    heapify(completions)
+    router.completions = completions
+    router.sequence = count(len(completions))
+    router.active_starts = {gates(code): start for code, start in state['active_starts']}
+
+    if state['reservations'] is not None and router.reservations is not None:
+        router.reservations = {gates(code): (tuple(map(tuple, addresses)), generation) for code, addresses, generation in state['reservations']}
+
+    # Patch graph
+    graph.generation = state['generation']
+    graph.routes_abandoned = state['routes_abandoned']
+    graph.orientations[:] = arrays['orientations']
+    graph.last_used[:] = arrays['last_used']
+    for code, generation in state['expiry']:
+        graph.release_locks(gates(code), generation)
+    for (i, j), code in np.ndenumerate(arrays['locks']):
+        if code >= 0:
+            graph.locks[i, j] = graph.lock_owner(gates(int(code)))
+
+    # Schedule
+    layers = router.layers
+    layers.n_layers = state['layers']['n_layers']
+    layers.last_end = state['layers']['last_end']
+    layers.offset = state['layers']['offset']
+    layers.starts = array('q', arrays['starts'].tolist())
+    layers.ends = array('q', arrays['ends'].tolist())
+    layers.gates = list(map(gates, state['intervals']['gates']))
+    layers.addresses = [patches(graph, addresses) for addresses in state['intervals']['addresses']]
+    layers.tails = {id(gate): idx for idx, gate in enumerate(layers.gates)}
+
+    # Extern allocations
+    externs = list(dag.externs)
+    symbols = lambda idx: None if idx < 0 else externs[idx]
+    segment_maps = extern_segment_maps(router)
+    if len(segment_maps) != len(state['externs']):
+        raise CheckpointError("Checkpoint does not match the externs of this router")
+    for segment_map, segment_state in zip(segment_maps, state['externs']):
+        segment_map.restore(segment_state, symbols)
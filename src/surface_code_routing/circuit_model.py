@@ -1,45 +1,74 @@
 import numpy as np
-import queue
+from heapq import heappush, heappop
+from collections import deque, OrderedDict
+from itertools import count
 from surface_code_routing.qcb import SCPatch
 from typing import *
 from surface_code_routing.tikz_utils import tikz_patch_graph
 from surface_code_routing.utils import debug_print
-from surface_code_routing.bind import AddrBind
+from surface_code_routing.bind import AddrBind, RouteBind
 
 from surface_code_routing.constants import SINGLE_ANCILLAE, ELBOW_ANCILLAE
+from surface_code_routing.route_search import ABANDONED, a_star, manhattan, field_heuristic, reverse_adjacency, distance_field
 
 class PatchGraphNode():
+    '''
+        View of a single patch
+        Patch state, orientation, locks and last use are stored in the arrays of the underlying PatchGraph
+    '''
+    __slots__ = ('graph', 'y', 'x', 'verbose')
 
     INITIAL_LOCK_STATE = AddrBind('INITIAL LOCK STATE')
     Z_ORIENTED = AddrBind('Z') # Smooth edge up
     X_ORIENTED = AddrBind('X') # Rough edge up
+    ORIENTATIONS = (X_ORIENTED, Z_ORIENTED)
     SUGGEST_ROUTE = AddrBind('Suggest Route')
     SUGGEST_ROTATE = AddrBind('Suggest Rotate')
     ANCILLAE_STATES = {SCPatch.ROUTE, SCPatch.LOCAL_ROUTE}
 
-    def __init__(self, graph, i, j, orientation = None, verbose=False):
+    def __init__(self, graph, i, j, verbose=False):
         self.graph = graph
         self.y = i
         self.x = j
-        self.state = SCPatch.ROUTE
-        self.last_used = -1
+        self.verbose = verbose
 
-        if orientation is None:
-            orientation = self.X_ORIENTED
-        self.orientation = orientation
-        self.lock_state = self.INITIAL_LOCK_STATE
+    @property
+    def state(self):
+        return self.graph.state_table[self.graph.states[self.y, self.x]]
 
-        self.verbose = verbose
+    @property
+    def orientation(self):
+        return self.ORIENTATIONS[self.graph.orientations[self.y, self.x]]
+
+    @orientation.setter
+    def orientation(self, orientation):
+        self.graph.orientations[self.y, self.x] = self.ORIENTATIONS.index(orientation)
+
+    @property
+    def lock_state(self):
+        return self.graph.lock_owners[self.graph.locks[self.y, self.x]]
+
+    @lock_state.setter
+    def lock_state(self, lock_state):
+        self.graph.locks[self.y, self.x] = self.graph.lock_owner(lock_state)
+
+    @property
+    def last_used(self):
+        return int(self.graph.last_used[self.y, self.x])
+
+    @last_used.setter
+    def last_used(self, cycle):
+        self.graph.last_used[self.y, self.x] = cycle
     
     def set_underlying(self, state):
         debug_print(self, state, debug=self.verbose)
-        self.state = state
+        self.graph.set_state(self.y, self.x, state)
 
     def adjacent(self, gate, **kwargs):
         return self.graph.adjacent(self.y, self.x, gate, **kwargs)
 
     def anc_check(self, anc, gate, unique=True):
-        if anc.state not in self.ANCILLAE_STATES or not anc.probe(gate, unique=unique): 
+        if not self.graph.ancillae_states[anc.y, anc.x] or not anc.probe(gate, unique=unique): 
             return None
         return anc
 
@@ -50,7 +79,7 @@ class PatchGraphNode():
         return self.anc_check(anc, gate, unique=unique)
 
     def anc_below(self, gate, unique=True):
-        if self.y == self.graph.graph.shape[0] - 1:
+        if self.y == self.graph.shape[0] - 1:
             return None
         anc = self.graph[self.y + 1, self.x]
         return self.anc_check(anc, gate, unique=unique)
@@ -62,7 +91,7 @@ class PatchGraphNode():
         return self.anc_check(anc, gate, unique=unique)
 
     def anc_right(self, gate, unique=True):
-        if self.x == self.graph.graph.shape[1] - 1:
+        if self.x == self.graph.shape[1] - 1:
             return None
         anc = self.graph[self.y, self.x + 1]
         return self.anc_check(anc, gate, unique=unique)
@@ -85,7 +114,7 @@ class PatchGraphNode():
         return self.__repr__()
 
     def cost(self):
-        return 1
+        return self.graph.cost(self.y, self.x)
 
     def active_gates(self):
         return self.graph.active_gates()
@@ -94,14 +123,7 @@ class PatchGraphNode():
         return self.state.valid_edge(other_patch.state, edge)
 
     def probe(self, lock_request, unique=False):
-        if not unique and self.lock_state is lock_request:
-            return True
-        if unique and self.lock_state is lock_request:
-            return False
-        # Gate has completed and is no longer active
-        if self.lock_state not in self.active_gates():
-            return True
-        return False 
+        return self.graph.probe(self.y, self.x, lock_request, unique=unique)
 
     def lock(self, dag_node):
         if probe := self.probe(dag_node):
@@ -124,11 +146,30 @@ class PatchGraphNode():
         else:
             self.orientation = self.Z_ORIENTED
 
+class LockMask():
+    '''
+        Patches that fail a lock probe for a gate, indexed on coordinates
+    '''
+    __slots__ = ('graph', 'gate')
+
+    def __init__(self, graph, gate):
+        self.graph = graph
+        self.gate = gate
+
+    def __getitem__(self, coordinates):
+        return not self.graph.probe(coordinates[0], coordinates[1], self.gate)
+
 class PatchGraph():
+    '''
+        Struct of arrays model of the routing patches
+        States and lock owners are stored as indices into tables of the underlying objects
+    '''
 
     NO_PATH_FOUND = object()
+    ROUTE = 0 # Index of SCPatch.ROUTE in the state table
+    LOCK_HELD = float('inf')
 
-    def __init__(self, shape, mapper, environment, default_orientation=PatchGraphNode.X_ORIENTED, verbose=False):
+    def __init__(self, shape, mapper, environment, default_orientation=PatchGraphNode.X_ORIENTED, verbose=False, distance_heuristic=False, route_cache_size=0, max_expansions=None):
         self.shape = shape
         self.environment = environment
         self.mapper = mapper
@@ -136,11 +177,61 @@ class PatchGraph():
 
         self.verbose = verbose
 
-        self.graph = np.array(
-                    [[PatchGraphNode(self, i, j, orientation=self.default_orientation, verbose=self.verbose) 
-                      for j in range(shape[1])] 
-                      for i in range(shape[0])
-                ])
+        # States are indexed by object identity
+        self.state_table = [SCPatch.ROUTE]
+        self.state_ids = {id(SCPatch.ROUTE): self.ROUTE}
+        self.states = np.full(shape, self.ROUTE, dtype=np.int32)
+        self.ancillae_states = np.full(shape, True, dtype=bool)
+
+        self.orientations = np.full(shape, PatchGraphNode.ORIENTATIONS.index(default_orientation), dtype=np.int8)
+
+        # Lock owners are indexed by object identity, the table holds a reference so ids are not reused
+        self.lock_owners = [PatchGraphNode.INITIAL_LOCK_STATE]
+        self.lock_owner_ids = {id(PatchGraphNode.INITIAL_LOCK_STATE): 0}
+        self.locks = np.zeros(shape, dtype=np.int32)
+
+        # Each lock owner maps to a gate id, owners bound to the same DAG node share a gate id
+        # Locks are held until the generation of their gate reaches its expiry
+        self.generation = 0
+        self.lock_gates = [0]
+        self.gate_ids = {id(PatchGraphNode.INITIAL_LOCK_STATE): 0}
+        self.gate_expiry = [-1]
+
+        self.last_used = np.full(shape, -1, dtype=np.int64)
+
+        # Least recently used cache keyed on endpoints and orientations
+        # Each entry holds the length of the shortest route ignoring locks and the last route found with that length
+        self.route_cache_size = route_cache_size
+        self.route_cache = OrderedDict()
+        self.route_cache_hits = 0
+        self.route_cache_misses = 0
+
+        # Searches that expand more than this many patches are abandoned while other gates hold locks
+        self.max_expansions = max_expansions
+        self.routes_abandoned = 0
+
+        # Negotiated congestion costs, only set while a negotiation pass is running
+        self.history_costs = None
+        self.present_costs = None
+        self.present_factor = 1
+
+        # Built once patch states are fixed
+        self.adjacency = None
+
+        # Exact distances over the static route network, built per target on first use
+        self.distance_heuristic = distance_heuristic
+        self.distance_fields = dict()
+        self.reverse_adjacency = None
+        if shape[0] * shape[1] < np.iinfo(np.uint16).max:
+            self.distance_dtype = np.uint16
+        else:
+            self.distance_dtype = np.uint32
+        self.UNREACHABLE = np.iinfo(self.distance_dtype).max
+
+        self.graph = np.empty(shape, dtype=object)
+        for i in range(shape[0]):
+            for j in range(shape[1]):
+                self.graph[i, j] = PatchGraphNode(self, i, j, verbose=self.verbose)
 
         for segment in self.mapper.map.values():
             for coordinates in segment.range():
@@ -168,16 +259,163 @@ class PatchGraph():
                     uncleared_patches.append(local_patch)
             local_patches = uncleared_patches
 
+        # Patch states are now fixed, adjacency is tabulated for each combination of bound, horizontal and vertical
+        self.coordinate_adjacency = {
+            (bound, horizontal, vertical): [
+                [tuple(self.adjacent_coordinates(i, j, bound, horizontal, vertical)) for j in range(shape[1])]
+                for i in range(shape[0])]
+            for bound in (True, False) for horizontal in (True, False) for vertical in (True, False)
+        }
+        self.adjacency = {
+            key: [[tuple(self.graph[coordinates] for coordinates in neighbours) for neighbours in row] for row in table]
+            for key, table in self.coordinate_adjacency.items()
+        }
+
+        # Searches run over coordinates and these arrays
+        self.route_mask = self.states == self.ROUTE
+        self.unlocked = np.zeros(shape, dtype=bool)
+
     def debug_print(self, *args, **kwargs):
         debug_print(*args, **kwargs, debug=self.verbose)
 
-
     def __getitem__(self, coords):
         return self.graph.__getitem__(tuple(coords))
 
+    def set_state(self, i, j, state):
+        state_id = self.state_ids.get(id(state), None)
+        if state_id is None:
+            state_id = self.state_ids[id(state)] = len(self.state_table)
+            self.state_table.append(state)
+        self.states[i, j] = state_id
+        self.ancillae_states[i, j] = state in PatchGraphNode.ANCILLAE_STATES
+
+    def lock_owner(self, lock_state):
+        '''
+            Index of a lock owner
+        '''
+        owner = self.lock_owner_ids.get(id(lock_state), None)
+        if owner is None:
+            owner = self.lock_owner_ids[id(lock_state)] = len(self.lock_owners)
+            self.lock_owners.append(lock_state)
+            self.lock_gates.append(self.gate_id(lock_state))
+        return owner
+
+    def gate_id(self, gate, create=True):
+        '''
+            Integer id of a gate, route bindings of the same DAG node share an id 
+            Without create, gates that have not been seen have an id of -1
+        '''
+        if isinstance(gate, RouteBind):
+            gate = gate.obj
+        idx = self.gate_ids.get(id(gate), None)
+        if idx is None:
+            if not create:
+                return -1
+            idx = self.gate_ids[id(gate)] = len(self.gate_expiry)
+            self.gate_expiry.append(-1)
+        return idx
+
+    def hold_locks(self, gate):
+        '''
+            Locks held by this gate are not released until an expiry is set
+        '''
+        self.gate_expiry[self.gate_id(gate)] = self.LOCK_HELD
+
+    def release_locks(self, gate, generation):
+        '''
+            Locks held by this gate are released once the graph reaches this generation
+        '''
+        self.gate_expiry[self.gate_id(gate)] = generation
+
     def active_gates(self):
         return self.environment.active_gates
 
+    def locks_held(self):
+        '''
+            Checks if any gate is currently holding locks
+        '''
+        return self.environment is not None and len(self.environment.active_gates) > 0
+
+    def probe(self, i, j, lock_request, unique=False):
+        owner = self.locks[i, j]
+        # Locks are owned by the DAG node, not the binding that took them
+        if self.lock_gates[owner] == self.gate_id(lock_request, create=False):
+            return not unique
+        # Gate has completed and is no longer active
+        return self.gate_expiry[self.lock_gates[owner]] <= self.generation
+
+    def cost(self, i, j):
+        '''
+            Cost of routing through a patch
+            During negotiation patches are penalised by their history of congestion and the number of routes currently using them
+        '''
+        if self.history_costs is None:
+            return 1
+        return (1 + self.history_costs[i, j]) * (1 + self.present_factor * self.present_costs[i, j])
+
+    def costs(self):
+        '''
+            Cost of routing through each patch, None while every patch costs one
+        '''
+        if self.history_costs is None:
+            return None
+        return (1 + self.history_costs) * (1 + self.present_factor * self.present_costs)
+
+    def start_negotiation(self):
+        self.history_costs = np.zeros(self.shape, dtype=np.float64)
+        self.present_costs = np.zeros(self.shape, dtype=np.int32)
+        self.present_factor = 1
+
+    def end_negotiation(self):
+        self.history_costs = None
+        self.present_costs = None
+        self.present_factor = 1
+
+    def occupy(self, patches, n_routes=1):
+        '''
+            Adds or removes a route from the present congestion costs
+        '''
+        for patch in patches:
+            self.present_costs[patch.y, patch.x] += n_routes
+
+    def free_cycle(self, i, j, lock_request):
+        '''
+            Generation from which a patch is free for this lock request
+            The lock table acts as a reservation table, each patch is held by a single gate until the expiry of that gate
+        '''
+        owner = self.locks[i, j]
+        if self.lock_gates[owner] == self.gate_id(lock_request, create=False):
+            return self.generation
+        return max(self.generation, self.gate_expiry[self.lock_gates[owner]])
+
+    def adjacent_coordinates(self, i, j, bound, horizontal, vertical):
+        '''
+            Coordinates of adjacent patches from the underlying patch states
+        '''
+        opt = []
+        states = self.states
+        route = self.ROUTE
+
+        is_route = states[i, j] == route
+        if horizontal and (not bound or is_route):
+            if j + 1 < self.shape[1]:
+                if states[i, j + 1] == route:
+                    opt.append((i, j + 1))
+
+            if j - 1 >= 0:
+                if states[i, j - 1] == route:
+                    opt.append((i, j - 1))
+          
+        if vertical:
+            if i + 1 < self.shape[0]:
+                if is_route or states[i + 1, j] == route:
+                    opt.append((i + 1, j))
+
+            if i - 1 >= 0:
+                if is_route or states[i - 1, j] == route:
+                    opt.append((i - 1, j)) 
+        return opt
+
     def adjacent(self, i, j, gate, 
                  bound=True, # Not constrained by initial graph node state
                  horizontal=True, # Checks horizonal
@@ -185,8 +423,6 @@ class PatchGraph():
                  probe=True, # Probes for locking 
                  orientation=None # Constrains on orientation
                  ):
-        opt = []
-
         if orientation is not None:
             if orientation == self.graph[i, j].orientation:
                 horizontal = False
@@ -195,77 +431,185 @@ class PatchGraph():
                 vertical = False
                 bound = False
 
-        if horizontal and (not bound or self.graph[i, j].state is SCPatch.ROUTE):
-            if j + 1 < self.shape[1]:
-                if (self.graph[i, j + 1].state is SCPatch.ROUTE):
-                    opt.append([i, j + 1])
-
-            if j - 1 >= 0:
-                if (self.graph[i, j - 1].state is SCPatch.ROUTE):
-                    opt.append([i, j - 1])
-          
-        if vertical:
-            if i + 1 < self.shape[0]:
-                if (self.graph[i, j].state is SCPatch.ROUTE) or (self.graph[i + 1, j].state is SCPatch.ROUTE):
-                    opt.append([i + 1, j])
+        if self.adjacency is None:
+            # Patch states may still change while the graph is being built
+            neighbours = (self.graph[coordinates] for coordinates in self.adjacent_coordinates(i, j, bound, horizontal, vertical))
+        else:
+            neighbours = self.adjacency[bound, horizontal, vertical][i][j]
 
-            if i - 1 >= 0:
-                if (self.graph[i, j].state is SCPatch.ROUTE) or (self.graph[i - 1, j].state is SCPatch.ROUTE):
-                    opt.append([i - 1, j]) 
-        for i in opt:
+        for neighbour in neighbours:
             # Return without worrying about locks
-            if probe is False:
-                yield self[tuple(i)]
-            elif self[tuple(i)].probe(gate):
-                yield self[tuple(i)]
+            if probe is False or self.probe(neighbour.y, neighbour.x, gate):
+                yield neighbour
         return
    
-    def route(self, start, end, gate, heuristic=None, track_rotations=True, start_orientation=None, end_orientation=None):
-        
-        if heuristic is None:
-            heuristic = self.heuristic
+    def route(self, start, end, gate, heuristic=None, track_rotations=True, start_orientation=None, end_orientation=None, probe=True):
+        '''
+            Routes between two patches
+            Cached routes are reused if every patch on them is free, otherwise falls back to A*
+            Only routes that are shortest over the unlocked graph are cached
+        '''
+        if self.route_cache_size == 0 or heuristic is not None or self.history_costs is not None or not probe:
+            return self.a_star(start, end, gate, heuristic=heuristic, track_rotations=track_rotations, start_orientation=start_orientation, probe=probe)
+
+        if not track_rotations:
+            start_orientation = None
+        key = (start.y, start.x, end.y, end.x, start.orientation, start_orientation)
+
+        shortest, cached_path = self.route_cache.get(key, (None, None))
+        if cached_path is not None:
+            if all(self.probe(node.y, node.x, gate) for node in cached_path[1:]):
+                self.route_cache.move_to_end(key)
+                self.route_cache_hits += 1
+                return list(cached_path)
+        self.route_cache_misses += 1
+
+        path = self.a_star(start, end, gate, start_orientation=start_orientation)
+        if path is self.NO_PATH_FOUND:
+            return path
+
+        if shortest is None:
+            shortest = len(self.a_star(start, end, gate, start_orientation=start_orientation, probe=False))
+
+        if len(path) == shortest:
+            cached_path = tuple(path)
+
+        # Lengths are evicted along with their routes
+        self.route_cache[key] = (shortest, cached_path)
+        self.route_cache.move_to_end(key)
+        if len(self.route_cache) > self.route_cache_size:
+            self.route_cache.popitem(last=False)
+        return path
+
+    def a_star(self, start, end, gate, heuristic=None, track_rotations=True, start_orientation=None, probe=True):
+        '''
+            A* search between two patches
+            Ties on the frontier are broken by insertion order and each patch is expanded at most once
+        '''
+        end_coordinates = (end.y, end.x)
+        if heuristic is not None:
+            estimate = lambda coordinates: heuristic(self.graph[coordinates], end)
+        elif self.distance_heuristic:
+            estimate = field_heuristic(self.distance_field(end), self.UNREACHABLE)
+        else:
+            estimate = lambda coordinates: manhattan(coordinates, end_coordinates)
 
-        frontier = queue.PriorityQueue()
-        frontier.put((0, start))
-        
-        path = {}
-        path_cost = {}
-        path[start] = None
-        path_cost[start] = 0
-
-        orientation = None
-        while not frontier.empty():
-            current = frontier.get()[1]
+        # No path over the static route network
+        if estimate((start.y, start.x)) == float('inf'):
+            return self.NO_PATH_FOUND
+
+        # Long detours are abandoned and the gate waits for locks to be released instead
+        # If no other gate holds locks then waiting cannot help and the search is not bounded
+        max_expansions = None
+        if probe and self.max_expansions is not None and self.locks_held():
+            max_expansions = self.max_expansions
+
+        if not track_rotations or start_orientation is None:
+            orientation = None
+        else:
+            orientation = PatchGraphNode.ORIENTATIONS.index(start_orientation)
+
+        path = a_star(
+            (start.y, start.x), end_coordinates, self.coordinate_adjacency, self.route_mask, self.orientations,
+            LockMask(self, gate) if probe else self.unlocked,
+            estimate,
+            costs=self.costs(),
+            start_orientation=orientation,
+            max_expansions=max_expansions
+        )
+        if path is ABANDONED:
+            self.routes_abandoned += 1
+            return self.NO_PATH_FOUND
+        if path is None:
+            return self.NO_PATH_FOUND
+        return [self.graph[coordinates] for coordinates in path]
+
+    def earliest_route(self, start, end, gate, start_orientation=None):
+        '''
+            Space-time search between two patches over the lock table
+            A path is free once every patch on it is free, so the search minimises the latest free generation along the path
+            Returns the generation from which the path is free and the path, or infinity if no path exists
+        '''
+        tie_breaker = count()
+        frontier = [(self.generation, 0, next(tie_breaker), start)]
+
+        path = {start: None}
+        path_cost = {start: (self.generation, 0)}
+        closed = set()
+
+        while len(frontier) > 0:
+            free, length, _, current = heappop(frontier)
             if current == end:
                 break
+            if current in closed:
+                continue
+            closed.add(current)
 
             # Correct join at the start
-            if track_rotations and current == start:
-                orientation = start_orientation
-            debug_print(current, gate, orientation, current.adjacent(gate, orientation=orientation) , debug=self.verbose)
-            for i in current.adjacent(gate, orientation=orientation):
-                # Correct join at the end
-                #if track_rotations and i == end:
-                #    if current not in end.adjacent(gate, orientation=end_orientation):
-                #        continue
+            orientation = start_orientation if current == start else None
+            for i in current.adjacent(gate, orientation=orientation, probe=False):
+                if i in closed:
+                    continue
                 if (i == end and current != start) or i.state == SCPatch.ROUTE:
-                    cost = path_cost[current] + i.cost()
+                    cost = (max(free, self.free_cycle(i.y, i.x, gate)), length + i.cost())
+                    if cost[0] == float('inf'):
+                        continue
                     if i not in path_cost or cost < path_cost[i]:
                         path_cost[i] = cost
-                        frontier.put((cost + heuristic(i, end), i))
+                        heappush(frontier, (*cost, next(tie_breaker), i))
                         path[i] = current
-            if current == start:
-                orientation = None
         else:
-            return self.NO_PATH_FOUND
+            return float('inf'), self.NO_PATH_FOUND
+
+        final_route = [end]
+        while (end := path[end]) is not None:
+            final_route.append(end)
+        final_route.reverse()
+        return free, final_route
+
+    def steiner_route(self, terminals, gate):
+        '''
+            Approximate Steiner tree connecting a set of terminal patches
+            The tree is grown from the first terminal, each search runs from every patch in the tree to the nearest unconnected terminal
+            Joins from terminals are constrained by their orientations
+            Returns each branch of the tree from the patch it joins on to the terminal it connects
+        '''
+        orientations = dict(terminals)
+        root = terminals[0][0]
+        tree = [root]
+        remaining = set(orientations) - {root}
+
+        final_route = []
+        while len(remaining) > 0:
+            path = {node: None for node in tree}
+            frontier = deque(tree)
+            while len(frontier) > 0:
+                current = frontier.popleft()
+                if current in remaining:
+                    break
+                is_terminal = current in orientations
+                debug_print(current, gate, debug=self.verbose)
+                for i in current.adjacent(gate, orientation=orientations.get(current, None)):
+                    if i in path:
+                        continue
+                    if (i in remaining and not is_terminal) or i.state == SCPatch.ROUTE:
+                        path[i] = current
+                        frontier.append(i)
+            else:
+                return self.NO_PATH_FOUND
+
+            remaining.remove(current)
+            branch = [current]
+            while path[current] is not None:
+                current = path[current]
+                branch.append(current)
+            branch.reverse()
+            tree += branch[1:]
+            final_route += branch
 
-        def traverse(path, end):
-            next_end = path[end]
-            if next_end is not None:
-                return [next_end] + traverse(path, next_end)
-            return []
-        final_route = traverse(path, end)[::-1] + [end]
-        return final_route 
+        if len(final_route) == 0:
+            return [root]
+        return final_route
 
     def ancillae(self, gate, start, n_ancillae):
         # Currently supports a single ancillae
@@ -327,7 +671,22 @@ class PatchGraph():
 
     @staticmethod
     def heuristic(a, b, bias = 1 + 1e-7):
-        return abs(a.x - b.x) + bias * abs(a.y - b.y)
+        return manhattan((a.y, a.x), (b.y, b.x), bias)
+
+    def distance(self, a, b, bias = 1 + 1e-7):
+        '''
+            Distance from a to b over the static route network, ignoring locks
+            The bias breaks ties between equal length paths towards b
+        '''
+        return field_heuristic(self.distance_field(b), self.UNREACHABLE, bias)((a.y, a.x))
+
+    def distance_field(self, end):
+        field = self.distance_fields.get(end, None)
+        if field is None:
+            if self.reverse_adjacency is None:
+                self.reverse_adjacency = reverse_adjacency(self.coordinate_adjacency, self.shape)
+            field = self.distance_fields[end] = distance_field((end.y, end.x), self.reverse_adjacency, self.route_mask, self.distance_dtype)
+        return field
 
     def __tikz__(self):
         return tikz_patch_graph(self)
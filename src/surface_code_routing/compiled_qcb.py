@@ -1,4 +1,5 @@
 import copy
+import time
 from surface_code_routing.symbol import symbol_resolve
 from surface_code_routing.scope import Scope
 from surface_code_routing.instructions import RESET, MOVE
@@ -13,6 +14,7 @@ from surface_code_routing.mapper import QCBMapper
 
 from surface_code_routing.circuit_model import PatchGraph
 from surface_code_routing.inject_rotations import RotationInjector
+from surface_code_routing.checkpoint import CheckpointError
 
 def compile_qcb(dag, height, width, 
                 *externs, 
@@ -25,8 +27,16 @@ def compile_qcb(dag, height, width,
                 mapper_kwargs = None,
                 patch_graph_kwargs = None,
                 router_kwargs = None,
-                compiled_qcb_kwargs = None
+                compiled_qcb_kwargs = None,
+                time_budget = None
                 ):
+    '''
+        A time budget in seconds bounds allocator optimisation and routing
+        Routing raises BudgetExceeded with the partial router if it runs past the budget
+    '''
+    deadline = None
+    if time_budget is not None:
+        deadline = time.time() + time_budget
 
     if verbose:
         print(f"Compiling {dag}")
@@ -36,9 +46,52 @@ def compile_qcb(dag, height, width,
 
     if verbose:
         print(f"\tAllocating QCB...")
-    allocator = Allocator(qcb, *externs, tikz_build=True, verbose=verbose)
+    allocator = Allocator(qcb, *externs, tikz_build=True, verbose=verbose, deadline=deadline)
     qcb.allocator = allocator
 
+    if router_kwargs is None:
+        router_kwargs = dict()
+    routing_kwargs = router_kwargs
+    if deadline is not None and 'deadline' not in router_kwargs:
+        routing_kwargs = {'deadline':deadline, **router_kwargs}
+    router = route_qcb(qcb, dag, 
+                       verbose=verbose, 
+                       extern_allocation_method=extern_allocation_method, 
+                       mapper_kwargs=mapper_kwargs, 
+                       patch_graph_kwargs=patch_graph_kwargs, 
+                       router_kwargs=routing_kwargs)
+
+    if compiled_qcb_kwargs is None:
+        compiled_qcb_kwargs = dict()
+    compiled_qcb = CompiledQCB(qcb, router, dag, **compiled_qcb_kwargs)
+
+    # Retained for incremental recompilation
+    compiled_qcb.compile_arguments = (height, width, externs, {
+        'verbose':verbose,
+        'extern_allocation_method':extern_allocation_method,
+        'mapper_kwargs':mapper_kwargs,
+        'patch_graph_kwargs':patch_graph_kwargs,
+        'router_kwargs':router_kwargs,
+        'compiled_qcb_kwargs':compiled_qcb_kwargs,
+        'time_budget':time_budget
+        })
+    return compiled_qcb
+
+def route_qcb(qcb, dag, verbose=False, extern_allocation_method='dynamic', mapper_kwargs=None, patch_graph_kwargs=None, router_kwargs=None):
+    '''
+        Maps and routes a DAG over an allocated QCB
+    '''
+    mapper, circuit_model = map_qcb(qcb, dag, verbose=verbose, extern_allocation_method=extern_allocation_method, mapper_kwargs=mapper_kwargs, patch_graph_kwargs=patch_graph_kwargs)
+
+    if router_kwargs is None:
+        router_kwargs = dict()
+    return QCBRouter(qcb, dag, mapper, graph=circuit_model, verbose=verbose, **router_kwargs)
+
+def map_qcb(qcb, dag, verbose=False, extern_allocation_method='dynamic', mapper_kwargs=None, patch_graph_kwargs=None, inject_rotations=True):
+    '''
+        Maps a DAG over an allocated QCB and injects the rotations it needs
+        DAGs that have already been mapped over this QCB should not have their rotations injected again
+    '''
     if verbose:
         print(f"\tConstructing Mapping")
     graph = QCBGraph(qcb)
@@ -53,17 +106,125 @@ def compile_qcb(dag, height, width,
 
     if verbose:
         print(f"\tRouting...")
-    circuit_model = PatchGraph(qcb.shape, mapper, None)
-    rot_injector = RotationInjector(dag, mapper, qcb, graph=circuit_model, verbose=verbose)
+    if patch_graph_kwargs is None:
+        patch_graph_kwargs = dict()
+    circuit_model = PatchGraph(qcb.shape, mapper, None, **patch_graph_kwargs)
+    if inject_rotations:
+        rot_injector = RotationInjector(dag, mapper, qcb, graph=circuit_model, verbose=verbose)
+    return mapper, circuit_model
+
+def recompile_qcb(compiled_qcb, dag):
+    '''
+        Recompiles an edited DAG using the arguments of a previous compilation
+        If the register set is unchanged then the allocated layout is reused
+        Routing then resumes from the latest snapshot of the previous routing that precedes the first cycle affected by the edit
+        Snapshots are only held if the previous compilation set a snapshot_interval in its router_kwargs
+    '''
+    height, width, externs, kwargs = compiled_qcb.compile_arguments
+    previous_dag = compiled_qcb.dag
+    if register_set(dag) != register_set(previous_dag):
+        return compile_qcb(dag, height, width, *externs, **kwargs)
+
+    verbose = kwargs['verbose']
+    if verbose:
+        print(f"Recompiling {dag}")
 
+    # The layout is shared with the previous QCB
+    qcb = copy.copy(compiled_qcb.qcb)
+    qcb.operations = dag
+    qcb.symbol = dag.get_symbol()
+    qcb.predicate = qcb.symbol.predicate
+    qcb.externs = dag.externs
+    qcb.io = {key:index for key, index in dag.io().items()}
+    allocator = qcb.allocator
+    # The estimate is discarded, this is only needed to bind the externs of the DAG to those of the allocator
+    dag.compile(allocator.n_channels, *allocator.externs, count_only=True)
+
+    map_kwargs = {key:copy.copy(kwargs[key]) for key in ('verbose', 'extern_allocation_method', 'mapper_kwargs', 'patch_graph_kwargs')}
+    router_kwargs = copy.copy(kwargs['router_kwargs'])
     if router_kwargs is None:
         router_kwargs = dict()
-    router = QCBRouter(qcb, dag, mapper, graph=circuit_model, verbose=verbose, **router_kwargs)
+    router_kwargs.pop('resume', None)
+    if kwargs['time_budget'] is not None and 'deadline' not in router_kwargs:
+        router_kwargs['deadline'] = time.time() + kwargs['time_budget']
 
-    if compiled_qcb_kwargs is None:
-        compiled_qcb_kwargs = dict()
-    compiled_qcb = CompiledQCB(qcb, router, dag, **compiled_qcb_kwargs)
-    return compiled_qcb
+    # Rotations are injected before the DAGs are compared, the previous DAG holds its injected rotations
+    mapper, circuit_model = map_qcb(qcb, dag, **map_kwargs)
+    snapshot = resume_snapshot(compiled_qcb.router, previous_dag, dag)
+    router = None
+    if snapshot is not None:
+        try:
+            router = QCBRouter(qcb, dag, mapper, graph=circuit_model, verbose=verbose, resume=snapshot, **router_kwargs)
+        except CheckpointError:
+            # Layout of registers or externs differs from the previous compilation
+            # The partially restored mapping is rebuilt, rotations are already in the DAG
+            mapper, circuit_model = map_qcb(qcb, dag, inject_rotations=False, **map_kwargs)
+    if router is None:
+        router = QCBRouter(qcb, dag, mapper, graph=circuit_model, verbose=verbose, **router_kwargs)
+
+    compiled_qcb_kwargs = kwargs['compiled_qcb_kwargs']
+    recompiled_qcb = CompiledQCB(qcb, router, dag, **compiled_qcb_kwargs)
+    recompiled_qcb.compile_arguments = compiled_qcb.compile_arguments
+    return recompiled_qcb
+
+def register_set(dag):
+    return set(symbol for symbol in dag.internal_scope() if not symbol.is_extern()), set(dag.io())
+
+def first_edited_gate(previous_dag, dag):
+    '''
+        Index of the first gate that differs between two DAGs
+        Gates are compared on their representation, number of cycles and the indices of their predicates
+        Both DAGs should have had their rotations injected
+    '''
+    previous_indices = {id(gate):idx for idx, gate in enumerate(previous_dag.gates)}
+    indices = {id(gate):idx for idx, gate in enumerate(dag.gates)}
+    signature = lambda gate, indices: (repr(gate), gate.n_cycles(), sorted(indices.get(id(predicate), -1) for predicate in gate.predicates))
+    for idx, (previous_gate, gate) in enumerate(zip(previous_dag.gates, dag.gates)):
+        if signature(previous_gate, previous_indices) != signature(gate, indices):
+            return idx
+    return min(len(previous_dag.gates), len(dag.gates))
+
+def resume_snapshot(router, previous_dag, dag):
+    '''
+        Latest snapshot of a router that is not affected by edits to its DAG
+        An edited gate may first be routed once all of its unedited predicates have resolved in the previous routing
+    '''
+    if len(router.snapshots) == 0:
+        return None
+    edited = first_edited_gate(previous_dag, dag)
+
+    # Cycle in which each DAG node resolved
+    resolved_cycle = dict()
+    for gate, start, end, _ in router.layers.intervals():
+        resolved_cycle[id(gate.obj)] = max(end, resolved_cycle.get(id(gate.obj), 0))
+
+    # Unedited gates of each DAG mapped to the previous DAG
+    previous_unedited = {id(gate): gate for gate in previous_dag.gates[:edited]}
+    unedited = {id(gate): previous_gate for gate, previous_gate in zip(dag.gates[:edited], previous_dag.gates)}
+
+    def resolved_cycles(predicates, unedited):
+        return [resolved_cycle.get(id(unedited[id(predicate)]), 0) for predicate in predicates if id(predicate) in unedited]
+
+    def ready_cycle(gate, unedited):
+        if gate.is_factory() and len(gate.predicates) == 0:
+            # Factories are queued once any predicate of a gate that consumes them has resolved
+            return min((min(resolved_cycles(antecedent.predicates, unedited), default=float('inf')) for antecedent in gate.antecedents), default=0)
+        if len(gate.predicates) == 0:
+            return 0
+        # Gates with only edited predicates are bounded by those predicates
+        return max(resolved_cycles(gate.predicates, unedited), default=float('inf'))
+
+    affected_cycle = float('inf')
+    for gate in previous_dag.gates[edited:]:
+        affected_cycle = min(affected_cycle, ready_cycle(gate, previous_unedited))
+    for gate in dag.gates[edited:]:
+        affected_cycle = min(affected_cycle, ready_cycle(gate, unedited))
+
+    for cycle, snapshot in reversed(router.snapshots):
+        state, _ = snapshot
+        if cycle < affected_cycle and state['max_gate'] < edited:
+            return snapshot
+    return None
 
 class CompiledQCB:
     def __init__(self, qcb, router, dag, readin_operation=MOVE, readout_operation=MOVE):
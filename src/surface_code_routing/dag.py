@@ -1,18 +1,12 @@
 import numpy as np
-from heapq import heappush
+from heapq import heappush, heappop
 
-from itertools import chain
+from itertools import chain, count
 from functools import reduce
 
-import sys
-
 from surface_code_routing import utils
 
 
-# This gets triggered by deep copy in some areas
-sys.setrecursionlimit(10000)
-
-
 class DAGNode():
     def __init__(self, symbol, *args, scope=None, externs=None, n_cycles=1, n_ancillae=0, rotation=False, ancillae_type=None):
         symbol = symbol_resolve(symbol)
@@ -154,6 +148,9 @@ class DAG(DAGNode):
         self.layer = 0
         self.slack = float('inf')
 
+        # Array backed copy of the gates and their dependencies, built on first use
+        self.__core = None
+
         for obj in self.scope:
             if self.scope[obj] is None:
                 init_gate = INIT(obj)
@@ -213,45 +210,87 @@ class DAG(DAGNode):
         return gate
                     
     def unroll_gate(self, dag):
-        for gate in dag.gates:
-            if isinstance(gate, DAG):
-                self.unroll_gate(gate)
+        '''
+            Flattens nested DAGs and adds their gates in a single pass
+        '''
+        gates = self.flatten(dag)
+        self.gates.extend(gates)
+        self.merge_scopes(*gates)
+        self.update_dependencies(*gates)
+
+    @staticmethod
+    def flatten(dag):
+        '''
+            Gates of a DAG with nested DAGs expanded in place
+            Nested DAGs are walked with an explicit stack rather than by recursion
+        '''
+        gates = []
+        stack = [iter(dag.gates)]
+        while len(stack) > 0:
+            for gate in stack[-1]:
+                if isinstance(gate, DAG):
+                    stack.append(iter(gate.gates))
+                    break
+                gates.append(gate)
             else:
-                self.gates.append(gate)
-                self.merge_scopes(gate)                
-                self.update_dependencies(gate)
-
-    def merge_scopes(self, gate):
-        for element in gate.symbol.io:
-            if element not in self.scope:
-                # Merge lower scope into higher
-                self.scope[element] = gate
-            if element not in self.last_layer:
-                self.last_layer[element] = gate
+                stack.pop()
+        return gates
+
+    def __deepcopy__(self, memo):
+        '''
+            Copies gates by index rather than along their edges
+            Every gate is registered in the memo before any are filled, so edges resolve to the registered copies
+        '''
+        dag = type(self).__new__(type(self))
+        memo[id(self)] = dag
+
+        gates = [gate for gate in self.flatten(self) if id(gate) not in memo]
+        for gate in gates:
+            memo[id(gate)] = type(gate).__new__(type(gate))
+        for gate in gates:
+            memo[id(gate)].__dict__.update(copy.deepcopy(gate.__dict__, memo))
+
+        dag.__dict__.update(copy.deepcopy(self.__dict__, memo))
+        return dag
+
+    def merge_scopes(self, *gates):
+        scope = self.scope
+        last_layer = self.last_layer
+        for gate in gates:
+            for element in gate.symbol.io:
+                if element not in scope:
+                    # Merge lower scope into higher
+                    scope[element] = gate
+                if element not in last_layer:
+                    last_layer[element] = gate
         return
 
-    def update_dependencies(self, gate):
-        for dep in gate.symbol.io:
-            predicate = self.last_layer[dep]
-            gate.back_edges[dep] = predicate
-            predicate.forward_edges[dep] = gate
-            # Breaks self-referencing gates
-            if predicate is not gate:
-                predicate.antecedents.add(gate)
-                gate.predicates.add(predicate)
-                self.last_layer[dep] = gate
-
-        self.update_layer(gate)
-
-        # Propagate factories till non_local operation
-        for dep in gate.predicates:
-            if not dep.non_local() and not dep.is_factory():
-                gate.predicate_factories |= dep.predicate_factories
-            if dep.is_factory():
-               gate.predicate_factories.add(dep)
-        # Non-local gates implies more than zero predicates
-        if len(gate.predicates) > 0 and gate.non_local() and all(map(lambda x: (not x.non_local()) and (len(x.predicate_factories) > 0), gate.predicates)):
-            raise Exception("Cannot Depend on multiple externs directly, wrap the extern dependencies within the original extern, or introduce a register within the current scope")
+    def update_dependencies(self, *gates):
+        last_layer = self.last_layer
+        for gate in gates:
+            for dep in gate.symbol.io:
+                predicate = last_layer[dep]
+                gate.back_edges[dep] = predicate
+                predicate.forward_edges[dep] = gate
+                # Breaks self-referencing gates
+                if predicate is not gate:
+                    predicate.antecedents.add(gate)
+                    gate.predicates.add(predicate)
+                    last_layer[dep] = gate
+
+            if self.__core is not None:
+                self.__core.add(gate)
+            self.update_layer(gate)
+
+            # Propagate factories till non_local operation
+            for dep in gate.predicates:
+                if not dep.non_local() and not dep.is_factory():
+                    gate.predicate_factories |= dep.predicate_factories
+                if dep.is_factory():
+                   gate.predicate_factories.add(dep)
+            # Non-local gates implies more than zero predicates
+            if len(gate.predicates) > 0 and gate.non_local() and all(map(lambda x: (not x.non_local()) and (len(x.predicate_factories) > 0), gate.predicates)):
+                raise Exception("Cannot Depend on multiple externs directly, wrap the extern dependencies within the original extern, or introduce a register within the current scope")
 
         return
         
@@ -267,8 +306,37 @@ class DAG(DAGNode):
         # Update slack on predicates
         for predicate in gate.predicates:
             predicate.slack = min(predicate.slack, gate.layer - predicate.layer)
+
+        core = self.__core
+        if core is not None:
+            index = core.get(gate)
+            if index is not None:
+                core.layer[index] = layer_num
+            for predicate in gate.predicates:
+                index = core.get(predicate)
+                if index is not None:
+                    core.slack[index] = predicate.slack
         return
 
+    @property
+    def core(self):
+        '''
+            Array backed copy of the gates of this DAG
+            Nested DAGs are unrolled before they are used, so the core is only built once it is requested
+            It is then kept current as gates are added
+        '''
+        if self.__core is None:
+            self.__core = DAGCore()
+            self.__core.rebuild(self.gates)
+        return self.__core
+
+    def invalidate_core(self):
+        '''
+            Drops the array backed core after gates have been rewired in place
+            It is rebuilt the next time it is requested
+        '''
+        self.__core = None
+
     def inject(self, scope):
         for gate in self.gates:
             gate.inject(scope)
@@ -276,59 +344,96 @@ class DAG(DAGNode):
         self.symbol.inject(scope)
         return
 
-    def calculate_logical_proximity(self):
-        prox_len = len(self.scope)
-        prox = np.zeros((prox_len, prox_len))
-        lookup = dict(map(lambda x: x[::-1], enumerate(self.scope.keys())))
-
-        for layer in self.layers:
-            for gate in layer:
-                for targ in gate.scope:                            
-                    for other_targ in gate.scope:
-                        if other_targ is not targ:
-                            prox[lookup[targ], lookup[other_targ]] += 1
-        return prox, lookup
-
-    def calculate_logical_conjestion(self):
-        conj_len = len(self.scope)
-        conj = np.zeros((conj_len, conj_len))
-        lookup = dict(map(lambda x: x[::-1], enumerate(self.scope.keys()))) 
-
-        for layer in self.layers:
+    def operand_incidence(self, lookup, resolve=None):
+        '''
+            Incidence of the operands of each gate in each layer
+            Operands are mapped to columns by the lookup, resolve maps an operand to its key in the lookup
+            Each operand symbol is resolved once
+            Returns arrays of the occurrence, layer, gate and column of each entry and the number of operands of the occurring gate
+        '''
+        occurrences, layer_ids, gate_ids, columns, n_operands = [], [], [], [], []
+        operand_columns = dict()
+        gate_indices = dict()
+        occurrence = 0
+        for layer_num, layer in enumerate(self.layers):
             for gate in layer:
-                if len(gate.scope) > 1:
-                    for other_gate in layer:
-                        if gate is not other_gate and len(other_gate.scope) > 1:
-                            for targ in gate.scope:                            
-                                for other_targ in other_gate.scope:
-                                    conj[lookup[targ], lookup[other_targ]] += 1
-        return conj, lookup
-
-
-    def calculate_physical_conjestion(self):
-        conj_len = len(self.internal_scope()) + len(self.physical_externs)
-        conj = np.zeros((conj_len, conj_len))
-
+                gate_index = gate_indices.setdefault(id(gate), len(gate_indices))
+                scope_size = len(gate.scope)
+                for targ in gate.scope:
+                    column = operand_columns.get(id(targ), None)
+                    if column is None:
+                        column = operand_columns[id(targ)] = lookup[targ if resolve is None else resolve(targ)]
+                    occurrences.append(occurrence)
+                    layer_ids.append(layer_num)
+                    gate_ids.append(gate_index)
+                    columns.append(column)
+                    n_operands.append(scope_size)
+                occurrence += 1
+        return tuple(np.array(column, dtype=np.int64) for column in (occurrences, layer_ids, gate_ids, columns, n_operands))
+
+    def proximity_counts(self, size, lookup, resolve=None):
+        '''
+            Counts of pairs of distinct operands that are acted on by the same gate
+        '''
+        occurrences, _, _, columns, _ = self.operand_incidence(lookup, resolve)
+        # Operands are not paired with themselves
+        pairs = chain(group_pairs(occurrences, columns, size), [(columns * (size + 1), -np.ones(len(columns)))])
+        return sparse_counts(pairs, size)
+
+    def conjestion_counts(self, size, lookup, resolve=None):
+        '''
+            Counts of pairs of operands of distinct non-local gates in the same layer
+        '''
+        _, layer_ids, gate_ids, columns, n_operands = self.operand_incidence(lookup, resolve)
+        non_local = n_operands > 1
+        layer_ids, gate_ids, columns = layer_ids[non_local], gate_ids[non_local], columns[non_local]
+
+        # All pairs in each layer less the pairs within each gate
+        gates = layer_ids * (gate_ids.max(initial=0) + 1) + gate_ids
+        pairs = chain(
+            group_pairs(layer_ids, columns, size),
+            ((keys, -weights) for keys, weights in group_pairs(gates, columns, size))
+        )
+        return sparse_counts(pairs, size)
+
+    def logical_lookup(self):
+        return dict(map(lambda x: x[::-1], enumerate(self.scope.keys())))
+
+    def physical_lookup(self):
         lookup_inv = list(chain(self.internal_scope().keys(), self.physical_externs))
-        lookup = dict(map(lambda x: x[::-1], enumerate(lookup_inv)))  
-        
-        for layer in self.layers:
-            for gate in layer:
-                if len(gate.scope) > 1:
-                    for other_gate in layer:
-                        if gate is not other_gate and len(other_gate.scope) > 1:
-                            for targ in gate.scope:                            
-                                for other_targ in other_gate.scope:
-                                    tmp_targ = targ.get_parent()
-                                    tmp_other_targ = other_targ.get_parent()
-                                    
-                                    if tmp_targ.is_extern():
-                                        tmp_targ = self.scope[tmp_targ]
-                                    if tmp_other_targ.is_extern():
-                                        tmp_other_targ = self.scope[tmp_other_targ]
-
-                                    conj[lookup[tmp_targ], lookup[tmp_other_targ]] += 1
-        return conj, lookup
+        return len(lookup_inv), dict(map(lambda x: x[::-1], enumerate(lookup_inv)))
+
+    def physical_symbol(self, targ):
+        targ = targ.get_parent()
+        if targ.is_extern():
+            targ = self.scope[targ]
+        return targ
+
+    def calculate_logical_proximity(self, sparse=False):
+        '''
+            Number of gates acting on each pair of symbols in the scope
+            Returns a dense matrix, or SparseCounts if sparse is set, and the lookup of each symbol
+            The dense matrix is square in the number of symbols, set sparse for wide circuits
+        '''
+        lookup = self.logical_lookup()
+        prox = self.proximity_counts(len(self.scope), lookup)
+        return (prox if sparse else prox.todense()), lookup
+
+    def calculate_logical_conjestion(self, sparse=False):
+        '''
+            Number of times that each pair of symbols in the scope are acted on by different non-local gates in the same layer
+        '''
+        lookup = self.logical_lookup()
+        conj = self.conjestion_counts(len(self.scope), lookup)
+        return (conj if sparse else conj.todense()), lookup
+
+    def calculate_physical_conjestion(self, sparse=False):
+        '''
+            Congestion between registers and allocated externs
+        '''
+        size, lookup = self.physical_lookup()
+        conj = self.conjestion_counts(size, lookup, resolve=self.physical_symbol)
+        return (conj if sparse else conj.todense()), lookup
 
     def lookup(self):
         initial_list = list(self.internal_scope().keys()) + self.physical_externs
@@ -344,31 +449,24 @@ class DAG(DAGNode):
                 lookup_list.append(sym)
         return lookup_list
 
-    def calculate_physical_proximity(self):
-        prox_len = len(self.internal_scope()) + len(self.physical_externs)
-        prox = np.zeros((prox_len, prox_len))
-        lookup_inv = list(chain(self.internal_scope().keys(), self.physical_externs))
-        lookup = dict(map(lambda x: x[::-1], enumerate(lookup_inv))) 
-        
-        for layer in self.layers:
-            for gate in layer:
-                for targ in gate.scope:                            
-                    for other_targ in gate.scope:
-                        if other_targ is not targ:
-
-                            tmp_targ = targ.get_parent()
-                            tmp_other_targ = other_targ.get_parent()
-                            
-                            if tmp_targ.is_extern():
-                                tmp_targ = self.scope[tmp_targ]
-                            if tmp_other_targ.is_extern():
-                                tmp_other_targ = self.scope[tmp_other_targ]
-
-                            prox[lookup[tmp_targ], lookup[tmp_other_targ]] += 1
-
-        return prox, lookup
-
-    def compile(self, n_channels, *externs, extern_minimise=lambda extern: extern.n_cycles(), debug=False):
+    def calculate_physical_proximity(self, sparse=False):
+        '''
+            Proximity between registers and allocated externs
+        '''
+        size, lookup = self.physical_lookup()
+        prox = self.proximity_counts(size, lookup, resolve=self.physical_symbol)
+        return (prox if sparse else prox.todense()), lookup
+
+    def compile(self, n_channels, *externs, extern_minimise=lambda extern: extern.n_cycles(), priority=None, debug=False, count_only=False):
+        '''
+            Estimates the number of cycles for this DAG on n_channels
+            priority is called on the DAG to construct a sort key for waiting gates
+            Without a priority waiting gates are compared as binds, non-extern gates are ordered on the slack of their DAG node
+            Extern gates do not compare less than any other gate, so they keep the order in which they became ready
+            Active gates are held on a heap of the cycle that they complete on
+            Waiting gates are only revisited when a gate is added or a channel or extern is freed
+            count_only skips building the layers and jumps over cycles in which no gate completes, None is returned in place of the layers
+        '''
         
         # Clear any previous extern allocation
         self.externs.clear_scope()
@@ -380,175 +478,251 @@ class DAG(DAGNode):
         # Check that all externs are mapped
         assert(all(any(map(lambda i: i.satisfies(extern), externs)) for extern in self.externs.keys()))
 
+        priority_key = None
+        if priority is not None:
+            priority_key = priority(self)
+
         # Map of extern binds
         extern_map = dict(zip(externs, map(ExternBind, externs)))
         extern_gate_to_bind = lambda gate: extern_map[self.externs[gate.get_unary_symbol()]]
         externs_first_free_cycle = {extern:0 for extern in extern_map.values()}
 
+        # Binding of each active extern gate, cleared whenever an extern is allocated
+        active_binds = dict()
+        def active_extern_bind(gate):
+            binding = active_binds.get(id(gate), None)
+            if binding is None:
+                binding = active_binds[id(gate)] = extern_gate_to_bind(gate)
+            return binding
+
         # Currently unallocated externs
-        idle_externs = list(extern_map.values())
-        idle_externs.sort(key=extern_minimise)
+        idle_externs = ExternPool(extern_map.values(), key=extern_minimise)
 
-        # Active and waiting gates
-        active = set()
+        # Ready counters over the non-extern predicates of each gate, counted when the gate is first checked
+        # Extern predicates are checked against the extern they are bound to
+        resolved = set() 
+        n_unresolved = dict()
+        def n_unresolved_predicates(gate):
+            n_predicates = n_unresolved.get(id(gate), None)
+            if n_predicates is None:
+                n_predicates = n_unresolved[id(gate)] = sum(1 for predicate in gate.predicates if not predicate.is_extern() and id(predicate) not in resolved)
+            return n_predicates
+
+        # Binds are equal when they share a DAG node
+        bind_nodes = dict()
+        def bind(gate):
+            binding = ExternBind(gate) if gate.is_extern() else DAGBind(gate)
+            bind_nodes[id(binding)] = gate
+            return binding
+
+        # Active gates keyed on their DAG node in the order they were issued, and waiting gates
+        active = dict()
         waiting = list()
 
+        # Cycle on which each active gate completes
+        completions = []
+        sequence = count()
+        n_cycles = 0
+
+        def issue(gate):
+            node = bind_nodes[id(gate)]
+            if id(node) not in active:
+                heappush(completions, (n_cycles + max(1, gate.n_cycles() - gate.curr_cycle()), next(sequence), gate, node))
+                active[id(node)] = gate
+
         # Initially active gates
         for gate in self.layers[0]:
             if gate.is_factory():
                 continue 
 
             if gate.is_extern():
-                index, binding = next(
-                    ((index, extern) for index, extern in enumerate(idle_externs) if extern.satisfies(gate)),
-                     (None, None)
-                     )
+                binding = idle_externs.pop(gate)
                 if binding is not None:
-                    idle_externs.pop(index)
                     self.externs[gate.symbol] = binding.get_obj()
                     self.scope[gate.symbol] = binding.get_obj()
-                    active.add(ExternBind(gate))
+                    issue(bind(gate))
 
                 else:
                     # Cannot find a binding, add it to the wait list
-                    waiting.append(ExternBind(gate))
+                    waiting.append(bind(gate))
             else:
-                active.add(DAGBind(gate))
-        self.debug_print(f"Initial Gates: {active}\nWaiting: {waiting}")
+                issue(bind(gate))
+        if self.verbose:
+            self.debug_print(f"Initial Gates: {list(active.values())}\nWaiting: {waiting}")
 
-        # Gates that have finished, how many cycles this took, what happened in each layer
-        resolved = set() 
-        n_cycles = 0
-        layers = []
+        # What happened in each layer
+        layers = None if count_only else []
 
         # This is a semaphore
         queued_factories = set()
         active_non_local_gates = 0
 
+        # Waiting gates are only checked after a resource is freed or a gate is added, and only sorted after they change
+        stale = True
+        unsorted = True
+
         # Keep running until all gates are resolved
         while len(active) > 0 or len(waiting) > 0:
-            self.debug_print(f"Active: {active}\n Waiting: {waiting}\nIdle:{idle_externs}")
-            layers.append([])
-            n_cycles += 1
+            if self.verbose:
+                self.debug_print(f"Active: {list(active.values())}\n Waiting: {waiting}\nIdle:{idle_externs}")
+
+            # Nothing changes until the next gate completes, so jump straight to it
+            n_elapsed = 1
+            if count_only and not stale and not unsorted and len(active) > 0:
+                n_elapsed = max(1, completions[0][0] - n_cycles)
+            n_cycles += n_elapsed
+            if layers is not None:
+                layers.append([])
             
             # Update each active gate
-            for gate in active:
-                gate.cycle()
-                layers[-1].append(gate)
+            for gate in active.values():
+                gate.cycle(n_elapsed)
+                if layers is not None:
+                    layers[-1].append(gate)
                 
                 # Update the underlying binding of each gate
                 if gate.is_extern():
-                    extern_gate_to_bind(gate).cycle()
-                
-            recently_resolved = list(filter(lambda x: x.resolved(), active))
-            active = set(filter(lambda x: not x.resolved(), active))
+                    active_extern_bind(gate).cycle(n_elapsed)
+
+            # Gates completing on the same cycle are popped in the order they were issued
+            resolved_gates = []
+            while len(completions) > 0 and completions[0][0] <= n_cycles:
+                _, _, gate, node = heappop(completions)
+                resolved_gates.append((gate, node))
+                del active[id(node)]
+
             # For each gate we resolve check if there are any antecedents that can be added to the waiting list
-            for gate in recently_resolved:
-                if gate.resolved():
-                    resolved.add(gate)
-
-                    # Decrement semaphore for non-local gates 
-                    if gate.non_local():
-                        active_non_local_gates -= 1
-
-                    # See if any antecedents can be direct added to active
-                    for antecedent in gate.antecedents():
-                        all_resolved = True
-
-                        # Resolve factories first
-                        # Each factory will appear in a single topmost unresolved predicate_factory
-                        for predicate_factory in antecedent.predicate_factories:
-                            # Yet to be allocated
-                            if self.externs[predicate_factory.get_unary_symbol()] is None and predicate_factory not in queued_factories:
+            appended = False
+            for gate, node in resolved_gates:
+                active_binds.pop(id(gate), None)
+                if id(node) not in resolved:
+                    resolved.add(id(node))
+                    if not node.is_extern():
+                        for antecedent in node.antecedents:
+                            if id(antecedent) in n_unresolved:
+                                n_unresolved[id(antecedent)] -= 1
+
+                # Decrement semaphore for non-local gates 
+                if node.non_local():
+                    active_non_local_gates -= 1
+                    stale = True
+
+                # See if any antecedents can be direct added to active
+                for antecedent in node.antecedents:
+                    all_resolved = True
+
+                    # Resolve factories first
+                    # Each factory will appear in a single topmost unresolved predicate_factory
+                    for predicate_factory in antecedent.predicate_factories:
+                        # Yet to be allocated
+                        if self.externs[predicate_factory.get_unary_symbol()] is None and predicate_factory not in queued_factories:
+                            if self.verbose:
                                 self.debug_print(f"\tCaught Factory {predicate_factory} from edge {gate} -> {antecedent}")
-                                waiting.append(ExternBind(predicate_factory))
-                                queued_factories.add(predicate_factory)
-                                all_resolved = False
-                        if all_resolved is False:
-                           continue 
-
-                        # Check the predicate of each antecedent
-                        for predicate in antecedent.predicates: 
-                            # Catches nodes that are externs
-                            # Ensure that the predicate has been mapped
-                            if predicate.is_extern() and self.externs[predicate.get_unary_symbol()] is not None:
-                                if not extern_gate_to_bind(predicate).resolved():
-                                    all_resolved = False
-                                    break
-
-                            elif DAGBind(predicate) not in resolved:
+                            waiting.append(bind(predicate_factory))
+                            queued_factories.add(predicate_factory)
+                            appended = True
+                            all_resolved = False
+                    if all_resolved is False:
+                       continue 
+
+                    if n_unresolved_predicates(antecedent) > 0:
+                        continue
+
+                    # Extern predicates must also be mapped
+                    for predicate in antecedent.predicates:
+                        if not predicate.is_extern():
+                            continue
+                        if self.externs[predicate.get_unary_symbol()] is not None:
+                            if not extern_gate_to_bind(predicate).resolved():
                                 all_resolved = False
                                 break
-                        if all_resolved:
-                            if antecedent.is_extern():
-                                waiting.append(ExternBind(antecedent))
-                            else:
-                                waiting.append(DAGBind(antecedent))
-
-                    # Unlock Externs For Reallocation
-                    if gate.get_symbol() == RESET_SYMBOL:
-                        self.debug_print(f"RESET {gate}")
-                        reset_extern = gate.get_unary_symbol()
-                        extern_bind = extern_map[self.externs[reset_extern]]
-                        extern_bind.reset()                        
-                        idle_externs.append(extern_bind)
-                        externs_first_free_cycle[extern_bind] = len(layers)
 
-            # Sort the waiting list based on the current slack
-            waiting.sort()
-            for gate in waiting:
-                # If it's an extern gate then see if a free resource exists
-                if gate.is_extern():
-                    if len(idle_externs) == 0:
-                        continue
-                    index, binding = next(
-                        ((index, extern) for index, extern in enumerate(idle_externs) if extern.satisfies(gate)),
-                         (None, None)
-                         )
-
-                    if binding is not None:
-                        extern = idle_externs.pop(index)
-                        self.externs[gate.get_symbol()] = binding.get_obj()
-                        self.scope[gate.get_symbol()] = binding.get_obj()
-                        gate.bind_extern(binding)
-
-                        if gate.is_factory():
-                            last_free_cycle = externs_first_free_cycle[extern]
-                            previous_cycles = min(binding.n_cycles(), len(layers) - last_free_cycle) 
-                            gate.set_cycles_completed(previous_cycles)
-                            binding.set_cycles_completed(previous_cycles)
-                            for layer in layers[last_free_cycle:]:
-                                layer.append(gate)
-                        active.add(gate)
+                        elif id(predicate) not in resolved:
+                            all_resolved = False
+                            break
+                    if all_resolved:
+                        appended = True
+                        waiting.append(bind(antecedent))
 
-                else:
-                    # Gate is purely local, add it
-                    if not gate.non_local():
-                        active.add(gate)
-                        continue
-
-                    # Non-local gates only
-                    # Already expended all channels, skip
-                    if active_non_local_gates >= n_channels:
-                        continue
+                # Unlock Externs For Reallocation
+                if node.get_symbol() == RESET_SYMBOL:
+                    if self.verbose:
+                        self.debug_print(f"RESET {gate}")
+                    reset_extern = node.get_unary_symbol()
+                    extern_bind = extern_map[self.externs[reset_extern]]
+                    extern_bind.reset()                        
+                    idle_externs.append(extern_bind)
+                    externs_first_free_cycle[extern_bind] = n_cycles
+                    stale = True
 
-                    # Gate is non-local but we have channel capacity for it
-                    active.add(gate)
-                    active_non_local_gates += 1
+            # Sort the waiting list based on the current slack
+            if appended or unsorted:
+                waiting.sort(key=priority_key)
+                unsorted = False
+
+            # Gates left waiting by the last pass are only allocated once a resource is freed
+            issued = False
+            if stale or appended:
+                stale = False
+                for gate in waiting:
+                    # If it's an extern gate then see if a free resource exists
+                    if gate.is_extern():
+                        if len(idle_externs) == 0:
+                            continue
+                        binding = idle_externs.pop(gate)
+
+                        if binding is not None:
+                            active_binds.clear()
+                            self.externs[gate.get_symbol()] = binding.get_obj()
+                            self.scope[gate.get_symbol()] = binding.get_obj()
+                            gate.bind_extern(binding)
+
+                            if gate.is_factory():
+                                last_free_cycle = externs_first_free_cycle[binding]
+                                previous_cycles = min(binding.n_cycles(), n_cycles - last_free_cycle) 
+                                gate.set_cycles_completed(previous_cycles)
+                                binding.set_cycles_completed(previous_cycles)
+                                if layers is not None:
+                                    for layer in layers[last_free_cycle:]:
+                                        layer.append(gate)
+                            issue(gate)
+                            issued = True
+
+                    else:
+                        # Gate is purely local, add it
+                        if not gate.non_local():
+                            issue(gate)
+                            issued = True
+                            continue
+
+                        # Non-local gates only
+                        # Already expended all channels, skip
+                        if active_non_local_gates >= n_channels:
+                            continue
+
+                        # Gate is non-local but we have channel capacity for it
+                        issue(gate)
+                        issued = True
+                        active_non_local_gates += 1
 
             # Update the waiting list
-            waiting = list(filter(lambda x: x not in active, waiting))
+            if issued or appended:
+                n_waiting = len(waiting)
+                waiting = [gate for gate in waiting if id(bind_nodes[id(gate)]) not in active]
+                if len(waiting) != n_waiting:
+                    unsorted = True
             
             # Dodgy fix for a bug
             # Somehow externs are escaping from the idle extern list :/
             if len(active) == 0:
-                idle_externs = list(extern_map.values())
-                idle_externs.sort(key=extern_minimise)
+                idle_externs.reset(extern_map.values())
+                stale = True
 
-            self.debug_print(f"""
+            if self.verbose:
+                self.debug_print(f"""
  ####
 CYCLE {n_cycles}
-ACTIVE {active}
+ACTIVE {list(active.values())}
 WAITING {waiting}
 IDLE {idle_externs}
 CHANNELS {active_non_local_gates} / {n_channels}
@@ -556,7 +730,8 @@ CHANNELS {active_non_local_gates} / {n_channels}
 ####
                              """)
 
-        self.compiled_layers = layers
+        if layers is not None:
+            self.compiled_layers = layers
         return n_cycles, layers
 
     def __tikz__(self):
@@ -565,7 +740,9 @@ CHANNELS {active_non_local_gates} / {n_channels}
 
 from surface_code_routing.symbol import symbol_resolve, Symbol
 from surface_code_routing.scope import Scope
+from surface_code_routing.dag_core import DAGCore, group_pairs, sparse_counts
 from surface_code_routing.instructions import INIT, RESET_SYMBOL
 from surface_code_routing.bind import DAGBind, ExternBind
+from surface_code_routing.dependency_tracker import ExternPool
 from surface_code_routing.tikz_utils import tikz_dag
 import copy
@@ -0,0 +1,339 @@
+import numpy as np
+
+class Column():
+    '''
+        Growable NumPy column
+        Capacity doubles as values are appended, values() is a view of the filled prefix
+    '''
+    def __init__(self, dtype=np.int64, fill=0, capacity=16):
+        self.dtype = dtype
+        self.fill = fill
+        self.data = np.full(capacity, fill, dtype=dtype)
+        self.size = 0
+
+    def append(self, value):
+        if self.size == len(self.data):
+            data = np.full(2 * len(self.data), self.fill, dtype=self.dtype)
+            data[:self.size] = self.data
+            self.data = data
+        self.data[self.size] = value
+        self.size += 1
+
+    def extend(self, values):
+        for value in values:
+            self.append(value)
+
+    def clear(self):
+        self.data[:self.size] = self.fill
+        self.size = 0
+
+    def values(self):
+        return self.data[:self.size]
+
+    def __getitem__(self, index):
+        return self.data[:self.size][index]
+
+    def __setitem__(self, index, value):
+        self.data[:self.size][index] = value
+
+    def __len__(self):
+        return self.size
+
+class SymbolTable():
+    '''
+        Interns symbols to integers
+        Symbols are matched on their hash and equality, as they are when keying the scope of a DAG
+    '''
+    def __init__(self):
+        self.indices = dict()
+        self.symbols = []
+
+    def __call__(self, symbol):
+        index = self.indices.get(symbol, None)
+        if index is None:
+            index = self.indices[symbol] = len(self.symbols)
+            self.symbols.append(symbol)
+        return index
+
+    def __getitem__(self, index):
+        return self.symbols[index]
+
+    def __contains__(self, symbol):
+        return symbol in self.indices
+
+    def __len__(self):
+        return len(self.symbols)
+
+class GateView():
+    '''
+        Lightweight view of a single gate in a DAGCore
+    '''
+    __slots__ = ('core', 'index')
+
+    def __init__(self, core, index):
+        self.core = core
+        self.index = index
+
+    def node(self):
+        return self.core.nodes[self.index]
+
+    def opcode(self):
+        return self.core.opcodes[self.core.opcode[self.index]]
+
+    def operands(self):
+        return [self.core.symbols[symbol] for symbol in self.core.operands(self.index)]
+
+    def predicates(self):
+        return [GateView(self.core, index) for index in self.core.predecessors(self.index)]
+
+    def antecedents(self):
+        return [GateView(self.core, index) for index in self.core.successors(self.index)]
+
+    def n_cycles(self):
+        return int(self.core.n_cycles[self.index])
+
+    def n_ancillae(self):
+        return int(self.core.n_ancillae[self.index])
+
+    def layer(self):
+        return int(self.core.layer[self.index])
+
+    def slack(self):
+        return float(self.core.slack[self.index])
+
+    def is_extern(self):
+        return bool(self.core.flags[self.index] & DAGCore.EXTERN)
+
+    def is_factory(self):
+        return bool(self.core.flags[self.index] & DAGCore.FACTORY)
+
+    def non_local(self):
+        return bool(self.core.flags[self.index] & DAGCore.NON_LOCAL)
+
+    def __eq__(self, other):
+        return isinstance(other, GateView) and other.core is self.core and other.index == self.index
+
+    def __hash__(self):
+        return hash((id(self.core), self.index))
+
+    def __repr__(self):
+        return f"<GateView {self.index}: {self.node()}>"
+
+class DAGCore():
+    '''
+        Array backed gate storage for a DAG
+        Gates are integer ids in the order they were added to the DAG
+        Predecessors and operands are stored in CSR form as gates are added
+        Successors are built from the predecessors when they are first requested
+        Opcodes and operand symbols are interned to integers
+    '''
+    EXTERN = 1
+    FACTORY = 2
+    NON_LOCAL = 4
+
+    def __init__(self):
+        self.opcodes = SymbolTable()
+        self.symbols = SymbolTable()
+
+        # Gate id of each DAG node, keyed on id
+        self.indices = dict()
+        self.nodes = []
+
+        # Per gate columns
+        self.opcode = Column()
+        self.n_cycles = Column()
+        self.n_ancillae = Column()
+        self.flags = Column(dtype=np.uint8)
+        self.layer = Column()
+        self.slack = Column(dtype=np.float64, fill=np.inf)
+
+        # CSR predecessors, the predecessors of gate i are pred_indices[pred_offsets[i]:pred_offsets[i + 1]]
+        self.pred_offsets = Column()
+        self.pred_offsets.append(0)
+        self.pred_indices = Column()
+
+        # CSR operands
+        self.operand_offsets = Column()
+        self.operand_offsets.append(0)
+        self.operand_indices = Column()
+
+        # Successors are built on demand
+        self.succ_offsets = None
+        self.succ_indices = None
+
+    def add(self, dag_node):
+        '''
+            Adds a DAG node along with its current predicates
+            Predicates that are not in the core are ignored
+            Returns the gate id
+        '''
+        index = self.indices[id(dag_node)] = len(self.nodes)
+        self.nodes.append(dag_node)
+
+        self.opcode.append(self.opcodes(dag_node.get_symbol().predicate))
+        self.n_cycles.append(dag_node.n_cycles())
+        self.n_ancillae.append(dag_node.n_ancillae)
+        self.flags.append(
+            self.EXTERN * dag_node.is_extern()
+            | self.FACTORY * dag_node.is_factory()
+            | self.NON_LOCAL * dag_node.non_local()
+        )
+        self.layer.append(dag_node.layer)
+        self.slack.append(dag_node.slack)
+
+        predicate_indices = (self.indices.get(id(predicate), None) for predicate in dag_node.predicates)
+        self.pred_indices.extend(sorted(idx for idx in predicate_indices if idx is not None and idx != index))
+        self.pred_offsets.append(len(self.pred_indices))
+
+        for symbol in dag_node.get_symbol().io:
+            self.operand_indices.append(self.symbols(symbol))
+        self.operand_offsets.append(len(self.operand_indices))
+
+        self.succ_offsets = None
+        self.succ_indices = None
+        return index
+
+    def rebuild(self, dag_nodes):
+        '''
+            Rebuilds the core from a list of DAG nodes in topological order
+            Used after the nodes of a DAG have been rewired in place
+        '''
+        self.__init__()
+        for dag_node in dag_nodes:
+            self.add(dag_node)
+
+    def index(self, dag_node):
+        return self.indices[id(dag_node)]
+
+    def get(self, dag_node, default=None):
+        return self.indices.get(id(dag_node), default)
+
+    def view(self, index):
+        return GateView(self, index)
+
+    def predecessors(self, index):
+        return self.pred_indices[self.pred_offsets[index]:self.pred_offsets[index + 1]]
+
+    def successors(self, index):
+        offsets, indices = self.successor_csr()
+        return indices[offsets[index]:offsets[index + 1]]
+
+    def operands(self, index):
+        return self.operand_indices[self.operand_offsets[index]:self.operand_offsets[index + 1]]
+
+    def predecessor_csr(self):
+        return self.pred_offsets.values(), self.pred_indices.values()
+
+    def successor_csr(self):
+        '''
+            Transposes the predecessor CSR
+            Successors of each gate are in gate order
+        '''
+        if self.succ_offsets is None:
+            offsets, indices = self.predecessor_csr()
+            sources = np.repeat(np.arange(len(self), dtype=np.int64), np.diff(offsets))
+            order = np.argsort(indices, kind='stable')
+            self.succ_indices = sources[order]
+            self.succ_offsets = np.zeros(len(self) + 1, dtype=np.int64)
+            np.cumsum(np.bincount(indices, minlength=len(self)), out=self.succ_offsets[1:])
+        return self.succ_offsets, self.succ_indices
+
+    def operand_csr(self):
+        return self.operand_offsets.values(), self.operand_indices.values()
+
+    def in_degree(self):
+        return np.diff(self.pred_offsets.values())
+
+    def out_degree(self):
+        offsets, _ = self.successor_csr()
+        return np.diff(offsets)
+
+    def layers(self):
+        '''
+            Gate ids of each layer, ordered by gate id within a layer
+        '''
+        layer = self.layer.values()
+        if len(layer) == 0:
+            return []
+        order = np.argsort(layer, kind='stable')
+        bounds = np.cumsum(np.bincount(layer))[:-1]
+        return np.split(order, bounds)
+
+    def nbytes(self):
+        '''
+            Bytes held by the arrays of the core
+        '''
+        columns = (self.opcode, self.n_cycles, self.n_ancillae, self.flags, self.layer, self.slack,
+                   self.pred_offsets, self.pred_indices, self.operand_offsets, self.operand_indices)
+        return sum(column.data.nbytes for column in columns)
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def __iter__(self):
+        return (GateView(self, index) for index in range(len(self)))
+
+class SparseCounts():
+    '''
+        Sparse square matrix of counts in coordinate form
+        Coordinates are unique and sorted by row then column
+        scipy is not a dependency, so this holds the arrays of a coo_matrix rather than being one
+        scipy.sparse.coo_matrix((counts.values, (counts.rows, counts.cols)), shape=counts.shape) converts it
+    '''
+    def __init__(self, rows, cols, values, size):
+        self.rows = rows
+        self.cols = cols
+        self.values = values
+        self.shape = (size, size)
+
+    def todense(self):
+        dense = np.zeros(self.shape)
+        dense[self.rows, self.cols] = self.values
+        return dense
+
+    def __len__(self):
+        return len(self.values)
+
+    def __repr__(self):
+        return f"SparseCounts: {len(self)} entries of {self.shape}"
+
+def group_pairs(groups, columns, n_columns, chunk_size=1 << 22):
+    '''
+        Ordered pairs of columns that share a group, including each column with itself
+        Each pair is weighted by the product of the multiplicities of its columns within the group
+        Yields pair keys (row * n_columns + column) and weights in chunks of whole groups of about chunk_size pairs
+    '''
+    groups = np.asarray(groups, dtype=np.int64)
+    columns = np.asarray(columns, dtype=np.int64)
+    keys, multiplicity = np.unique(groups * n_columns + columns, return_counts=True)
+    groups, columns = np.divmod(keys, n_columns)
+
+    # Entries are sorted by group, so each group is a contiguous run
+    starts = np.flatnonzero(np.diff(groups, prepend=-1))
+    sizes = np.diff(starts, append=len(groups))
+    n_pairs = np.cumsum(sizes * sizes)
+    bounds = np.searchsorted(n_pairs, np.arange(chunk_size, n_pairs[-1] if len(n_pairs) > 0 else 0, chunk_size), side='right')
+
+    for chunk_starts, chunk_sizes in zip(np.split(starts, bounds), np.split(sizes, bounds)):
+        entry_size = np.repeat(chunk_sizes, chunk_sizes)
+        entry_start = np.repeat(chunk_starts, chunk_sizes)
+
+        # Each entry is paired with every entry of its group
+        first = chunk_starts[0] if len(chunk_starts) > 0 else 0
+        left = np.repeat(np.arange(first, first + len(entry_size)), entry_size)
+        pair_offsets = np.arange(len(left)) - np.repeat(np.cumsum(entry_size) - entry_size, entry_size)
+        right = np.repeat(entry_start, entry_size) + pair_offsets
+        yield columns[left] * n_columns + columns[right], multiplicity[left] * multiplicity[right]
+
+def sparse_counts(pairs, n_columns):
+    '''
+        Sums the weights of each key over chunks of (keys, weights), zero sums are dropped
+    '''
+    keys = np.zeros(0, dtype=np.int64)
+    values = np.zeros(0, dtype=np.float64)
+    for chunk_keys, chunk_weights in pairs:
+        keys, inverse = np.unique(np.concatenate((keys, chunk_keys)), return_inverse=True)
+        values = np.bincount(inverse, weights=np.concatenate((values, chunk_weights)), minlength=len(keys))
+    nonzero = values != 0
+    rows, cols = np.divmod(keys[nonzero], n_columns)
+    return SparseCounts(rows, cols, values[nonzero], n_columns)
@@ -0,0 +1,164 @@
+import copy
+
+from surface_code_routing.symbol import Symbol, ExternSymbol, symbol_resolve
+from surface_code_routing.scope import Scope
+from surface_code_routing.dag import DAG
+
+TEMPLATE_OPERAND = '__template_operand_'
+
+class DAGTemplate():
+    '''
+        Gate constructor whose DAG is built once per signature
+        The signature of a call is the pattern of repeated operands
+        Instances copy the flattened gates of the template with the operand symbols remapped and fresh extern symbols
+        Operands must only be used as symbols by the constructor
+    '''
+    def __init__(self, constructor):
+        self.constructor = constructor
+        self.templates = dict()
+
+    def __call__(self, *operands):
+        operands = tuple(map(symbol_resolve, operands))
+        signature = tuple(operands.index(operand) for operand in operands)
+
+        template = self.templates.get(signature, None)
+        if template is None:
+            placeholders = [Symbol(f'{TEMPLATE_OPERAND}{i}') for i in signature]
+            template = self.templates[signature] = Template(self.constructor(*placeholders), placeholders)
+        if template.dag is not None:
+            # Templates that cannot be unrolled are rebuilt
+            return self.constructor(*operands)
+        return template.instance(operands)
+
+class Template():
+    '''
+        Flattened gates of a constructed DAG
+    '''
+    def __init__(self, dag, placeholders):
+        self.dag = None
+        if not dag.unrollable():
+            self.dag = dag
+            return
+        self.symbol = dag.symbol
+        self.externs = dag.externs
+        self.gates = DAG.flatten(dag)
+        self.placeholders = placeholders
+
+        # Operands used to construct other symbols would not be remapped
+        operands = set(placeholder.symbol for placeholder in placeholders)
+        for gate in self.gates:
+            for symbol in gate.scope:
+                if isinstance(symbol.symbol, str) and TEMPLATE_OPERAND in symbol.symbol and symbol.symbol not in operands:
+                    raise Exception(f"Template operand used to construct {symbol}")
+
+    def instance(self, operands):
+        remap = SymbolRemap({placeholder: operand for placeholder, operand in zip(self.placeholders, operands)})
+
+        gates = []
+        for gate in self.gates:
+            instance_gate = copy.copy(gate)
+            instance_gate.symbol = remap.gate_symbol(gate.symbol)
+            instance_gate.scope = remap.scope(gate.scope)
+            instance_gate.externs = remap.scope(gate.externs)
+
+            # Dependencies are built by the DAG that the instance is added to
+            # Slack from within the template is retained, as it would be when the template is unrolled
+            instance_gate.predicates = set()
+            instance_gate.antecedents = set()
+            instance_gate.predicate_factories = set()
+            instance_gate.back_edges = dict()
+            instance_gate.forward_edges = dict()
+            instance_gate.gates = [instance_gate]
+            instance_gate.layers = [instance_gate]
+            gates.append(instance_gate)
+
+        return TemplateInstance(remap.gate_symbol(self.symbol), remap.scope(self.externs), gates)
+
+class SymbolRemap():
+    '''
+        Copies symbols with operands replaced
+        Each extern predicate is replaced by a new predicate so that instances are allocated independently
+    '''
+    def __init__(self, operands):
+        self.operands = operands
+        self.symbols = dict()
+
+    def __call__(self, symbol):
+        if symbol is None:
+            return None
+        remapped = self.symbols.get(id(symbol), None)
+        if remapped is not None:
+            return remapped
+
+        if isinstance(symbol, ExternSymbol):
+            remapped = self.symbols[id(symbol)] = copy.copy(symbol)
+            remapped.predicate = self.gate_symbol(symbol.predicate)
+            remapped.parent = self(symbol.parent)
+            remapped.io_in = {remapped}
+            remapped.io_out = {remapped}
+            remapped.io = {remapped:remapped}
+            remapped.externs = [remapped]
+            return remapped
+
+        operand = self.operands.get(symbol, None)
+        if operand is not None:
+            remapped = self.symbols[id(symbol)] = operand
+            return remapped
+
+        if len(symbol.io) == 0 and symbol.predicate is symbol:
+            # Registers are matched on their name
+            return symbol
+        return self.gate_symbol(symbol)
+
+    def gate_symbol(self, symbol):
+        '''
+            Copies a symbol and remaps its io
+        '''
+        remapped = self.symbols.get(id(symbol), None)
+        if remapped is not None:
+            return remapped
+        if isinstance(symbol, ExternSymbol):
+            return self(symbol)
+
+        remapped = self.symbols[id(symbol)] = copy.copy(symbol)
+        remapped.predicate = remapped if symbol.predicate is symbol else self(symbol.predicate)
+        remapped.parent = self(symbol.parent)
+        remapped.io_in = set(map(self, symbol.io_in))
+        remapped.io_out = set(map(self, symbol.io_out))
+        remapped.io = {self(element):index for element, index in symbol.io.items()}
+        remapped.io_rev = {index:element for element, index in remapped.io.items()}
+        remapped.z = remapped.io_in
+        remapped.x = remapped.io_out
+        return remapped
+
+    def scope(self, scope):
+        remapped = Scope()
+        remapped.mapping = {self(key):self(value) for key, value in scope.items()}
+        return remapped
+
+class TemplateInstance():
+    '''
+        Gates stamped from a template, these are unrolled into the DAG they are added to
+    '''
+    def __init__(self, symbol, externs, gates):
+        self.symbol = symbol
+        self.externs = externs
+        self.gates = gates
+
+    def __call__(self, scope=None):
+        if scope is not None:
+            if not isinstance(scope, Scope):
+                scope = Scope(scope)
+            for gate in self.gates:
+                gate.inject(scope)
+            self.symbol.inject(scope)
+        return self
+
+    def unrollable(self):
+        return True
+
+    def get_symbol(self):
+        return self.symbol
+
+    def __repr__(self):
+        return self.symbol.__repr__()
@@ -0,0 +1,296 @@
+from collections import deque
+
+from surface_code_routing.bind import Bind
+
+class ReadyQueue():
+    '''
+        Ready queue backed by a count of the unresolved predicates of each DAG node
+        A node is ready once the counter for its final predicate reaches zero
+    '''
+    def __init__(self, gates):
+        self.n_unresolved = {gate: len(gate.predicates) for gate in gates}
+        self.waiting = list()
+        self.issued = set()
+
+    def decrement(self, dag_node):
+        '''
+            Called once for each resolved predicate of dag_node
+            Returns the number of predicates that are yet to resolve
+        '''
+        n_unresolved = self.n_unresolved[dag_node] - 1
+        self.n_unresolved[dag_node] = n_unresolved
+        return n_unresolved
+
+    def append(self, gate):
+        self.waiting.append(gate)
+
+    def extend(self, gates):
+        self.waiting.extend(gates)
+
+    def issue(self, gate):
+        '''
+            Marks a gate for removal on the next flush
+        '''
+        self.issued.add(id(gate))
+
+    def flush(self):
+        '''
+            Removes all issued gates from the queue
+        '''
+        if len(self.issued) > 0:
+            self.waiting = [gate for gate in self.waiting if id(gate) not in self.issued]
+            self.issued = set()
+
+    def sort(self, **kwargs):
+        self.waiting.sort(**kwargs)
+
+    def __iter__(self):
+        return iter(self.waiting)
+
+    def __len__(self):
+        return len(self.waiting)
+
+    def __repr__(self):
+        return self.waiting.__repr__()
+
+class ExternBarrier():
+    '''
+        Externs are not released to the allocator until all non-extern gates that precede the extern gate have resolved
+        Barriers are built once per DAG and count down as gates resolve
+        Barriers are keyed on extern symbols, which compare equal when they share a predicate
+    '''
+    def __init__(self, dag):
+        # Extern gate for each extern symbol 
+        extern_gates = dict()
+        for gate in dag.gates:
+            if gate.is_extern():
+                for symbol in gate.scope:
+                    if symbol.is_extern():
+                        extern_gates.setdefault(symbol, gate)
+
+        # Barrier keys for each gate
+        self.gate_barriers = dict()
+        # Unresolved non-extern predecessors of each barrier
+        self.unresolved = dict()
+        # Barriers waiting on each gate
+        self.dependents = dict()
+
+        for gate in dag.gates:
+            barriers = self.gate_barriers[gate] = self.get_barriers(gate)
+            for ext_symbol in barriers:
+                if ext_symbol in self.unresolved:
+                    continue
+                extern_gate = extern_gates.get(ext_symbol, None)
+                if extern_gate is None:
+                    # Raised when the barrier is checked
+                    self.unresolved[ext_symbol] = None
+                    continue
+                unresolved = self.unresolved[ext_symbol] = self.non_extern_predicates(ext_symbol, extern_gate)
+                for predicate in unresolved:
+                    self.dependents.setdefault(predicate, list()).append(ext_symbol)
+
+    @staticmethod
+    def get_barriers(gate):
+        return tuple(symbol for symbol in gate.scope if symbol.is_extern() and not symbol.is_factory())
+
+    @staticmethod
+    def non_extern_predicates(ext_symbol, extern_gate):
+        '''
+            Walks back from the extern gate through gates that act on the extern symbol
+        '''
+        non_extern_predicates = set()
+        extern_predicates = [extern_gate]
+        visited = {extern_gate}
+        while len(extern_predicates) > 0:
+            next_extern_predicates = []
+            for extern_pred in extern_predicates:
+                for pred in extern_pred.predicates:
+                    if ext_symbol in pred.scope:
+                        if pred not in visited:
+                            visited.add(pred)
+                            next_extern_predicates.append(pred)
+                    else:
+                        non_extern_predicates.add(pred)
+            extern_predicates = next_extern_predicates
+        return non_extern_predicates
+
+    def resolve(self, dag_node):
+        '''
+            Counts down all barriers waiting on this gate
+        '''
+        for ext_symbol in self.dependents.pop(dag_node, tuple()):
+            self.unresolved[ext_symbol].discard(dag_node)
+
+    def __call__(self, dag_node):
+        '''
+            Checks if all barriers on a gate have been resolved
+        '''
+        barriers = self.gate_barriers.get(dag_node, None)
+        if barriers is None:
+            barriers = self.gate_barriers[dag_node] = self.get_barriers(dag_node)
+
+        for ext_symbol in barriers:
+            unresolved = self.unresolved.get(ext_symbol, None)
+            if unresolved is None:
+                raise Exception("Missing Extern Gate")
+            if len(unresolved) > 0:
+                return False
+        return True
+
+class ExternPool():
+    '''
+        Idle externs keyed by the predicate that they satisfy
+        Each key hands out externs in the order that they became idle
+        This matches taking the first satisfying extern from a single list of idle externs
+    '''
+    def __init__(self, externs, key=None):
+        self.key = key
+        self.reset(externs)
+
+    def reset(self, externs):
+        '''
+            Replaces the idle externs, these are sorted on key
+        '''
+        self.idle = dict()
+        self.n_idle = 0
+        for extern in sorted(externs, key=self.key):
+            self.append(extern)
+
+    def append(self, extern):
+        self.idle.setdefault(extern.get_symbol().satisfies_key(), deque()).append(extern)
+        self.n_idle += 1
+
+    def pop(self, gate):
+        '''
+            Removes the first idle extern that satisfies the gate
+            Returns None if there is no such extern
+        '''
+        idle = self.idle.get(gate.get_symbol().satisfies_key(), None)
+        if not idle or not idle[0].satisfies(gate):
+            return None
+        self.n_idle -= 1
+        return idle.popleft()
+
+    def __len__(self):
+        return self.n_idle
+
+    def __repr__(self):
+        return [extern for idle in self.idle.values() for extern in idle].__repr__()
+
+class CriticalPath():
+    '''
+        Critical path priority over the gates of a DAG
+        Gates are weighted by their number of cycles
+        Gates with the earliest ALAP start are on the critical path and are offered resources first
+    '''
+    def __init__(self, dag):
+        gates = self.topological_order(dag.gates)
+
+        # Earliest start cycle
+        self.asap = dict()
+        for gate in gates:
+            self.asap[gate] = max((self.asap[predicate] + predicate.n_cycles() for predicate in gate.predicates if predicate is not gate), default=0)
+
+        # Longest path from the start of each gate to the end of the DAG
+        self.tail = dict()
+        for gate in reversed(gates):
+            self.tail[gate] = gate.n_cycles() + max((self.tail[antecedent] for antecedent in gate.antecedents if antecedent is not gate), default=0)
+
+        self.length = max(self.tail.values(), default=0)
+
+    @staticmethod
+    def topological_order(gates):
+        n_unresolved = {gate: sum(1 for predicate in gate.predicates if predicate is not gate) for gate in gates}
+        order = [gate for gate in gates if n_unresolved[gate] == 0]
+        for gate in order:
+            for antecedent in gate.antecedents:
+                if antecedent is gate:
+                    continue
+                n_unresolved[antecedent] -= 1
+                if n_unresolved[antecedent] == 0:
+                    order.append(antecedent)
+        return order
+
+    def alap(self, gate):
+        '''
+            Latest start cycle that does not extend the critical path
+        '''
+        return self.length - self.tail.get(self.dag_node(gate), 0)
+
+    def slack(self, gate):
+        gate = self.dag_node(gate)
+        return self.alap(gate) - self.asap.get(gate, 0)
+
+    @staticmethod
+    def dag_node(gate):
+        while isinstance(gate, Bind):
+            gate = gate.obj
+        return gate
+
+    def __call__(self, gate):
+        return self.alap(gate)
+
+class DeadlockError(Exception):
+    '''
+        Raised when no waiting gate can make progress
+        Carries the wait for graph of the stalled gates and a cycle through it if one was found
+    '''
+    def __init__(self, wait_for, stalled, cycle=None):
+        self.wait_for = wait_for
+        self.stalled = stalled
+        self.cycle = cycle
+        message = [f"Deadlock: {len(stalled)} gates stalled"]
+        for gate in stalled:
+            message.append(f"\t{gate} waiting on {wait_for.waits_on(gate)}")
+        if cycle is not None:
+            message.append(f"\tCycle: {' -> '.join(map(str, cycle + cycle[:1]))}")
+        super().__init__('\n'.join(message))
+
+class WaitForGraph():
+    '''
+        Edges run from stalled gates to the resources they are waiting on and from resources to the gates that must resolve to release them
+        Nodes are gates, segments, patches and resources, segments compare equal on their bounds so nodes are keyed on id
+    '''
+    def __init__(self):
+        self.nodes = dict()
+        self.edges = dict()
+
+    def add_edge(self, waiter, holder):
+        self.nodes[id(waiter)] = waiter
+        self.nodes[id(holder)] = holder
+        self.edges.setdefault(id(waiter), dict())[id(holder)] = None
+
+    def waits_on(self, node):
+        return [self.nodes[holder] for holder in self.edges.get(id(node), tuple())]
+
+    def __contains__(self, node):
+        return id(node) in self.edges
+
+    def find_cycle(self):
+        '''
+            Iterative depth first search for a cycle
+            Returns the nodes of the cycle in wait order, or None
+        '''
+        visited = set()
+        for root in self.edges:
+            if root in visited:
+                continue
+            visited.add(root)
+            path = [root]
+            on_path = {root}
+            stack = [iter(self.edges[root])]
+            while len(stack) > 0:
+                node = next(stack[-1], None)
+                if node is None:
+                    stack.pop()
+                    on_path.discard(path.pop())
+                    continue
+                if node in on_path:
+                    return [self.nodes[i] for i in path[path.index(node):]]
+                if node in visited:
+                    continue
+                visited.add(node)
+                path.append(node)
+                on_path.add(node)
+                stack.append(iter(self.edges.get(node, tuple())))
+        return None
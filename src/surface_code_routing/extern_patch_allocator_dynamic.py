@@ -3,6 +3,7 @@ from surface_code_routing.constants import COULD_NOT_ALLOCATE
 from surface_code_routing.qcb import SCPatch 
 
 from surface_code_routing.utils import debug_print
+from surface_code_routing.checkpoint import CheckpointError
 from surface_code_routing.bind import AddrBind 
 
 from functools import partial
@@ -43,6 +44,12 @@ class ExternPatchAllocatorDynamic():
         '''
         return self.mapper.segment_maps[symbol.predicate].first_free_cycle(symbol)
 
+    def earliest_free_cycle(self):
+        '''
+            Factories are never rolled back before this cycle
+        '''
+        return min((segment_map.earliest_free_cycle() for segment_map in self.mapper.segment_maps.values() if isinstance(segment_map, ExternSegmentMapDynamic)), default=float('inf'))
+
     def alloc(self, symbol):
         '''
             This takes the unary symbol from the gate and uses the predicate to generalise to the symbol's unique instance
@@ -121,6 +128,39 @@ class ExternSegmentMapDynamic():
             raise Exception(f"{symbol} has not yet been allocated")
         return self.__first_free_cycle[segment]
 
+    def earliest_free_cycle(self):
+        if not self.extern.is_factory():
+            return float('inf')
+        return min(self.__first_free_cycle.values(), default=float('inf'))
+
+    def checkpoint(self, symbol_index):
+        '''
+            Lock state and symbol assignments of each physical segment, segments are identified by their coordinates
+        '''
+        coordinates = lambda segment: (segment.y_0, segment.x_0, segment.y_1, segment.x_1)
+        segments = self.get_physical_segments()
+        return {
+            'segments': [coordinates(segment) for segment in segments],
+            'locks': [symbol_index(self.locks[segment]) for segment in segments],
+            'first_free_cycle': [self.__first_free_cycle[segment] for segment in segments],
+            'assigned': [(symbol_index(symbol), coordinates(segment)) for symbol, segment in self.segments.items()],
+            'idle': [coordinates(segment) for segment in self.idle_segments]
+        }
+
+    def restore(self, state, symbols):
+        '''
+            Restores the lock state and symbol assignments of each physical segment from a checkpoint
+        '''
+        segments = {(segment.y_0, segment.x_0, segment.y_1, segment.x_1):segment for segment in self.get_physical_segments()}
+        if set(segments) != set(map(tuple, state['segments'])):
+            raise CheckpointError(f"Checkpoint does not match the segments of {self.extern}")
+        for coordinates, lock, first_free_cycle in zip(state['segments'], state['locks'], state['first_free_cycle']):
+            segment = segments[tuple(coordinates)]
+            self.locks[segment] = symbols(lock)
+            self.__first_free_cycle[segment] = first_free_cycle
+        self.segments = {symbols(symbol):segments[tuple(coordinates)] for symbol, coordinates in state['assigned']}
+        self.idle_segments = [segments[tuple(coordinates)] for coordinates in state['idle']]
+
     def lock_state(self, symbol, dag_extern):
         '''
             Probes the current lock state for a given symbol
@@ -55,6 +55,8 @@ class RotationInjector():
                 addresses = self.mapper(gate)
                 self.rotate(gate, addresses)
             index += 1
+        # Rotation gates were spliced into the DAG
+        self.dag.invalidate_core()
 
 
     def check_rotations(self, dag_node):
@@ -212,7 +212,7 @@ class TeleportOperation():
         gate = self.gate()
         bound_gate = AddrBind(gate)
         routes[bound_gate] = gate.addresses
-        layers[self.cycle].append(gate)
+        layers.add(gate, self.cycle, self.cycle + 1, gate.addresses)
         gate.obj.antecedants = {computational_gate}
         for address in self.endpoints:
             address.last_used = self.curr_cycle
@@ -268,6 +268,9 @@ class TeleportSwitch():
         # By implication this is only called when the operation requires one entrypoint and one exit
         earliest_teleportation_cycle = max(map(lambda x: x.last_used + 1, chain(teleportation_endpoints, [self.intersection]))) + 1 
 
+        # Layers that have been finalised by a streaming router cannot be written to
+        earliest_teleportation_cycle = max(earliest_teleportation_cycle, self.teleport_injector.router.layers.offset + 1)
+
         # Need at least one cycle
         if earliest_teleportation_cycle >= curr_cycle - N_CYCLE_LOOKBACK:
             return False, None
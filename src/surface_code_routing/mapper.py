@@ -43,6 +43,9 @@ class QCBMapper():
     def first_free_cycle(self, gate):
         return self.extern_allocator.first_free_cycle(gate.get_unary_symbol())
 
+    def earliest_free_cycle(self):
+        return self.extern_allocator.earliest_free_cycle()
+
     def get_extern_coordinate(self, symbol):
         return self.extern_allocator[symbol]
 
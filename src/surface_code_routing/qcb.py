@@ -91,7 +91,10 @@ class QCB():
         return self
 
     def instantiate(self):
-        return copy.deepcopy(self)
+        # The DAG is copied first so that its gates are copied by index
+        memo = dict()
+        copy.deepcopy(self.operations, memo)
+        return copy.deepcopy(self, memo)
 
     def is_extern(self):
         return self.symbol.is_extern()
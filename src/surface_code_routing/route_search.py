@@ -0,0 +1,117 @@
+from heapq import heappush, heappop
+from itertools import count
+
+import numpy as np
+
+# Returned by searches that expand more patches than they are allowed to
+ABANDONED = object()
+
+def manhattan(a, b, bias = 1 + 1e-7):
+    '''
+        Manhattan distance between two coordinates
+        The bias breaks ties between equal length paths towards b
+    '''
+    return abs(a[1] - b[1]) + bias * abs(a[0] - b[0])
+
+def field_heuristic(field, unreachable, bias = 1 + 1e-7):
+    '''
+        Heuristic from a distance field, unreachable patches have an infinite estimate
+    '''
+    def estimate(coordinates):
+        distance = field.item(coordinates)
+        if distance == unreachable:
+            return float('inf')
+        return bias * distance
+    return estimate
+
+def reverse_adjacency(adjacency, shape):
+    '''
+        Patches that are adjacent to each patch
+        Unbound adjacency covers the orientation constrained joins at the start of a route
+    '''
+    reverse = [[[] for _ in range(shape[1])] for _ in range(shape[0])]
+    table = adjacency[False, True, True]
+    for i in range(shape[0]):
+        for j in range(shape[1]):
+            for y, x in table[i][j]:
+                reverse[y][x].append((i, j))
+    return reverse
+
+def distance_field(end, reverse, route_mask, dtype):
+    '''
+        Breadth first search back from the end patch
+        Only routing patches may be passed through, any patch may start a route
+        Unreachable patches hold the largest value of dtype
+    '''
+    unreachable = np.iinfo(dtype).max
+    field = [[unreachable] * route_mask.shape[1] for _ in range(route_mask.shape[0])]
+    field[end[0]][end[1]] = 0
+    frontier = [end]
+    distance = 0
+    while len(frontier) > 0:
+        distance += 1
+        next_frontier = []
+        for y, x in frontier:
+            for previous in reverse[y][x]:
+                if field[previous[0]][previous[1]] == unreachable:
+                    field[previous[0]][previous[1]] = distance
+                    if route_mask[previous]:
+                        next_frontier.append(previous)
+        frontier = next_frontier
+    return np.array(field, dtype=dtype)
+
+def a_star(start, end, adjacency, route_mask, orientations, blocked, heuristic, costs=None, start_orientation=None, max_expansions=None):
+    '''
+        A* search between two patches over the array state of a patch graph
+        Patches are coordinates, adjacency holds the adjacent coordinates of each patch keyed on bound, horizontal and vertical
+        Only routing patches may be passed through and blocked patches are never entered
+        The join at the start follows the start orientation, an index into the orientations of the patch graph
+        Patches with an infinite estimate are never entered, costs default to one per patch
+        Ties on the frontier are broken by insertion order and each patch is expanded at most once
+        Returns a list of coordinates, None if there is no path or ABANDONED once more than max_expansions patches are expanded
+    '''
+    tie_breaker = count()
+    frontier = [(0, next(tie_breaker), start)]
+    path = {start: None}
+    path_cost = {start: 0}
+    closed = set()
+
+    while len(frontier) > 0:
+        current = heappop(frontier)[2]
+        if current == end:
+            break
+        if current in closed:
+            continue
+        closed.add(current)
+        if max_expansions is not None and len(closed) > max_expansions:
+            return ABANDONED
+
+        # Correct join at the start
+        if current == start and start_orientation is not None:
+            if start_orientation == orientations[current]:
+                neighbours = adjacency[False, False, True][current[0]][current[1]]
+            else:
+                neighbours = adjacency[False, True, False][current[0]][current[1]]
+        else:
+            neighbours = adjacency[True, True, True][current[0]][current[1]]
+
+        for i in neighbours:
+            if i in closed or blocked[i]:
+                continue
+            if (i == end and current != start) or route_mask[i]:
+                cost = path_cost[current] + (1 if costs is None else costs[i])
+                if i not in path_cost or cost < path_cost[i]:
+                    estimate = heuristic(i)
+                    if estimate == float('inf'):
+                        continue
+                    path_cost[i] = cost
+                    heappush(frontier, (cost + estimate, next(tie_breaker), i))
+                    path[i] = current
+    else:
+        return None
+
+    final_route = [end]
+    while (end := path[end]) is not None:
+        final_route.append(end)
+    final_route.reverse()
+    return final_route
@@ -1,5 +1,8 @@
 from typing import *
+import time
 from queue import PriorityQueue
+from heapq import heappush, heappop
+from itertools import count
 from surface_code_routing.utils import debug_print
 
 from surface_code_routing.qcb import Segment, SCPatch, QCB
@@ -14,11 +17,25 @@ from surface_code_routing.tikz_utils import tikz_router
 from surface_code_routing.instructions import RESET_SYMBOL, ROTATION_SYMBOL, HADAMARD_SYMBOL, Rotation
 
 from surface_code_routing.inject_teleportation_routes import TeleportInjector
+from surface_code_routing.schedule import LayerSchedule
+from surface_code_routing.dependency_tracker import ReadyQueue, ExternBarrier, WaitForGraph, DeadlockError, CriticalPath
+from surface_code_routing.speculative_routing import SpeculativeRouter
+from surface_code_routing.checkpoint import checkpoint_state, save_checkpoint, load_checkpoint, restore_state
 
 from surface_code_routing.constants import COULD_NOT_ALLOCATE
 
+class BudgetExceeded(Exception):
+    '''
+        Raised when routing runs over its budget
+        The router holds the partial schedule
+    '''
+    def __init__(self, message, router):
+        self.router = router
+        self.progress = router.progress()
+        super().__init__(f"{message}: {self.progress}")
+
 class QCBRouter:
-    def __init__(self, qcb:QCB, dag:DAG, mapper:QCBMapper, graph=None, auto_route=True, verbose=False, teleport=True):
+    def __init__(self, qcb:QCB, dag:DAG, mapper:QCBMapper, graph=None, auto_route=True, verbose=False, teleport=True, event_driven=False, steiner_routing=False, priority=None, sink=None, reservations=False, negotiation_iterations=0, negotiation_time=None, parallel_workers=0, deadline=None, max_cycles=None, checkpoint=None, checkpoint_interval=1000, resume=None, snapshot_interval=None):
         '''
             Initialise the router
         '''
@@ -45,33 +62,134 @@ class QCBRouter:
 
         self.resolved: set[DAGNode] = set()
 
+        # Skips cycles in which no gates resolve
+        self.event_driven = event_driven
+        # Gates with more than two operands are routed as a single tree
+        self.steiner_routing = steiner_routing
+        # Called on the DAG to construct a sort key for waiting gates, by default gates are offered routes in the order they became ready
+        self.priority = priority
+        self.priority_key = None
+
+        # Blocked gates are not retried until a space-time search over the lock table finds a free route
+        # Maps each blocked gate to its addresses and the generation from which a route may be free
+        if reservations:
+            self.reservations = dict()
+        else:
+            self.reservations = None
+        self.blocked = []
+
+        # Ready gates are routed together with negotiated congestion before they are issued
+        # Iterations and wall time in seconds are budgets for each pass, a pass is only run if negotiation_iterations is set
+        self.negotiation_iterations = negotiation_iterations
+        self.negotiation_time = negotiation_time
+
+        # Candidate routes for independent ready gates are found in a pool of worker processes
+        if parallel_workers:
+            self.speculative_router = SpeculativeRouter(self.graph, parallel_workers)
+        else:
+            self.speculative_router = None
+
+        # Routing is aborted with a partial schedule once either budget is exceeded
+        # The deadline is a wall clock time as returned by time.time
+        self.deadline = deadline
+        self.max_cycles = max_cycles
+        self.start_time = None
+
+        # Router state is written to the checkpoint path every checkpoint_interval cycles
+        # Routing resumes from the state in the resume path, or from a (state, arrays) snapshot
+        self.checkpoint = checkpoint
+        self.checkpoint_interval = checkpoint_interval
+        self.last_checkpoint = 0
+        self.resume = resume
+
+        # Snapshots of the router state are held in memory every snapshot_interval cycles for incremental recompilation
+        self.snapshot_interval = snapshot_interval
+        self.snapshots = []
+        self.last_snapshot = 0
+
+        # Candidate routes from negotiation or speculation, validated when the gate is routed
+        self.candidate_routes = dict()
+
+        # Streaming state
+        self.streaming = False
+        self.stream_batch = 1
+        # Heap of gates that have been issued but not yet recorded in the schedule
+        self.completions = []
+        self.sequence = count()
+        # First layer of each active gate in layered routing, gates are recorded once they resolve
+        self.active_starts = dict()
+
         if teleport:
             self.teleport_injector = TeleportInjector(self)
         else:
             self.teleport_injector = None
 
-        self.layers = []
+        self.layers = LayerSchedule()
         if auto_route:
             # Fills layers
-            self.route()
+            self.route(sink=sink)
 
     def debug_print(self, *args, **kwargs):
         debug_print(*args, debug=self.verbose, **kwargs)
 
-    def route(self):
-        self.active_gates = set()
-        # Non-factory gates in the first layer are queued
-        waiting = list(map(lambda x: RouteBind(x, None), filter(lambda x: not x.is_factory(), self.dag.layers[0])))
-        resolved = self.resolved
+    def route(self, sink=None):
+        '''
+            Routes the DAG
+            If a sink is provided then each layer is passed to sink(cycle, bindings) once it has been finalised
+        '''
+        if sink is None:
+            consume(self.routing())
+        else:
+            for cycle, bindings in self.stream():
+                sink(cycle, bindings)
+
+    def stream(self, batch=1):
+        '''
+            Routes the DAG, yielding (cycle, ((gate, addresses), ...)) for each layer once no later decision can change it
+            Layers are finalised in batches of at least batch cycles, finalised layers and routes are released from the router
+            Factory rollbacks may write to past layers, so layers are held until every factory segment has been used past them
+            Teleports may also write to past layers, but are only injected into layers that have not been finalised
+        '''
+        self.stream_batch = batch
+        yield from self.routing(streaming=True)
+
+    def routing(self, streaming=False):
+        self.streaming = streaming
 
-        quash_flag = 0
         # Externs are not released to the allocator until all gates are ready
-        barrier = dict()
-        
+        self.barrier = ExternBarrier(self.dag)
+
+        if self.priority is not None:
+            self.priority_key = self.priority(self.dag)
+
+        self.start_time = time.time()
+
+        try:
+            if self.event_driven:
+                yield from self.route_event_driven()
+            else:
+                yield from self.route_layers()
+        finally:
+            if self.speculative_router is not None:
+                self.speculative_router.shutdown()
+
+        if self.streaming:
+            yield from self.finalise_layers(len(self.layers))
+
+    def route_layers(self):
+        '''
+            Cycles all active gates once per layer
+            Gates are recorded as intervals once they resolve
+        '''
+        waiting = self.initialise_routing()
+
         while len(waiting) > 0 or len(self.active_gates) > 0:
             curr_layer = len(self.layers)
+            self.check_budget(curr_layer)
+            # Each iteration cycles all active gates once
+            self.graph.generation += 1
             self.debug_print(waiting, self.active_gates)
-            self.layers.append(list())
+            self.layers.extend(curr_layer + 1)
 
             recently_resolved = list()
             if len(self.active_gates) > 0:
@@ -79,12 +197,12 @@ class QCBRouter:
                     gate.cycle()
                     if gate.resolved():
                         recently_resolved.append(gate)
+                        self.layers.add(gate, self.active_starts.pop(gate), curr_layer + 1, self.routes.get(AddrBind(gate), None))
 
                     # Release an extern allocation
                     if gate.get_symbol() == RESET_SYMBOL:
                         self.mapper.free(gate)
                         self.debug_print(f"\tReleasing Extern {gate}")
-                    self.layers[-1].append(gate)
 
                 if len(recently_resolved) == 0:
                     # No gates resolved, state of the system does not change, fastforward
@@ -92,152 +210,352 @@ class QCBRouter:
 
             self.active_gates = set(filter(lambda x: not x.resolved(), self.active_gates))
             for gate in recently_resolved:
-                resolved.add(gate) 
-                if gate.rotates():
-                    self.rotate(gate, self.mapper[gate])
-                # Should only trigger when the final antecedent is resolved
-                for antecedent in gate.antecedents():
-                    all_resolved = True
-
-                    for predicate_factory in antecedent.predicate_factories:
-                        # Yet to be allocated
-                        if predicate_factory not in resolved and predicate_factory not in self.active_gates:
-                            self.debug_print(f"\tCaught Factory {predicate_factory} from edge {gate} -> {antecedent}")
-                            waiting.append(RouteBind(predicate_factory, None))
-                            all_resolved = False
-                    if all_resolved is False:
-                          continue 
-
-                    for predicate in antecedent.predicates:
-                        if RouteBind(predicate, None) not in resolved:
-                            all_resolved = False
-                            break
-                    if all_resolved:
-                        waiting.append(RouteBind(antecedent, None))
+                self.resolve_gate(gate, waiting)
             
-            waiting.sort()
-            waiting_clear = list()
-            # Initially active gates
-            for gate in waiting:
-
-                # Barrier
-                # This involves some awful tree discovery, the workaround is more complex dependency resolution on 
-                # Externs
-                # Here we're first going to discover the extern gate, then backtrack and find all non-extern dependencies, and see if they've been resolved.
-                if len(extern_ante := [i for i in gate.scope if i.is_extern() and not i.is_factory()]) > 0:
-                    barrier_resolved = True
-                    for ext_symbol in extern_ante:
-                        if not barrier_resolved:
-                            continue
-                        
-                        if ext_symbol not in barrier:
-                            barrier[ext_symbol] = tuple()
-
-                            extern_gate = None
-                            for i in self.dag.gates:
-                                if i.is_extern() and ext_symbol in i.scope:
-                                    extern_gate = i
-                                    break
-                            if extern_gate is None:
-                                raise Exception("Missing Extern Gate")
-
-                            non_extern_predicates = []
-                            extern_predicates = [extern_gate]
-                            while len(extern_predicates) > 0:
-                                next_extern_predicates = []
-                                for extern_pred in extern_predicates:
-                                    for pred in extern_pred.predicates:
-                                        if ext_symbol in pred.scope:
-                                            next_extern_predicates.append(pred)
-                                        else:
-                                            non_extern_predicates.append(pred)
-                                extern_predicates = next_extern_predicates
-                            non_extern_predicates = list(map(lambda x: RouteBind(x, None), non_extern_predicates))
-                            barrier[ext_symbol] = non_extern_predicates 
-                            
-                        # Barrier already resolved
-                        if len(barrier[ext_symbol]) == 0:
-                            continue
-
-                        # Complexity of the barrier scales with O(number of IO in elements)
-                        # If the barrier is a tuple, this skips
-                        for barrier_gate in barrier[ext_symbol]: # TODO remove elements from the barrier as they are resolved
-                            if barrier_gate not in resolved:
-                                barrier_resolved = False
-                                break
-
-                        if barrier_resolved: # Once the barrier has been resolved all gates are released
-                            barrier[ext_symbol] = tuple()
-
-                        else:
-                            barrier_resolved = False
-                            continue
-
-                    if not barrier_resolved:
-                        # Gate caught on barrier, try next gate
-                        continue
+            waiting.sort(key=self.priority_key)
+            self.candidate_routes = dict()
+            if self.negotiation_iterations > 0:
+                self.negotiate(waiting)
+            if self.speculative_router is not None:
+                self.speculate(waiting)
+            issued = self.issue_gates(waiting, curr_layer)
+
+            # Locks are released in the iteration that the gate resolves
+            for gate in issued:
+                self.graph.release_locks(gate, self.graph.generation + max(1, gate.n_cycles() - gate.cycles_completed))
+            self.reserve_routes()
 
-                    
+            # Update the waiting list 
+            waiting.flush()
+            self.check_deadlock(waiting)
 
-                # The mapper will also check if it can do an extern allocation
-                # The mapper is constrained that if the next call to the mapper is a lock on the same gate that those same addresses should be locked
-                addresses = self.mapper[gate]
+            # Not the most elegant approach, could reorder some things
+            if not self.layers.occupied():
+                self.layers.pop()
 
-                # Could not obtain addresses for an extern 
-                if addresses is COULD_NOT_ALLOCATE: 
-                    self.debug_print(f"\tFailed to allocate extern for {gate}")
-                    continue
-                            
-                # Check that all addresses are free
-                if not all(self.probe_address(gate, address) for address in addresses):
-                    # Not all addresses are currently free, keep waiting
-                    continue
+            # Issued gates are first cycled in the next layer
+            start = len(self.layers)
+            for gate in issued:
+                self.active_starts[gate] = start
 
-                # Attempt to route between the gates
-                route_exists = True
-                if gate.non_local() or gate.n_ancillae() > 0:
-                    route_exists, route_addresses = self.find_route(gate, addresses)
-                    addresses = route_addresses
-                    if route_exists and curr_layer > 0 and self.teleport_injector is not None:
-                        self.teleport_injector(gate, addresses, curr_layer)
-                else:
-                    addresses = tuple(map(self.graph.__getitem__, addresses))
+            if self.streaming:
+                yield from self.finalise_layers()
+            self.checkpoint_routing()
+        return 
 
+    def route_event_driven(self):
+        '''
+            Event driven routing
+            Active gates are held on a heap keyed by the layer in which they resolve
+            Cycles in which no gate resolves do not change the state of the router and are skipped
+            Gates are recorded as intervals once they resolve
+        '''
+        waiting = self.initialise_routing()
 
-                # Route exists, all nodes are free
-                if route_exists:
-                    self.routes[AddrBind(gate)] = addresses 
-                    self.active_gates.add(gate)
+        # Heap of (resolving layer, sequence, first layer, n cycles, gate)
+        completions = self.completions
+        sequence = self.sequence
 
-                    # Rollback factories
-                    if gate.is_factory():
-                        first_free_cycle = self.mapper.first_free_cycle(gate)
-                        gate.cycles_completed = min(gate.n_cycles(), curr_layer - first_free_cycle - 1)
-                        for i in range(first_free_cycle, curr_layer + 1):
-                            self.layers[i].append(gate)
+        while len(waiting) > 0 or len(self.active_gates) > 0:
+            self.debug_print(waiting, self.active_gates)
+            if len(completions) > 0:
+                # Jump to the next layer in which a gate resolves
+                curr_layer = completions[0][0]
+                self.check_budget(curr_layer)
+                self.graph.generation = curr_layer
+                self.layers.extend(curr_layer + 1)
+                while len(completions) > 0 and completions[0][0] == curr_layer:
+                    _, _, start, n_cycles, gate = heappop(completions)
+                    gate.cycles_completed += n_cycles
+                    self.layers.add(gate, start, curr_layer + 1, self.routes.get(AddrBind(gate), None))
+
+                # Preserves the ordering of the active set 
+                recently_resolved = list()
+                for gate in self.active_gates:
+                    if gate.resolved():
+                        recently_resolved.append(gate)
 
-                    for patch in addresses:
-                        # This patch will be locked for this duration
-                        # Storing this information in advance helps with ALAP vs ASAP scheduling
-                        patch.last_used = curr_layer + gate.n_cycles()
+                        # Release an extern allocation
+                        if gate.get_symbol() == RESET_SYMBOL:
+                            self.mapper.free(gate)
+                            self.debug_print(f"\tReleasing Extern {gate}")
 
+                self.active_gates = set(filter(lambda x: not x.resolved(), self.active_gates))
+                for gate in recently_resolved:
+                    self.resolve_gate(gate, waiting)
+            else:
+                curr_layer = len(self.layers)
+                self.graph.generation = curr_layer
+
+            waiting.sort(key=self.priority_key)
+            self.candidate_routes = dict()
+            if self.negotiation_iterations > 0:
+                self.negotiate(waiting)
+            if self.speculative_router is not None:
+                self.speculate(waiting)
+            issued = self.issue_gates(waiting, curr_layer)
+
+            # Gates start on the first layer after any rolled back factories
+            # Intervals are recorded once the gate resolves
+            start = len(self.layers)
+            for gate in issued:
+                n_cycles = max(1, gate.n_cycles() - gate.cycles_completed)
+                heappush(completions, (start + n_cycles - 1, next(sequence), start, n_cycles, gate))
+                self.graph.release_locks(gate, start + n_cycles - 1)
+            self.reserve_routes()
+
+            waiting.flush()
+            self.check_deadlock(waiting)
+
+            if self.streaming:
+                yield from self.finalise_layers()
+            self.checkpoint_routing()
+        return
+
+    def initialise_routing(self):
+        '''
+            Sets up the waiting and active gates, restoring them from a checkpoint if one is being resumed
+        '''
+        self.active_gates = set()
+        self.active_starts = dict()
+        waiting = self.ready_queue = ReadyQueue(self.dag.gates)
+        self.completions = []
+        self.sequence = count()
+
+        if isinstance(self.resume, tuple):
+            restore_state(self, *self.resume)
+        elif self.resume is not None:
+            load_checkpoint(self, self.resume)
+        else:
+            # Non-factory gates in the first layer are queued
+            waiting.extend(map(lambda x: RouteBind(x, None), filter(lambda x: not x.is_factory(), self.dag.layers[0])))
+        self.last_checkpoint = len(self.layers)
+        self.last_snapshot = len(self.layers)
+        return waiting
 
-            # Update the waiting list 
-            waiting = list(filter(lambda x: x not in self.active_gates and x not in resolved and x not in waiting_clear, waiting))
+    def checkpoint_routing(self):
+        '''
+            Checkpoints the router once enough cycles have been routed since the last checkpoint or snapshot
+        '''
+        if self.checkpoint is not None and len(self.layers) - self.last_checkpoint >= self.checkpoint_interval:
+            save_checkpoint(self, self.checkpoint)
+            self.last_checkpoint = len(self.layers)
+        if self.snapshot_interval is not None and len(self.layers) - self.last_snapshot >= self.snapshot_interval:
+            self.snapshots.append((len(self.layers), checkpoint_state(self)))
+            self.last_snapshot = len(self.layers)
+
+    def finalised_cycle(self):
+        '''
+            Earliest layer that may still be written to
+        '''
+        cycle = min(len(self.layers), self.mapper.earliest_free_cycle())
+        # Teleports are never injected into finalised layers
+        # Issued gates are recorded from their first layer once they resolve
+        for _, _, start, _, _ in self.completions:
+            cycle = min(cycle, start)
+        for start in self.active_starts.values():
+            cycle = min(cycle, start)
+        return int(cycle)
+
+    def finalise_layers(self, stop=None):
+        '''
+            Yields finalised layers and releases them from the router
+        '''
+        if stop is None:
+            if len(self.layers) - self.layers.offset < self.stream_batch:
+                return
+            stop = self.finalised_cycle()
+            if stop - self.layers.offset < self.stream_batch:
+                return
+
+        layers, dropped = self.layers.finalise(stop)
+        for gate in dropped:
+            if gate not in self.active_gates:
+                self.routes.pop(AddrBind(gate), None)
+        yield from layers
+
+    def resolve_gate(self, gate, waiting):
+        '''
+            Marks a gate as resolved and queues any antecedents that are now ready 
+        '''
+        resolved = self.resolved
+        resolved.add(gate) 
+        self.barrier.resolve(gate.obj)
+        if gate.rotates():
+            self.rotate(gate, self.mapper[gate])
+        for antecedent in gate.antecedents():
+            n_unresolved = waiting.decrement(antecedent)
+            all_resolved = True
+
+            for predicate_factory in antecedent.predicate_factories:
+                # Yet to be allocated
+                if predicate_factory not in resolved and predicate_factory not in self.active_gates:
+                    self.debug_print(f"\tCaught Factory {predicate_factory} from edge {gate} -> {antecedent}")
+                    waiting.append(RouteBind(predicate_factory, None))
+                    all_resolved = False
+            if all_resolved is False:
+                  continue 
+
+            # Should only trigger when the final predicate is resolved
+            if n_unresolved == 0:
+                waiting.append(RouteBind(antecedent, None))
+
+    def barrier_resolved(self, gate):
+        '''
+            Externs are not released to the allocator until all gates are ready
+        '''
+        return self.barrier(gate.obj)
 
-            # Not the most elegant approach, could reorder some things
-            if len(self.layers[-1]) == 0:
-                # TODO Remove this later
-                quash_flag += 1
-                if quash_flag > 2:
-                    self.debug_print("Layer Quashed")
-                    #self.mapper.flush()
-                if quash_flag > 10:
-                    raise Exception("Deadlock")
-                self.layers.pop()
+    def progress(self):
+        '''
+            Statistics on how far routing has progressed
+        '''
+        return {
+            'cycles': len(self.layers),
+            'resolved': len(self.resolved),
+            'gates': len(self.dag.gates),
+            'waiting': len(self.ready_queue),
+            'active': len(self.active_gates),
+            'routes_abandoned': self.graph.routes_abandoned,
+            'time': time.time() - self.start_time
+        }
+
+    def check_budget(self, curr_layer):
+        '''
+            Aborts routing once the time or cycle budget is exceeded
+        '''
+        if self.max_cycles is not None and curr_layer >= self.max_cycles:
+            raise BudgetExceeded(f"Cycle budget of {self.max_cycles} exceeded", self)
+        if self.deadline is not None and time.time() > self.deadline:
+            raise BudgetExceeded("Deadline exceeded", self)
+
+    def check_deadlock(self, waiting):
+        '''
+            With no active gates no lock expires and no extern is released, so if nothing was issued then no waiting gate can ever be issued
+        '''
+        if len(self.active_gates) > 0 or len(waiting) == 0:
+            return
+        wait_for = self.wait_for_graph(waiting)
+        raise DeadlockError(wait_for, [gate.obj for gate in waiting], wait_for.find_cycle())
+
+    def wait_for_graph(self, waiting):
+        '''
+            Builds the wait for graph of the stalled gates
+            Gates wait on unresolved barrier predecessors, extern segments and locked patches
+            Segments wait on the gates that act on the extern symbol holding them and unresolved gates wait on their predicates
+        '''
+        wait_for = WaitForGraph()
+        resolved = set(map(lambda gate: id(gate.obj), self.resolved))
+
+        # Unresolved gates that act on each extern symbol
+        extern_gates = dict()
+        for dag_node in self.dag.gates:
+            if id(dag_node) not in resolved:
+                for symbol in dag_node.scope:
+                    if symbol.is_extern():
+                        extern_gates.setdefault(id(symbol.predicate), list()).append(dag_node)
+
+        for gate in waiting:
+            dag_node = gate.obj
+            if not self.barrier_resolved(gate):
+                for ext_symbol in self.barrier.gate_barriers[dag_node]:
+                    for predicate in self.barrier.unresolved[ext_symbol]:
+                        wait_for.add_edge(dag_node, predicate)
+                continue
+
+            addresses = self.mapper[gate]
+            if addresses is COULD_NOT_ALLOCATE:
+                for symbol in dag_node.scope:
+                    if not symbol.is_extern():
+                        continue
+                    for segment, holder in self.mapper.segment_maps[symbol.predicate].locks.items():
+                        if holder is not None and holder != symbol:
+                            wait_for.add_edge(dag_node, segment)
+                            for holding_gate in extern_gates.get(id(holder.predicate), tuple()):
+                                wait_for.add_edge(segment, holding_gate)
+                continue
+
+            for address in addresses:
+                patch = self.graph[address]
+                if not patch.probe(gate):
+                    wait_for.add_edge(dag_node, patch)
+                    wait_for.add_edge(patch, CriticalPath.dag_node(patch.lock_state))
+
+            if dag_node not in wait_for:
+                # Addresses are free, but no route exists
+                wait_for.add_edge(dag_node, 'route')
+
+        # Holding gates that are not waiting are yet to be ready
+        pending = [node for node in list(wait_for.nodes.values()) if isinstance(node, DAGNode) and node not in wait_for]
+        while len(pending) > 0:
+            dag_node = pending.pop()
+            for predicate in dag_node.predicates:
+                if predicate is dag_node or id(predicate) in resolved:
+                    continue
+                if id(predicate) not in wait_for.nodes:
+                    pending.append(predicate)
+                wait_for.add_edge(dag_node, predicate)
+        return wait_for
+
+    def issue_gates(self, waiting, curr_layer):
+        '''
+            Attempts to allocate and route each waiting gate
+            Returns the gates that were newly made active
+        '''
+        issued = list()
+        for gate in waiting:
+            if not self.barrier_resolved(gate):
+                # Gate caught on barrier, try next gate
+                continue
+
+            # The mapper will also check if it can do an extern allocation
+            # The mapper is constrained that if the next call to the mapper is a lock on the same gate that those same addresses should be locked
+            addresses = self.mapper[gate]
+
+            # Could not obtain addresses for an extern 
+            if addresses is COULD_NOT_ALLOCATE: 
+                self.debug_print(f"\tFailed to allocate extern for {gate}")
+                continue
+                        
+            # Check that all addresses are free
+            if not all(self.probe_address(gate, address) for address in addresses):
+                # Not all addresses are currently free, keep waiting
+                continue
+
+            # Attempt to route between the gates
+            route_exists = True
+            if gate.non_local() or gate.n_ancillae() > 0:
+                if self.reserved(gate, addresses):
+                    continue
+                route_exists, route_addresses = self.find_route(gate, addresses)
+                if not route_exists and self.reservations is not None:
+                    self.blocked.append((gate, addresses))
+                addresses = route_addresses
+                if route_exists and curr_layer > 0 and self.teleport_injector is not None:
+                    self.teleport_injector(gate, addresses, curr_layer)
             else:
-                quash_flag = 0
-        return 
+                addresses = tuple(map(self.graph.__getitem__, addresses))
+
+            # Route exists, all nodes are free
+            if route_exists:
+                self.routes[AddrBind(gate)] = addresses 
+                self.ready_queue.issue(gate)
+                if gate not in self.active_gates:
+                    self.active_gates.add(gate)
+                    self.graph.hold_locks(gate)
+                    issued.append(gate)
+
+                # Rollback factories
+                if gate.is_factory():
+                    first_free_cycle = self.mapper.first_free_cycle(gate)
+                    gate.cycles_completed = min(gate.n_cycles(), curr_layer - first_free_cycle - 1)
+                    self.layers.add(gate, first_free_cycle, curr_layer + 1, addresses)
+
+                for patch in addresses:
+                    # This patch will be locked for this duration
+                    # Storing this information in advance helps with ALAP vs ASAP scheduling
+                    patch.last_used = curr_layer + gate.n_cycles()
+        return issued
 
     def probe_address(self, dag_node, address):
         return self.graph[address].probe(dag_node)
@@ -246,9 +564,127 @@ class QCBRouter:
         paths = []
         graph_nodes = map(lambda address: self.graph[address], addresses)
         gate_symbol = gate.get_symbol()
-        orientations = [PatchGraphNode.Z_ORIENTED, PatchGraphNode.X_ORIENTED]
 
         # Find routes
+        if self.steiner_routing:
+            terminals = list(self.mapper.dag_node_to_symbol_map(gate))
+            if len(terminals) > 2:
+                tree = self.graph.steiner_route(
+                        [(self.graph[address], self.terminal_orientation(gate_symbol, symbol, address)) for symbol, address in terminals], 
+                        gate)
+                if tree is PatchGraph.NO_PATH_FOUND:
+                    return False, PatchGraph.NO_PATH_FOUND
+                paths += tree
+                return self.lock_route(gate, graph_nodes, paths)
+
+        # Candidate routes are used if they are still free
+        candidate = self.candidate_routes.pop(gate, None)
+        if candidate is not None and all(patch.probe(gate) for patch in candidate):
+            return self.lock_route(gate, graph_nodes, list(candidate))
+
+        for start_node, end_node, start_orientation, end_orientation in self.route_segments(gate):
+            path = self.graph.route(start_node, end_node, gate, start_orientation=start_orientation, end_orientation=end_orientation)
+            if path is not PatchGraph.NO_PATH_FOUND:
+                paths += path
+            else:
+                return False, PatchGraph.NO_PATH_FOUND
+
+        return self.lock_route(gate, graph_nodes, paths)
+
+    def routing_window(self, waiting):
+        '''
+            Waiting gates that may be routed in this generation, along with their addresses
+            Gates with extern operands are excluded as looking up their addresses allocates the extern
+        '''
+        window = []
+        for gate in waiting:
+            if not gate.non_local() or any(symbol.is_extern() for symbol in gate.scope):
+                continue
+            if self.steiner_routing and len(gate.scope) > 2:
+                continue
+            if not self.barrier_resolved(gate):
+                continue
+            addresses = self.mapper[gate]
+            if not all(self.probe_address(gate, address) for address in addresses) or self.reserved(gate, addresses):
+                continue
+            window.append((gate, addresses))
+        return window
+
+    def speculate(self, waiting):
+        '''
+            Finds candidate routes for the ready gates in parallel
+            Candidates from a negotiation pass take precedence
+        '''
+        window = self.routing_window(waiting)
+        if len(window) < 2:
+            return
+
+        requests = []
+        for key, (gate, addresses) in enumerate(window):
+            segments = [((start.y, start.x), (end.y, end.x), PatchGraphNode.ORIENTATIONS.index(start_orientation))
+                        for start, end, start_orientation, _ in self.route_segments(gate)]
+            requests.append((key, tuple(map(tuple, addresses)), segments))
+
+        for key, path in self.speculative_router(requests).items():
+            self.candidate_routes.setdefault(window[key][0], list(map(self.graph.__getitem__, path)))
+
+    def negotiate(self, waiting):
+        '''
+            Negotiated congestion pass over the gates that are ready to route
+            Gates are routed without regard for each other and patches used by more than one route become more expensive
+            Routes are ripped up and rerouted until no patch is shared or the budget is spent
+            Any routes that still share a patch are dropped in favour of the earlier gate in the waiting list
+        '''
+        window = [(gate, list(self.route_segments(gate))) for gate, _ in self.routing_window(waiting)]
+        if len(window) < 2:
+            return
+
+        graph = self.graph
+        graph.start_negotiation()
+        routes = dict()
+        start_time = time.time()
+        for _ in range(self.negotiation_iterations):
+            for gate, segments in window:
+                # Rip up
+                patches = routes.pop(gate, None)
+                if patches is not None:
+                    graph.occupy(set(patches), -1)
+
+                # Reroute
+                paths = []
+                for start_node, end_node, start_orientation, end_orientation in segments:
+                    path = graph.route(start_node, end_node, gate, start_orientation=start_orientation, end_orientation=end_orientation)
+                    if path is PatchGraph.NO_PATH_FOUND:
+                        break
+                    paths += path
+                else:
+                    routes[gate] = paths
+                    graph.occupy(set(paths))
+
+            shared = graph.present_costs > 1
+            if not shared.any():
+                break
+            graph.history_costs[shared] += 1
+            graph.present_factor *= 2
+            if self.negotiation_time is not None and time.time() - start_time > self.negotiation_time:
+                break
+        graph.end_negotiation()
+
+        claimed = set()
+        for gate, _ in window:
+            paths = routes.get(gate, None)
+            if paths is None or not claimed.isdisjoint(paths):
+                continue
+            claimed.update(paths)
+            self.candidate_routes[gate] = paths
+
+    def route_segments(self, gate):
+        '''
+            Pairs of operands joined by a gate in the order that they are routed
+        '''
+        gate_symbol = gate.get_symbol()
+        orientations = [PatchGraphNode.Z_ORIENTED, PatchGraphNode.X_ORIENTED]
+
         iterable = self.mapper.dag_node_to_symbol_map(gate)
         start = next(iterable)
         start_symbol, start_node = start
@@ -266,15 +702,59 @@ class QCBRouter:
             if end_symbol.is_extern():
                 end_orientation = end_node.orientation 
 
-            path = self.graph.route(start_node, end_node, gate, start_orientation=start_orientation, end_orientation=end_orientation)
-            if path is not PatchGraph.NO_PATH_FOUND:
-                paths += path
-            else:
-                return False, PatchGraph.NO_PATH_FOUND
+            yield start_node, end_node, start_orientation, end_orientation
             start_symbol = end_symbol
             start_node = end_node
             start_orientation = end_orientation
 
+    def reserved(self, gate, addresses):
+        '''
+            Checks if a blocked gate is still waiting on its reservation
+        '''
+        if self.reservations is None:
+            return False
+        reservation = self.reservations.get(gate, None)
+        if reservation is None:
+            return False
+        reserved_addresses, generation = reservation
+        if reserved_addresses == tuple(addresses) and generation > self.graph.generation:
+            return True
+        del self.reservations[gate]
+        return False
+
+    def reserve_routes(self):
+        '''
+            Finds the earliest generation at which each blocked gate may be routed
+            Called once all locks for this generation have an expiry
+            Each route segment must be free, so the latest segment is a lower bound for the gate
+        '''
+        for gate, addresses in self.blocked:
+            if self.steiner_routing and len(addresses) > 2:
+                # Tree routes are not bounded by the pairwise segments
+                continue
+            generation = self.graph.generation
+            for start_node, end_node, start_orientation, _ in self.route_segments(gate):
+                free, _ = self.graph.earliest_route(start_node, end_node, gate, start_orientation=start_orientation)
+                generation = max(generation, free)
+                if generation == float('inf'):
+                    break
+            if generation > self.graph.generation:
+                self.reservations[gate] = (tuple(addresses), generation)
+        self.blocked = []
+
+    def terminal_orientation(self, gate_symbol, symbol, address):
+        '''
+            Orientation of the join onto an operand
+        '''
+        # Orientation of extern IO nodes can be handled by the internal routing channel
+        if symbol.is_extern():
+            return self.graph[address].orientation
+        return [PatchGraphNode.Z_ORIENTED, PatchGraphNode.X_ORIENTED][symbol in gate_symbol.x]
+
+    def lock_route(self, gate, graph_nodes, paths):
+        '''
+            Adds ancillae to a route and locks all patches
+        '''
         # Add any ancillae
         for graph_node in graph_nodes:
             path = self.add_ancillae(gate, graph_node)
@@ -0,0 +1,171 @@
+from array import array
+
+class ScheduleLayer(list):
+    '''
+        View of a single layer of a schedule
+        Gates appended to the view are recorded in the schedule
+    '''
+    def __init__(self, schedule, index, gates):
+        super().__init__(gates)
+        self.schedule = schedule
+        self.index = index
+
+    def append(self, gate):
+        super().append(gate)
+        self.schedule.add(gate, self.index, self.index + 1)
+
+    def extend(self, gates):
+        for gate in gates:
+            self.append(gate)
+
+class LayerSchedule():
+    '''
+        Columnar interval store of routed layers
+        Each gate is recorded as a (start, end, addresses) interval, consecutive intervals of the same gate are merged
+        Layers are views that are built when they are requested and are not retained
+        Behaves as a list of layers for existing consumers
+    '''
+    def __init__(self):
+        self.n_layers = 0
+        # Interval columns, gate i occupies layers [starts[i], ends[i])
+        self.starts = array('q')
+        self.ends = array('q')
+        self.gates = []
+        self.addresses = []
+        # Index of the most recent interval of each gate, keyed on id
+        self.tails = dict()
+        # Last layer covered by any interval
+        self.last_end = 0
+        # Layers before this have been finalised and released
+        self.offset = 0
+
+    def add(self, gate, start, end, addresses=None):
+        '''
+            Gate occupies layers [start, end)
+        '''
+        if end <= start:
+            return
+        if start < self.offset:
+            raise Exception(f"Layer {start} has already been finalised")
+        self.n_layers = max(self.n_layers, end)
+        self.last_end = max(self.last_end, end)
+
+        tail = self.tails.get(id(gate), None)
+        if tail is not None and self.gates[tail] is gate and self.ends[tail] == start:
+            self.ends[tail] = end
+            if addresses is not None:
+                self.addresses[tail] = addresses
+            return
+
+        self.tails[id(gate)] = len(self.gates)
+        self.starts.append(start)
+        self.ends.append(end)
+        self.gates.append(gate)
+        self.addresses.append(addresses)
+
+    def extend(self, n_layers):
+        '''
+            Extends the schedule to n_layers, does not shrink the schedule
+        '''
+        self.n_layers = max(self.n_layers, n_layers)
+
+    def occupied(self, index=-1):
+        '''
+            Checks if any gate occupies a layer
+        '''
+        if index < 0:
+            index += self.n_layers
+        if index == self.n_layers - 1:
+            return self.last_end >= self.n_layers
+        return any(start <= index < end for start, end in zip(self.starts, self.ends))
+
+    def intervals(self):
+        '''
+            Yields (gate, start, end, addresses) for each recorded interval
+        '''
+        return zip(self.gates, self.starts, self.ends, self.addresses)
+
+    def finalise(self, stop):
+        '''
+            Releases all layers before stop
+            Returns a list of (index, ((gate, addresses), ...)) for the released layers and the gates of any intervals that were dropped
+        '''
+        stop = min(stop, self.n_layers)
+        if stop <= self.offset:
+            return [], []
+
+        layers = [(index, []) for index in range(self.offset, stop)]
+        for gate, start, end, addresses in self.intervals():
+            for index in range(start, min(end, stop)):
+                layers[index - self.offset][1].append((gate, addresses))
+
+        # Drop finished intervals, truncate the rest
+        kept = [idx for idx, end in enumerate(self.ends) if end > stop]
+        dropped = [gate for gate, end in zip(self.gates, self.ends) if end <= stop]
+        self.starts = array('q', (max(self.starts[idx], stop) for idx in kept))
+        self.ends = array('q', (self.ends[idx] for idx in kept))
+        self.gates = [self.gates[idx] for idx in kept]
+        self.addresses = [self.addresses[idx] for idx in kept]
+        self.tails = {id(gate): idx for idx, gate in enumerate(self.gates)}
+        self.offset = stop
+
+        return [(index, tuple(bindings)) for index, bindings in layers], dropped
+
+    def layer(self, index):
+        return ScheduleLayer(self, index, [gate for gate, start, end in zip(self.gates, self.starts, self.ends) if start <= index < end])
+
+    def append(self, layer):
+        self.n_layers += 1
+        self[-1].extend(layer)
+
+    def pop(self):
+        '''
+            Removes the last layer, any intervals covering this layer are truncated
+        '''
+        layer = self[-1]
+        self.n_layers -= 1
+        if len(layer) > 0:
+            for idx, end in enumerate(self.ends):
+                if end > self.n_layers:
+                    self.ends[idx] = self.n_layers
+            self.last_end = self.n_layers
+        return list(layer)
+
+    def __len__(self):
+        return self.n_layers
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(self.n_layers)
+            if start < self.offset:
+                raise IndexError(f"Layer {start} has already been finalised")
+            return [self.layer(i) for i in range(start, stop, step)]
+
+        if index < 0:
+            index += self.n_layers
+        if index < 0 or index >= self.n_layers:
+            raise IndexError(f"Layer {index} out of range for schedule of {self.n_layers} layers")
+        if index < self.offset:
+            raise IndexError(f"Layer {index} has already been finalised")
+        return self.layer(index)
+
+    def __iter__(self):
+        '''
+            Sweeps the intervals in order of their start layer
+            Gates in each layer are ordered by when they were recorded
+        '''
+        order = sorted(range(len(self.gates)), key=self.starts.__getitem__)
+        active = []
+        position = 0
+        for index in range(self.offset, self.n_layers):
+            n_active = len(active)
+            while position < len(order) and self.starts[order[position]] <= index:
+                active.append(order[position])
+                position += 1
+            if len(active) > n_active:
+                active.sort()
+            active = [idx for idx in active if self.ends[idx] > index]
+            yield ScheduleLayer(self, index, [self.gates[idx] for idx in active])
+
+    def __repr__(self):
+        return f"LayerSchedule: {self.n_layers} layers"
@@ -0,0 +1,159 @@
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from surface_code_routing.route_search import ABANDONED, a_star, manhattan, field_heuristic, reverse_adjacency, distance_field
+
+# Static tables for worker processes, set once by the pool initialiser
+WORKER_STATE = {}
+
+def init_worker(route_mask, adjacency, distance_heuristic=False, distance_dtype=np.uint32):
+    WORKER_STATE['route_mask'] = route_mask
+    WORKER_STATE['adjacency'] = adjacency
+    WORKER_STATE['distance_heuristic'] = distance_heuristic
+    WORKER_STATE['distance_dtype'] = distance_dtype
+    WORKER_STATE['reverse_adjacency'] = None
+    WORKER_STATE['distance_fields'] = dict()
+
+def worker_heuristic(end):
+    '''
+        Heuristic of the patch graph towards the end patch, distance fields are cached by each worker
+    '''
+    if not WORKER_STATE['distance_heuristic']:
+        return lambda coordinates: manhattan(coordinates, end)
+
+    dtype = WORKER_STATE['distance_dtype']
+    field = WORKER_STATE['distance_fields'].get(end, None)
+    if field is None:
+        if WORKER_STATE['reverse_adjacency'] is None:
+            WORKER_STATE['reverse_adjacency'] = reverse_adjacency(WORKER_STATE['adjacency'], WORKER_STATE['route_mask'].shape)
+        field = WORKER_STATE['distance_fields'][end] = distance_field(end, WORKER_STATE['reverse_adjacency'], WORKER_STATE['route_mask'], dtype)
+    return field_heuristic(field, np.iinfo(dtype).max)
+
+def route_snapshot(start, end, start_orientation, blocked, orientations, costs=None, max_expansions=None):
+    '''
+        Routes over a snapshot of the patch graph with the same search as PatchGraph.a_star
+        Blocked patches are those that would fail a lock probe
+    '''
+    heuristic = worker_heuristic(end)
+    if heuristic(start) == float('inf'):
+        return None
+    path = a_star(start, end, WORKER_STATE['adjacency'], WORKER_STATE['route_mask'], orientations, blocked, heuristic,
+                  costs=costs, start_orientation=start_orientation, max_expansions=max_expansions)
+    if path is ABANDONED:
+        return None
+    return path
+
+def route_chunk(blocked, orientations, requests, costs=None, max_expansions=None):
+    '''
+        Routes a chunk of gates in order
+        Each routed gate blocks its patches for the gates that follow it in the chunk
+    '''
+    blocked = blocked.copy()
+    results = []
+    for key, terminals, segments in requests:
+        if any(blocked[terminal] for terminal in terminals):
+            continue
+        paths = []
+        for start, end, start_orientation in segments:
+            path = route_snapshot(start, end, start_orientation, blocked, orientations, costs=costs, max_expansions=max_expansions)
+            if path is None:
+                break
+            paths += path
+        else:
+            for patch in paths:
+                blocked[patch] = True
+            results.append((key, paths))
+    return results
+
+def bounding_box(coordinates, margin=1):
+    ys = [y for y, _ in coordinates]
+    xs = [x for _, x in coordinates]
+    return min(ys) - margin, min(xs) - margin, max(ys) + margin, max(xs) + margin
+
+def overlaps(a, b):
+    return a[0] <= b[2] and b[0] <= a[2] and a[1] <= b[3] and b[1] <= a[3]
+
+def clusters(boxes):
+    '''
+        Groups indices of overlapping bounding boxes
+        Clusters are ordered by their first member
+    '''
+    parent = list(range(len(boxes)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for i in range(len(boxes)):
+        for j in range(i):
+            if overlaps(boxes[i], boxes[j]):
+                parent[find(i)] = find(j)
+
+    groups = dict()
+    for i in range(len(boxes)):
+        groups.setdefault(find(i), []).append(i)
+    return list(groups.values())
+
+class SpeculativeRouter():
+    '''
+        Routes independent gates in a process pool against a read only snapshot of the lock state
+        Gates are partitioned into clusters by overlapping bounding boxes and clusters are split between workers
+        Routes are candidates only, they are validated and committed serially by the router
+    '''
+    def __init__(self, graph, n_workers):
+        self.graph = graph
+        self.n_workers = n_workers
+        self.pool = None
+
+    def start(self):
+        graph = self.graph
+        initargs = (graph.route_mask, graph.coordinate_adjacency, graph.distance_heuristic, graph.distance_dtype)
+        self.pool = ProcessPoolExecutor(max_workers=self.n_workers, initializer=init_worker, initargs=initargs)
+
+    def shutdown(self):
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+
+    def snapshot(self):
+        '''
+            Patches that fail a lock probe for a gate that holds no locks
+        '''
+        graph = self.graph
+        expiry = np.array(graph.gate_expiry, dtype=np.float64)[np.array(graph.lock_gates, dtype=np.int64)]
+        return expiry[graph.locks] > graph.generation
+
+    def __call__(self, requests):
+        '''
+            requests is a list of (key, terminals, segments) in commit order
+            Returns a dict of key to candidate path coordinates
+        '''
+        groups = clusters([bounding_box(terminals) for _, terminals, _ in requests])
+        if len(groups) < 2:
+            return dict()
+
+        if self.pool is None:
+            self.start()
+
+        # Largest clusters are placed first, each chunk preserves commit order
+        chunks = [[] for _ in range(min(self.n_workers, len(groups)))]
+        for group in sorted(groups, key=len, reverse=True):
+            min(chunks, key=len).extend(group)
+
+        # Searches are bounded as they would be in the router
+        graph = self.graph
+        max_expansions = None
+        if graph.max_expansions is not None and graph.locks_held():
+            max_expansions = graph.max_expansions
+
+        blocked = self.snapshot()
+        costs = graph.costs()
+        futures = [self.pool.submit(route_chunk, blocked, graph.orientations, [requests[i] for i in sorted(chunk)], costs=costs, max_expansions=max_expansions) for chunk in chunks]
+
+        candidates = dict()
+        for future in futures:
+            candidates.update(future.result())
+        return candidates
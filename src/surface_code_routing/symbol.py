@@ -1,3 +1,5 @@
+import copy
+
 def symbol_map(*args):
     return map(symbol_resolve, args)
 
@@ -100,6 +102,12 @@ class Symbol(object):
     def satisfies(self, comparator):
         return self.symbol == comparator.symbol
 
+    def satisfies_key(self):
+        '''
+            Symbols with equal keys may satisfy each other
+        '''
+        return self.symbol
+
     def __hash__(self):
         return hash(self.symbol)
 
@@ -192,13 +200,25 @@ class ExternSymbol(Symbol):
         return self.__repr__()
 
     def __hash__(self):
-        return id(self.singleton)
+        return hash(id(self.predicate))
 
     def __eq__(self, other):
         if not isinstance(other, ExternSymbol):
             return False
         return id(self.predicate) == id(other.predicate)
 
+    def __deepcopy__(self, memo):
+        '''
+            The hash depends on the predicate, so it is copied before the io dicts that hold the symbol
+        '''
+        symbol = type(self).__new__(type(self))
+        memo[id(self)] = symbol
+        symbol.predicate = copy.deepcopy(self.predicate, memo)
+        for attribute, value in self.__dict__.items():
+            if attribute != 'predicate':
+                symbol.__dict__[attribute] = copy.deepcopy(value, memo)
+        return symbol
+
     def __len__(self):
         return 1
 
@@ -216,6 +236,11 @@ class ExternSymbol(Symbol):
             return self.predicate.symbol == other.predicate.predicate
         return self.predicate.symbol == other.predicate.symbol
 
+    def satisfies_key(self):
+        if isinstance(self.predicate, ExternSymbol):
+            return self.predicate.predicate.symbol
+        return self.predicate.symbol
+
     def is_extern(self):
         return True
 
@@ -0,0 +1,157 @@
+from surface_code_routing.dag import DAG
+from surface_code_routing.instructions import INIT, CNOT, Hadamard
+from surface_code_routing.symbol import Symbol
+from surface_code_routing.lib_instructions import T_Factory, T
+from surface_code_routing.compiled_qcb import compile_qcb, recompile_qcb, resume_snapshot
+from surface_code_routing.router import BudgetExceeded
+from surface_code_routing.checkpoint import save_checkpoint, checkpoint_state, CheckpointError
+
+import os
+import tempfile
+import unittest
+
+class CheckpointTest(unittest.TestCase):
+
+    def build(self, n_blocks=6):
+        dag = DAG(Symbol('Test'))
+        dag.add_gate(INIT('a', 'b', 'c', 'd'))
+        for i in range(n_blocks):
+            dag.add_gate(CNOT('a', 'b'))
+            dag.add_gate(T('c'))
+            dag.add_gate(CNOT('c', 'd'))
+            dag.add_gate(Hadamard('a'))
+        return dag
+
+    def stop(self, max_cycles, **router_kwargs):
+        with self.assertRaises(BudgetExceeded) as context:
+            compile_qcb(self.build(), 12, 12, T_Factory(), router_kwargs={'max_cycles':max_cycles, **router_kwargs})
+        return context.exception.router
+
+    @staticmethod
+    def state(router):
+        segment_maps = [segment_map for segment_map in router.mapper.segment_maps.values() if hasattr(segment_map, 'checkpoint')]
+        return (
+            router.graph.generation,
+            len(router.layers),
+            sorted((repr(gate.obj), start, end) for gate, start, end, _ in router.layers.intervals() if 'Teleport' not in repr(gate.obj)),
+            [repr(gate.obj) for gate in router.ready_queue],
+            sorted(repr(gate.obj) for gate in router.active_gates),
+            len(router.resolved),
+            sorted((patch.y, patch.x, repr(patch.lock_state.obj)) for patch in router.graph.graph.flatten() if not patch.probe(object())),
+            sum(lock is not None for segment_map in segment_maps for lock in segment_map.locks.values()),
+            router.graph.orientations.tolist(),
+        )
+
+    @staticmethod
+    def check_schedule(router, dag):
+        '''
+            Every gate of the DAG is routed after its predicates and no two gates share a patch in any layer
+        '''
+        intervals = dict()
+        occupied = dict()
+        for gate, start, end, addresses in router.layers.intervals():
+            if 'Teleport' in repr(gate.obj):
+                continue
+            first, last = intervals.get(id(gate.obj), (start, end))
+            intervals[id(gate.obj)] = (min(first, start), max(last, end))
+            for layer in range(start, end):
+                for patch in (addresses or ()):
+                    assert occupied.setdefault((layer, patch.y, patch.x), id(gate.obj)) == id(gate.obj)
+
+        assert len(router.resolved) == len(dag.gates)
+        assert len(router.ready_queue) == 0
+        assert all(id(gate) in intervals for gate in dag.gates)
+        for gate in dag.gates:
+            for predicate in gate.predicates:
+                assert intervals[id(predicate)][1] <= intervals[id(gate)][0]
+
+    @staticmethod
+    def layers(router, stop=None):
+        # Teleports may be injected into earlier layers by later gates
+        return [sorted(repr(gate) for gate in layer if 'Teleport' not in repr(gate)) for layer in router.layers[:stop]]
+
+    def test_resume(self):
+        for event_driven in (False, True):
+            with tempfile.TemporaryDirectory() as directory:
+                path = os.path.join(directory, 'router.npz')
+                stopped = self.stop(20, event_driven=event_driven)
+                save_checkpoint(stopped, path)
+
+                # Resuming with the same budget stops before any state changes
+                resumed = self.stop(20, event_driven=event_driven, resume=path)
+                assert self.state(resumed) == self.state(stopped)
+
+                compiled = compile_qcb(self.build(), 12, 12, T_Factory(), router_kwargs={'event_driven':event_driven, 'resume':path})
+                assert len(compiled.router.resolved) == len(compiled.dag.gates)
+                assert len(compiled.router.ready_queue) == 0
+
+    def test_register_mismatch(self):
+        state, arrays = checkpoint_state(self.stop(20))
+
+        # Swapping two registers leaves the patch states unchanged
+        reg_a, reg_b = list(state['registers'])[:2]
+        state['registers'][reg_a], state['registers'][reg_b] = state['registers'][reg_b], state['registers'][reg_a]
+        with self.assertRaises(CheckpointError):
+            compile_qcb(self.build(), 12, 12, T_Factory(), router_kwargs={'resume':(state, arrays)})
+
+    def test_interval(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'router.npz')
+            router = self.stop(25, checkpoint=path, checkpoint_interval=10)
+            assert router.last_checkpoint >= 10
+            assert os.path.exists(path)
+            assert not os.path.exists(f"{path}.tmp")
+
+    def test_recompile(self):
+        compiled = compile_qcb(self.build(), 12, 12, T_Factory(), router_kwargs={'snapshot_interval':5})
+        assert len(compiled.router.snapshots) > 0
+
+        def edited():
+            # The second half of the DAG is edited
+            dag = self.build(n_blocks=4)
+            dag.add_gate(Hadamard('b'))
+            for i in range(2):
+                dag.add_gate(CNOT('a', 'b'))
+                dag.add_gate(T('c'))
+            return dag
+
+        for build in (lambda: self.build(n_blocks=8), edited):
+            # Edits after the start of the routing do not affect it
+            dag = build()
+            snapshot = resume_snapshot(compiled.router, compiled.dag, dag)
+            assert snapshot is not None
+
+            recompiled = recompile_qcb(compiled, dag)
+            assert recompiled.qcb.allocator is compiled.qcb.allocator
+            assert recompiled.router.resume is not None
+
+            # Routing order is not deterministic between runs, so the resumed schedule is checked rather than compared to a fresh routing
+            self.check_schedule(recompiled.router, dag)
+            cycle = snapshot[0]['layers']['n_layers']
+            assert self.layers(recompiled.router, cycle) == self.layers(compiled.router, cycle)
+
+    def test_recompile_rotations(self):
+        def build(n_blocks=4, edit=False):
+            dag = DAG(Symbol('Test'))
+            registers = [f'r{i}' for i in range(10)]
+            dag.add_gate(INIT(*registers))
+            for i in range(n_blocks):
+                if edit and i == 2:
+                    dag.add_gate(Hadamard('r3'))
+                for j in range(10):
+                    dag.add_gate(CNOT(registers[j], registers[(j + 1) % 10]))
+                    dag.add_gate(Hadamard(registers[j]))
+            return dag
+
+        compiled = compile_qcb(build(), 5, 6, router_kwargs={'snapshot_interval':5})
+        assert any(repr(gate).startswith('<Rotation') for gate in compiled.dag.gates)
+
+        # Edited DAGs are compared to the previous DAG once their rotations have been injected
+        for build_kwargs in ({'n_blocks':6}, {'edit':True}):
+            dag = build(**build_kwargs)
+            recompiled = recompile_qcb(compiled, dag)
+            assert recompiled.router.resume is not None
+
+            self.check_schedule(recompiled.router, dag)
+            cycle = recompiled.router.resume[0]['layers']['n_layers']
+            assert self.layers(recompiled.router, cycle) == self.layers(compiled.router, cycle)
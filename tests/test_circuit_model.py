@@ -0,0 +1,207 @@
+from surface_code_routing.dag import DAG
+from surface_code_routing.instructions import INIT, CNOT
+from surface_code_routing.symbol import Symbol
+
+from surface_code_routing.qcb import QCB, SCPatch
+from surface_code_routing.allocator import Allocator
+from surface_code_routing.qcb_graph import QCBGraph
+from surface_code_routing.qcb_tree import QCBTree
+from surface_code_routing.router import QCBRouter
+from surface_code_routing.mapper import QCBMapper
+from surface_code_routing.circuit_model import PatchGraph, PatchGraphNode
+from surface_code_routing.bind import RouteBind
+
+import unittest
+
+class PatchGraphTest(unittest.TestCase):
+
+    def patch_graph(self):
+        dag = DAG(Symbol('Test'))
+        dag.add_gate(INIT('a', 'b'))
+        dag.add_gate(CNOT('a', 'b'))
+
+        qcb = QCB(4, 4, dag)
+        allocator = Allocator(qcb)
+
+        graph = QCBGraph(qcb)
+        tree = QCBTree(graph)
+        mapper = QCBMapper(dag, tree)
+
+        circuit_model = PatchGraph(qcb.shape, mapper, None)
+        router = QCBRouter(qcb, dag, mapper, graph=circuit_model, auto_route=False)
+        return circuit_model, router
+
+    def test_node_views(self):
+        circuit_model, _ = self.patch_graph()
+        node = circuit_model[0, 0]
+
+        assert node.orientation is PatchGraphNode.X_ORIENTED
+        node.rotate()
+        assert node.orientation is PatchGraphNode.Z_ORIENTED
+        assert circuit_model.orientations[0, 0] == PatchGraphNode.ORIENTATIONS.index(PatchGraphNode.Z_ORIENTED)
+
+        node.last_used = 5
+        assert circuit_model.last_used[0, 0] == 5
+        assert circuit_model[0, 0].last_used == 5
+
+        # States are preserved by identity
+        for node in circuit_model.graph.flatten():
+            assert (node.state is SCPatch.ROUTE) == (circuit_model.states[node.y, node.x] == PatchGraph.ROUTE)
+        assert any(node.state is not SCPatch.ROUTE for node in circuit_model.graph.flatten())
+
+    def test_locks(self):
+        circuit_model, router = self.patch_graph()
+        node = circuit_model[0, 0]
+        gate_a, gate_b = object(), object()
+
+        assert node.lock_state is PatchGraphNode.INITIAL_LOCK_STATE
+        assert node.lock(gate_a)
+        assert node.lock_state is gate_a
+
+        # Locks are only held until the gate expires
+        assert node.probe(gate_b)
+        circuit_model.hold_locks(gate_a)
+        assert not node.probe(gate_b)
+        assert node.probe(gate_a)
+        assert not node.probe(gate_a, unique=True)
+        assert not node.lock(gate_b)
+
+        circuit_model.release_locks(gate_a, circuit_model.generation + 2)
+        circuit_model.generation += 1
+        assert not node.probe(gate_b)
+        circuit_model.generation += 1
+        assert node.lock(gate_b)
+        assert node.lock_state is gate_b
+
+    def test_shared_gate_locks(self):
+        circuit_model, _ = self.patch_graph()
+        dag = DAG(Symbol('Test'))
+        dag.add_gate(INIT('a'))
+        dag_node = dag.gates[0]
+        gate_a, gate_b = RouteBind(dag_node, None), RouteBind(dag_node, None)
+
+        # Bindings of the same gate share a lock expiry
+        assert circuit_model[0, 0].lock(gate_b)
+        circuit_model.hold_locks(gate_a)
+        assert not circuit_model[0, 0].probe(object())
+
+        # Locks are owned by the gate rather than the binding that took them
+        assert circuit_model[0, 0].probe(gate_a)
+        assert not circuit_model[0, 0].probe(gate_a, unique=True)
+        assert circuit_model.free_cycle(0, 0, gate_a) == circuit_model.generation
+
+    def test_adjacency_tables(self):
+        circuit_model, _ = self.patch_graph()
+        for (bound, horizontal, vertical), table in circuit_model.adjacency.items():
+            for node in circuit_model.graph.flatten():
+                coordinates = circuit_model.adjacent_coordinates(node.y, node.x, bound, horizontal, vertical)
+                assert list(table[node.y][node.x]) == [circuit_model[coord] for coord in coordinates]
+
+        node = circuit_model[0, 0]
+        assert tuple(node.adjacent(None, probe=False)) == circuit_model.adjacency[True, True, True][0][0]
+
+    def test_distance_field(self):
+        circuit_model, _ = self.patch_graph()
+        route_patches = [patch for patch in circuit_model.graph.flatten() if patch.state is SCPatch.ROUTE]
+        start, end = route_patches[0], route_patches[-1]
+        gate = object()
+
+        field = circuit_model.distance_field(end)
+        assert field[end.y, end.x] == 0
+        assert field.dtype == circuit_model.distance_dtype
+        for patch in route_patches:
+            assert field[patch.y, patch.x] >= abs(patch.x - end.x) + abs(patch.y - end.y)
+
+        path = circuit_model.route(start, end, gate)
+        distance_path = circuit_model.route(start, end, gate, heuristic=circuit_model.distance)
+        assert len(path) == len(distance_path) == field[start.y, start.x] + 1
+
+    def test_earliest_route(self):
+        circuit_model, _ = self.patch_graph()
+        route_patches = [patch for patch in circuit_model.graph.flatten() if patch.state is SCPatch.ROUTE]
+        start, end = route_patches[0], route_patches[-1]
+        gate_a, gate_b = object(), object()
+
+        path = circuit_model.route(start, end, gate_b)
+        free, earliest_path = circuit_model.earliest_route(start, end, gate_b)
+        assert free == circuit_model.generation
+        assert len(earliest_path) == len(path)
+
+        # Block every route patch until gate_a expires
+        for patch in route_patches[1:]:
+            assert patch.lock(gate_a)
+        circuit_model.hold_locks(gate_a)
+        assert circuit_model.route(start, end, gate_b) is PatchGraph.NO_PATH_FOUND
+        assert circuit_model.earliest_route(start, end, gate_b)[0] == float('inf')
+
+        circuit_model.release_locks(gate_a, circuit_model.generation + 3)
+        free, earliest_path = circuit_model.earliest_route(start, end, gate_b)
+        assert free == circuit_model.generation + 3
+        assert len(earliest_path) == len(path)
+
+        circuit_model.generation = free
+        assert circuit_model.route(start, end, gate_b) is not PatchGraph.NO_PATH_FOUND
+
+    def test_negotiated_costs(self):
+        circuit_model, _ = self.patch_graph()
+        route_patches = [patch for patch in circuit_model.graph.flatten() if patch.state is SCPatch.ROUTE]
+        start, end = route_patches[0], route_patches[-1]
+        gate = object()
+        assert all(patch.cost() == 1 for patch in route_patches)
+
+        path = circuit_model.route(start, end, gate)
+        circuit_model.start_negotiation()
+        circuit_model.occupy(path)
+        assert all(patch.cost() == 2 for patch in path)
+
+        # Shared patches are avoided where an alternative exists
+        circuit_model.history_costs[path[1].y, path[1].x] += 10
+        assert path[1] not in circuit_model.route(start, end, gate)
+
+        circuit_model.end_negotiation()
+        assert all(patch.cost() == 1 for patch in route_patches)
+
+    def test_route_cache(self):
+        circuit_model, _ = self.patch_graph()
+        circuit_model.route_cache_size = 1
+        route_patches = [patch for patch in circuit_model.graph.flatten() if patch.state is SCPatch.ROUTE]
+        start, end = route_patches[0], route_patches[-1]
+        gate_a, gate_b = object(), object()
+
+        path = circuit_model.route(start, end, gate_a)
+        assert circuit_model.route_cache_misses == 1
+        assert circuit_model.route(start, end, gate_b) == path
+        assert circuit_model.route_cache_hits == 1
+
+        # Blocked routes fall back to A*
+        path[1].lock(gate_a)
+        circuit_model.hold_locks(gate_a)
+        detour = circuit_model.route(start, end, gate_b)
+        assert path[1] not in detour
+        assert circuit_model.route_cache_misses == 2
+
+        # Least recently used entries are evicted
+        circuit_model.route(end, start, gate_b)
+        # Route lengths are evicted with their routes
+        assert len(circuit_model.route_cache) == 1
+        shortest, _ = circuit_model.route_cache[(end.y, end.x, start.y, start.x, end.orientation, None)]
+        assert shortest == len(path)
+
+    def test_max_expansions(self):
+        circuit_model, router = self.patch_graph()
+        circuit_model.max_expansions = 1
+        route_patches = [patch for patch in circuit_model.graph.flatten() if patch.state is SCPatch.ROUTE]
+        start, end = route_patches[0], route_patches[-1]
+        gate = object()
+
+        # Waiting cannot help if no gate holds locks
+        path = circuit_model.route(start, end, gate)
+        assert path is not PatchGraph.NO_PATH_FOUND
+
+        router.active_gates.add(object())
+        assert circuit_model.route(start, end, gate) is PatchGraph.NO_PATH_FOUND
+        assert circuit_model.routes_abandoned == 1
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,15 +1,22 @@
 from surface_code_routing.dag import DAG
+from surface_code_routing.dag_core import DAGCore
 from surface_code_routing.symbol import Symbol
 
 from surface_code_routing.instructions import INIT, CNOT
-from surface_code_routing.lib_instructions import T, T_Factory
+from surface_code_routing.lib_instructions import T, T_Factory, Toffoli
 from surface_code_routing.scope import Scope
+from surface_code_routing.qcb import QCB
 
 
 from surface_code_routing.scope import Scope
 from surface_code_routing.symbol import Symbol, ExternSymbol
+import sys
+import copy
+import random
 import unittest
 
+import numpy as np
+
 class ScopeTest(unittest.TestCase):
     def test_unroll(self):
         g = DAG(Symbol('tst'))
@@ -101,6 +108,152 @@ class ScopeTest(unittest.TestCase):
         assert(extern_symbols[0].satisfies(t_2))
         assert(extern_symbols[0] !=  t_2)
 
+class DAGCoreTest(unittest.TestCase):
+    def test_core(self):
+        g = DAG(Symbol('tst'))
+        g.add_gate(INIT('a', 'b', 'c'))
+        g.add_gate(CNOT('a', 'b'))
+        g.add_gate(T('c'))
+        g.add_gate(CNOT('c', 'a', 'b'))
+
+        core = g.core
+        assert(len(core) == len(g.gates))
+        for index, gate in enumerate(g.gates):
+            assert(core.index(gate) == index)
+            assert(list(core.predecessors(index)) == sorted(core.index(predicate) for predicate in gate.predicates))
+            assert(list(core.successors(index)) == sorted(core.index(antecedent) for antecedent in gate.antecedents))
+            assert(core.layer[index] == gate.layer)
+            assert(core.slack[index] == gate.slack)
+
+            view = core.view(index)
+            assert(view.node() is gate)
+            assert(view.is_factory() == gate.is_factory())
+            assert(view.non_local() == gate.non_local())
+            assert(set(view.operands()) == set(gate.symbol.io))
+
+        for ids, layer in zip(core.layers(), g.layers):
+            assert(set(ids.tolist()) == set(map(core.index, layer)))
+
+        # Gates added after the core was built are written into it
+        g.add_gate(CNOT('b', 'c'))
+        g.add_gate(T('b'))
+        assert(len(core) == len(g.gates))
+        rebuilt = DAGCore()
+        rebuilt.rebuild(g.gates)
+        for column in ('layer', 'slack', 'n_cycles', 'flags', 'pred_offsets', 'pred_indices'):
+            assert((getattr(core, column).values() == getattr(rebuilt, column).values()).all())
+
+        # Rewired DAGs drop their core until it is next requested
+        g.invalidate_core()
+        assert(g.core is not core)
+        assert(len(g.core) == len(g.gates))
+
+    def test_proximity(self):
+        g = DAG(Symbol('tst'))
+        g.add_gate(INIT('a', 'b', 'c', 'd'))
+        g.add_gate(CNOT('a', 'b'))
+        g.add_gate(CNOT('c', 'd'))
+
+        prox, lookup = g.calculate_logical_proximity()
+        a, b, c, d = (lookup[Symbol(i)] for i in 'abcd')
+        assert(prox.sum() == 4)
+        assert(prox[a, b] == prox[b, a] == prox[c, d] == prox[d, c] == 1)
+
+        # Both CNOTs share a layer
+        conj, lookup = g.calculate_logical_conjestion()
+        assert(conj.sum() == 8)
+        assert(all(conj[i, j] == conj[j, i] == 1 for i in (a, b) for j in (c, d)))
+
+        sparse_conj, _ = g.calculate_logical_conjestion(sparse=True)
+        assert(len(sparse_conj) == 8)
+        assert((sparse_conj.todense() == conj).all())
+
+    def test_sparse_counts(self):
+        rng = random.Random(0)
+        registers = [f'r{i}' for i in range(12)]
+        g = DAG(Symbol('tst'))
+        g.add_gate(INIT(*registers))
+        for _ in range(100):
+            a, b, c = rng.sample(registers, 3)
+            gate = rng.choice((CNOT(a, b), CNOT(a, b, c), T(a), Toffoli(a, b, c)))
+            g.add_gate(gate)
+
+        factory = T_Factory()
+        g.compile(2, *(factory.instantiate() for _ in range(2)))
+
+        for calculate in (g.calculate_logical_proximity, g.calculate_logical_conjestion, g.calculate_physical_proximity, g.calculate_physical_conjestion):
+            dense, lookup = calculate()
+            counts, sparse_lookup = calculate(sparse=True)
+            assert(sparse_lookup == lookup)
+            assert(counts.shape == dense.shape)
+            assert(len(counts) == np.count_nonzero(dense))
+            # Coordinates are unique and sorted
+            keys = counts.rows * counts.shape[1] + counts.cols
+            assert((np.diff(keys) > 0).all())
+            assert((counts.todense() == dense).all())
+
+    def test_flatten(self):
+        inner = DAG(Symbol('inner'))
+        inner.add_gate(CNOT('a', 'b'))
+
+        # Nested deeper than the recursion limit
+        dag = inner
+        for _ in range(sys.getrecursionlimit() + 1):
+            outer = DAG(Symbol('outer'))
+            outer.gates.append(dag)
+            dag = outer
+        assert(DAG.flatten(dag) == inner.gates)
+
+        g = DAG(Symbol('tst'))
+        g.add_gate(INIT('a', 'b'))
+        g.add_gate(dag)
+        assert(g.gates[-1] is inner.gates[0])
+        assert(g.gates[-1].predicates == set(g.gates[:2]))
+
+    def test_deepcopy(self):
+        g = DAG(Symbol('tst'))
+        g.add_gate(INIT('a', 'b'))
+        # Chained deeper than the recursion limit
+        for _ in range(sys.getrecursionlimit()):
+            g.add_gate(T('a'))
+            g.add_gate(CNOT('a', 'b'))
+
+        h = copy.deepcopy(g)
+        assert(len(h.gates) == len(g.gates))
+        assert(not any(i is j for i, j in zip(g.gates, h.gates)))
+        lookup = {id(i):j for i, j in zip(g.gates, h.gates)}
+        assert(all(j.predicates == {lookup[id(k)] for k in i.predicates} for i, j in zip(g.gates, h.gates)))
+        assert(len(h.externs) == len(g.externs))
+
+        qcb = QCB(5, 5, g)
+        instance = qcb.instantiate()
+        assert(instance.operations is not g)
+        assert(len(instance.operations.gates) == len(g.gates))
+
+        assert(h.compile(1, T_Factory().instantiate())[0] == g.compile(1, T_Factory().instantiate())[0])
+
+
+class CompileTest(unittest.TestCase):
+    def test_count_only(self):
+        g = DAG(Symbol('tst'))
+        g.add_gate(INIT('a', 'b', 'c'))
+        for _ in range(4):
+            g.add_gate(T('a'))
+            g.add_gate(CNOT('a', 'b'))
+            g.add_gate(T('c'))
+            g.add_gate(CNOT('b', 'c'))
+
+        factory = T_Factory()
+        externs = [factory.instantiate() for _ in range(2)]
+
+        n_cycles, layers = g.compile(1, *externs)
+        assert(len(layers) == n_cycles)
+        resolved = set(id(gate.obj.obj if gate.is_extern() else gate.obj) for layer in layers for gate in layer)
+        assert(resolved == set(map(id, g.gates)))
+
+        assert(g.compile(1, *externs, count_only=True) == (n_cycles, None))
+        assert(all(g.externs[symbol] is not None for symbol in g.externs))
+
         
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,58 @@
+from surface_code_routing.dag import DAG
+from surface_code_routing.dag_template import DAGTemplate
+from surface_code_routing.symbol import Symbol
+from surface_code_routing.instructions import INIT, CNOT
+from surface_code_routing.lib_instructions import T, Toffoli
+
+import unittest
+
+class DAGTemplateTest(unittest.TestCase):
+
+    @staticmethod
+    def build(toffoli, t):
+        dag = DAG(Symbol('tst'))
+        dag.add_gate(INIT('a', 'b', 'c', 'd'))
+        dag.add_gate(toffoli('a', 'b', 'c'))
+        dag.add_gate(CNOT('c', 'd'))
+        dag.add_gate(toffoli('d', 'c', 'a'))
+        dag.add_gate(t('b'))
+        dag.add_gate(t('b'))
+        return dag
+
+    def test_instance(self):
+        dag = self.build(Toffoli, T)
+        toffoli = DAGTemplate(Toffoli)
+        t = DAGTemplate(T)
+        templated = self.build(toffoli, t)
+
+        # One template per signature
+        assert len(toffoli.templates) == 1
+        assert len(t.templates) == 1
+
+        indices = {id(gate):idx for idx, gate in enumerate(dag.gates)}
+        templated_indices = {id(gate):idx for idx, gate in enumerate(templated.gates)}
+        assert len(dag.gates) == len(templated.gates)
+        for gate, templated_gate in zip(dag.gates, templated.gates):
+            assert repr(gate) == repr(templated_gate)
+            assert sorted(indices[id(predicate)] for predicate in gate.predicates) == sorted(templated_indices[id(predicate)] for predicate in templated_gate.predicates)
+            assert gate.layer == templated_gate.layer
+            assert gate.slack == templated_gate.slack
+            assert gate.is_factory() == templated_gate.is_factory()
+
+        # Each instance allocates its own externs
+        externs = list(templated.externs)
+        assert len(externs) == len(list(dag.externs))
+        assert len(set(id(extern.predicate) for extern in externs)) == len(externs)
+
+    def test_signature(self):
+        cnot = DAGTemplate(CNOT)
+        dag = DAG(Symbol('tst'))
+        dag.add_gate(INIT('a', 'b', 'c'))
+        dag.add_gate(cnot('a', 'b', 'c'))
+        dag.add_gate(cnot('a', 'b', 'b'))
+        assert len(cnot.templates) == 2
+        assert set(dag.gates[-1].symbol.io) == {Symbol('a'), Symbol('b')}
+
+
+if __name__ == '__main__':
+    unittest.main()
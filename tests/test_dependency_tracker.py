@@ -0,0 +1,140 @@
+from surface_code_routing.dependency_tracker import ReadyQueue, ExternBarrier, ExternPool, CriticalPath, WaitForGraph
+from surface_code_routing.dag import DAG
+from surface_code_routing.symbol import Symbol
+from surface_code_routing.instructions import INIT, CNOT, Hadamard
+from surface_code_routing.compiled_qcb import compile_qcb
+from surface_code_routing.lib_instructions import T, T_Factory
+from surface_code_routing.bind import ExternBind, DAGBind
+
+import unittest
+
+class ReadyQueueTest(unittest.TestCase):
+
+    def test_countdown(self):
+        dag = DAG(Symbol('tst', ('a', 'b')))
+        dag.add_gate(INIT('a', 'b'))
+        dag.add_gate(CNOT('a', 'b'))
+        
+        queue = ReadyQueue(dag.gates)
+        cnot = dag.gates[-1]
+        n_predicates = len(cnot.predicates)
+        assert n_predicates > 0
+
+        for i in range(n_predicates):
+            assert queue.decrement(cnot) == n_predicates - i - 1
+
+    def test_flush(self):
+        queue = ReadyQueue([])
+        gates = [object() for _ in range(3)]
+        queue.extend(gates)
+        queue.issue(gates[1])
+        assert len(queue) == 3
+        queue.flush()
+        assert list(queue) == [gates[0], gates[2]]
+
+class ExternBarrierTest(unittest.TestCase):
+
+    def test_barrier(self):
+        sub = DAG(Symbol('sub', ('x', 'y')))
+        sub.add_gate(CNOT('x', 'y'))
+        sub.add_gate(Hadamard('x'))
+        sub_qcb = compile_qcb(sub, 4, 4)
+
+        dag = DAG(Symbol('tst'))
+        dag.add_gate(INIT('a', 'b'))
+        dag.add_gate(CNOT('a', 'b'))
+        dag.add_gate(sub_qcb('a', 'b'))
+        dag.add_gate(sub_qcb('b', 'a'))
+
+        barrier = ExternBarrier(dag)
+        extern_gates = [gate for gate in dag.gates if gate.is_extern()]
+        assert len(extern_gates) == 2
+
+        # Held until the preceding gates resolve
+        assert not barrier(extern_gates[0])
+        for gate in dag.gates:
+            barrier.resolve(gate)
+        assert all(barrier(gate) for gate in extern_gates)
+
+class ExternPoolTest(unittest.TestCase):
+
+    def test_pool(self):
+        dag = DAG(Symbol('tst'))
+        dag.add_gate(INIT('a'))
+        dag.add_gate(T('a'))
+        factory_gate = next(gate for gate in dag.gates if gate.is_factory())
+
+        factory = T_Factory()
+        externs = [ExternBind(factory.instantiate()) for _ in range(3)]
+        pool = ExternPool(externs)
+        assert len(pool) == 3
+
+        # Idle externs are handed out in order
+        assert pool.pop(factory_gate) is externs[0]
+        pool.append(externs[0])
+        assert [pool.pop(factory_gate) for _ in range(3)] == externs[1:] + externs[:1]
+        assert pool.pop(factory_gate) is None
+        assert len(pool) == 0
+
+class CriticalPathTest(unittest.TestCase):
+
+    def test_priority(self):
+        dag = DAG(Symbol('tst', ('a', 'b', 'c')))
+        dag.add_gate(INIT('a', 'b', 'c'))
+        dag.add_gate(Hadamard('a'))
+        dag.add_gate(Hadamard('a'))
+        dag.add_gate(Hadamard('a'))
+        dag.add_gate(Hadamard('b'))
+
+        priority = CriticalPath(dag)
+        long_chain = dag.gates[-4]
+        short_chain = dag.gates[-1]
+
+        assert priority.slack(long_chain) == 0
+        assert priority.slack(short_chain) > 0
+        assert sorted([short_chain, long_chain], key=priority) == [long_chain, short_chain]
+        assert priority.length == max(priority.asap[gate] + gate.n_cycles() for gate in dag.gates)
+
+    def test_compile(self):
+        dag = DAG(Symbol('tst', ('a', 'b')))
+        dag.add_gate(INIT('a', 'b'))
+        dag.add_gate(CNOT('a', 'b'))
+        dag.add_gate(Hadamard('a'))
+
+        n_cycles = dag.compile(2)
+        assert dag.compile(2, priority=CriticalPath) == n_cycles
+
+    def test_default_order(self):
+        dag = DAG(Symbol('tst', ('a', 'b')))
+        dag.add_gate(INIT('a', 'b'))
+        dag.add_gate(Hadamard('a'))
+        dag.add_gate(Hadamard('a'))
+        dag.add_gate(Hadamard('b'))
+        dag.add_gate(T('a'))
+        factory_gate = next(gate for gate in dag.gates if gate.is_factory())
+
+        # Without a priority, compile sorts non-extern gates on slack and leaves externs in ready order
+        waiting = [ExternBind(factory_gate)] + [DAGBind(gate) for gate in dag.gates if not gate.is_extern()]
+        waiting.sort()
+        slack = [gate.slack for gate in waiting if not gate.is_extern()]
+        assert slack == sorted(slack)
+        assert min(slack) < max(slack)
+        assert waiting[0].obj.obj is factory_gate
+
+class WaitForGraphTest(unittest.TestCase):
+
+    def test_cycle(self):
+        gates = [object() for _ in range(4)]
+        wait_for = WaitForGraph()
+        wait_for.add_edge(gates[0], gates[1])
+        wait_for.add_edge(gates[1], gates[2])
+        wait_for.add_edge(gates[2], gates[3])
+        assert wait_for.find_cycle() is None
+
+        wait_for.add_edge(gates[3], gates[1])
+        assert wait_for.find_cycle() == gates[1:]
+        assert wait_for.waits_on(gates[3]) == [gates[1]]
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -6,12 +6,13 @@ from surface_code_routing.qcb import QCB, SCPatch
 from surface_code_routing.allocator import Allocator
 from surface_code_routing.qcb_graph import QCBGraph
 from surface_code_routing.qcb_tree import QCBTree
-from surface_code_routing.router import QCBRouter
+from surface_code_routing.router import QCBRouter, BudgetExceeded
 from surface_code_routing.mapper import QCBMapper
 from surface_code_routing.circuit_model import PatchGraph
 from surface_code_routing.inject_rotations import RotationInjector
 
 from surface_code_routing.bind import RouteBind
+from surface_code_routing.dependency_tracker import ReadyQueue, ExternBarrier, DeadlockError
 
 from surface_code_routing.lib_instructions import T_Factory, T, Toffoli
 
@@ -75,6 +76,72 @@ class RouterTest(unittest.TestCase):
 
             assert route_found
 
+    def test_route_shortest_path(self):
+        dag = DAG(Symbol('Test'))
+        dag.add_gate(INIT('a', 'b'))
+        dag.add_gate(CNOT('a', 'b'))
+
+        qcb = QCB(5, 5, dag)
+        allocator = Allocator(qcb)
+
+        graph = QCBGraph(qcb)
+        tree = QCBTree(graph)
+        mapper = QCBMapper(dag, tree)
+
+        circuit_model = PatchGraph(qcb.shape, mapper, None)
+        router = QCBRouter(qcb, dag, mapper, graph=circuit_model, auto_route=False)
+
+        route_patches = [patch for patch in circuit_model.graph.flatten() if patch.state is SCPatch.ROUTE]
+        start, end = route_patches[0], route_patches[-1]
+        gate = GateInterface(Symbol('gate'))
+
+        path = circuit_model.route(start, end, gate)
+        assert path[0] is start and path[-1] is end
+        assert len(set(path)) == len(path)
+        for patch, next_patch in zip(path, path[1:]):
+            assert abs(patch.x - next_patch.x) + abs(patch.y - next_patch.y) == 1
+
+        # Breadth first distance over routing patches
+        distance = {start: 0}
+        frontier = [start]
+        while len(frontier) > 0:
+            next_frontier = []
+            for patch in frontier:
+                for adj in patch.adjacent(gate):
+                    if adj.state is SCPatch.ROUTE and adj not in distance:
+                        distance[adj] = distance[patch] + 1
+                        next_frontier.append(adj)
+            frontier = next_frontier
+        assert len(path) - 1 == distance[end]
+
+    def test_steiner_route(self):
+        dag = DAG(Symbol('Test'))
+        dag.add_gate(INIT('a', 'b', 'c', 'd'))
+        dag.add_gate(CNOT('a', 'b', 'c', 'd'))
+
+        qcb = QCB(6, 6, dag)
+        allocator = Allocator(qcb)
+
+        graph = QCBGraph(qcb)
+        tree = QCBTree(graph)
+        mapper = QCBMapper(dag, tree)
+
+        circuit_model = PatchGraph(qcb.shape, mapper, None)
+        rot_injector = RotationInjector(dag, mapper, qcb, graph=circuit_model)
+        router = QCBRouter(qcb, dag, mapper, graph=circuit_model, steiner_routing=True)
+
+        fanout = dag.gates[-1]
+        route = next(route for gate, route in router.routes.items() if gate.obj.obj is fanout)
+        terminals = [circuit_model[address] for address in mapper[fanout]]
+        assert all(terminal in route for terminal in terminals)
+
+        # Each branch joins onto the tree and is contiguous
+        tree = {route[0]}
+        for patch, next_patch in zip(route, route[1:]):
+            if abs(patch.x - next_patch.x) + abs(patch.y - next_patch.y) != 1:
+                assert next_patch in tree
+            tree.add(next_patch)
+
 #    def test_lock_unlock(self):
 #        dag = DAG(Symbol('Test'))
 #        dag.add_gate(INIT('a', 'b', 'c', 'd'))
@@ -301,6 +368,167 @@ class RouterTest(unittest.TestCase):
 
         router = QCBRouter(qcb, dag, mapper, graph=circuit_model)
 
+    def test_event_driven(self):
+        dag = DAG(Symbol('Test'))
+        dag.add_gate(INIT('a', 'b', 'c', 'd'))
+        dag.add_gate(CNOT('a', 'b'))
+        dag.add_gate(CNOT('c', 'd'))
+        dag.add_gate(Hadamard('a'))
+        dag.add_gate(CNOT('a', 'd'))
+        dag.add_gate(CNOT('b', 'c'))
+
+        qcb = QCB(4, 4, dag)
+        allocator = Allocator(qcb)
+
+        graph = QCBGraph(qcb)
+        tree = QCBTree(graph)
+
+        # Allocation is not deterministic between runs, so every router shares the same mapper
+        mapper = QCBMapper(dag, tree)
+        rot_injector = RotationInjector(dag, mapper, qcb, graph=PatchGraph(qcb.shape, mapper, None))
+
+        def route(**router_kwargs):
+            circuit_model = PatchGraph(qcb.shape, mapper, None)
+            return QCBRouter(qcb, dag, mapper, graph=circuit_model, teleport=False, **router_kwargs)
+
+        # Gates within a layer are unordered
+        layers = lambda router: [sorted(id(gate.obj) for gate in layer) for layer in router.layers]
+
+        router = route()
+        for router_kwargs in ({'event_driven':True}, {'reservations':True}, {'negotiation_iterations':4}, {'parallel_workers':2}):
+            other_router = route(**router_kwargs)
+            assert len(other_router.layers) == len(router.layers)
+            assert layers(other_router) == layers(router)
+            assert len(other_router.resolved) == len(router.resolved)
+
+        # Layered routing records each gate once, when it resolves
+        router = route(auto_route=False)
+        recorded = []
+        add = router.layers.add
+        router.layers.add = lambda gate, *args: (recorded.append(gate), add(gate, *args))
+        router.route()
+        assert len(recorded) == len(router.layers.gates) == len(router.resolved)
+
+    def test_streaming(self):
+        def route(**router_kwargs):
+            dag = DAG(Symbol('Test'))
+            dag.add_gate(INIT('a', 'b', 'c', 'd'))
+            dag.add_gate(CNOT('a', 'b'))
+            dag.add_gate(CNOT('c', 'd'))
+            dag.add_gate(Hadamard('a'))
+            dag.add_gate(CNOT('a', 'd'))
+            dag.add_gate(CNOT('b', 'c'))
+
+            qcb = QCB(4, 4, dag)
+            allocator = Allocator(qcb)
+
+            graph = QCBGraph(qcb)
+            tree = QCBTree(graph)
+
+            mapper = QCBMapper(dag, tree)
+            circuit_model = PatchGraph(qcb.shape, mapper, None)
+            rot_injector = RotationInjector(dag, mapper, qcb, graph=circuit_model)
+
+            return QCBRouter(qcb, dag, mapper, graph=circuit_model, teleport=False, **router_kwargs)
+
+        for event_driven in (False, True):
+            router = route(event_driven=event_driven)
+            gates = sorted({repr(gate) for layer in router.layers for gate in layer})
+
+            streamed = []
+            stream_router = route(event_driven=event_driven, sink=lambda cycle, bindings: streamed.append((cycle, bindings)))
+            assert [cycle for cycle, _ in streamed] == list(range(len(stream_router.layers)))
+            assert sorted({repr(gate) for _, bindings in streamed for gate, _ in bindings}) == gates
+            assert all(addresses is not None for _, bindings in streamed for _, addresses in bindings)
+
+            # Finalised layers and routes are released
+            assert len(stream_router.routes) == 0
+            assert list(stream_router.layers) == []
+
+    def test_streaming_teleports(self):
+        dag = DAG(Symbol('Test'))
+        registers = [f'r{i}' for i in range(6)]
+        dag.add_gate(INIT(*registers))
+        for i in range(30):
+            dag.add_gate(CNOT(registers[i % 6], registers[(5 * i + 3) % 6]))
+            dag.add_gate(Hadamard(registers[i % 6]))
+
+        qcb = QCB(8, 8, dag)
+        allocator = Allocator(qcb)
+
+        graph = QCBGraph(qcb)
+        tree = QCBTree(graph)
+
+        mapper = QCBMapper(dag, tree)
+        circuit_model = PatchGraph(qcb.shape, mapper, None)
+        rot_injector = RotationInjector(dag, mapper, qcb, graph=circuit_model)
+
+        router = QCBRouter(qcb, dag, mapper, graph=circuit_model, teleport=True, auto_route=False)
+        assert len(router.teleport_injector.switches) > 0
+
+        # Unused teleport switches do not hold back finalised layers
+        released = [len(router.resolved) < len(dag.gates) for _ in router.stream()]
+        assert len(released) == len(router.layers)
+        assert sum(released) > len(released) // 2
+
+    def test_deadlock(self):
+        dag = DAG(Symbol('Test'))
+        dag.add_gate(INIT('a', 'b'))
+        dag.add_gate(CNOT('a', 'b'))
+        dag.add_gate(Hadamard('a'))
+        cnot, hadamard = dag.gates[-2:]
+
+        qcb = QCB(4, 4, dag)
+        allocator = Allocator(qcb)
+
+        graph = QCBGraph(qcb)
+        tree = QCBTree(graph)
+
+        mapper = QCBMapper(dag, tree)
+        circuit_model = PatchGraph(qcb.shape, mapper, None)
+        rot_injector = RotationInjector(dag, mapper, qcb, graph=circuit_model)
+        router = QCBRouter(qcb, dag, mapper, graph=circuit_model, auto_route=False)
+        router.barrier = ExternBarrier(dag)
+
+        # The Hadamard holds a patch of the CNOT that it depends on
+        blocker = RouteBind(hadamard, None)
+        patch = circuit_model[mapper[blocker][0]]
+        patch.lock(blocker)
+        circuit_model.hold_locks(blocker)
+
+        waiting = ReadyQueue(dag.gates)
+        waiting.append(RouteBind(cnot, None))
+        with self.assertRaises(DeadlockError) as context:
+            router.check_deadlock(waiting)
+
+        error = context.exception
+        assert error.stalled == [cnot]
+        assert error.wait_for.waits_on(cnot) == [patch]
+        assert error.cycle == [cnot, patch, hadamard]
+
+    def test_budget(self):
+        dag = DAG(Symbol('Test'))
+        dag.add_gate(INIT('a', 'b'))
+        for _ in range(4):
+            dag.add_gate(CNOT('a', 'b'))
+
+        qcb = QCB(4, 4, dag)
+        allocator = Allocator(qcb)
+
+        graph = QCBGraph(qcb)
+        tree = QCBTree(graph)
+
+        mapper = QCBMapper(dag, tree)
+        circuit_model = PatchGraph(qcb.shape, mapper, None)
+        rot_injector = RotationInjector(dag, mapper, qcb, graph=circuit_model)
+
+        with self.assertRaises(BudgetExceeded) as context:
+            QCBRouter(qcb, dag, mapper, graph=circuit_model, max_cycles=3)
+
+        progress = context.exception.progress
+        assert progress['cycles'] == len(context.exception.router.layers) == 3
+        assert 0 < progress['resolved'] < progress['gates']
+
 
 if __name__ == '__main__':
     unittest.main()
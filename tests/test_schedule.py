@@ -0,0 +1,83 @@
+from surface_code_routing.schedule import LayerSchedule
+
+import unittest
+
+class LayerScheduleTest(unittest.TestCase):
+
+    def test_intervals(self):
+        schedule = LayerSchedule()
+        schedule.add('a', 0, 3)
+        schedule.add('b', 1, 2)
+        schedule.extend(4)
+
+        assert len(schedule) == 4
+        assert schedule[0] == ['a']
+        assert sorted(schedule[1]) == ['a', 'b']
+        assert schedule[2] == ['a']
+        assert schedule[3] == []
+        assert schedule[-1] == []
+
+    def test_write_through(self):
+        schedule = LayerSchedule()
+        schedule.add('a', 0, 2)
+        assert schedule[1] == ['a']
+
+        # Gates appended to a layer view are recorded in the schedule
+        schedule.add('b', 1, 3)
+        schedule[0].append('c')
+        assert list(schedule) == [['a', 'c'], ['a', 'b'], ['b']]
+
+    def test_list_interface(self):
+        schedule = LayerSchedule()
+        schedule.append(['a'])
+        schedule.append([])
+        schedule[-1].append('b')
+        schedule.append([])
+        assert schedule.pop() == []
+        assert len(schedule) == 2
+        assert schedule[:] == [['a'], ['b']]
+
+    def test_merge_intervals(self):
+        schedule = LayerSchedule()
+        for layer in range(3):
+            schedule.add('a', layer, layer + 1, ('x', 'y'))
+        schedule.add('a', 4, 5)
+        schedule.add('b', 1, 2)
+
+        # Consecutive intervals of a gate are stored once
+        assert list(schedule.intervals()) == [('a', 0, 3, ('x', 'y')), ('a', 4, 5, None), ('b', 1, 2, None)]
+        assert list(schedule) == [['a'], ['a', 'b'], ['a'], [], ['a']]
+        assert schedule.occupied()
+        assert not schedule.occupied(3)
+
+    def test_pop_truncates(self):
+        schedule = LayerSchedule()
+        schedule.add('a', 0, 3)
+        assert schedule.pop() == ['a']
+        assert list(schedule) == [['a'], ['a']]
+
+    def test_finalise(self):
+        schedule = LayerSchedule()
+        schedule.add('a', 0, 2, 'x')
+        schedule.add('b', 1, 4, 'y')
+
+        layers, dropped = schedule.finalise(2)
+        assert layers == [(0, (('a', 'x'),)), (1, (('a', 'x'), ('b', 'y')))]
+        assert dropped == ['a']
+        assert len(schedule) == 4
+        assert list(schedule) == [['b'], ['b']]
+
+        with self.assertRaises(Exception):
+            schedule.add('c', 1, 3)
+        with self.assertRaises(IndexError):
+            schedule[1]
+
+    def test_out_of_range(self):
+        schedule = LayerSchedule()
+        schedule.add('a', 0, 1)
+        with self.assertRaises(IndexError):
+            schedule[1]
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,114 @@
+from surface_code_routing.dag import DAG
+from surface_code_routing.instructions import INIT, CNOT
+from surface_code_routing.symbol import Symbol
+
+from surface_code_routing.qcb import QCB, SCPatch
+from surface_code_routing.allocator import Allocator
+from surface_code_routing.qcb_graph import QCBGraph
+from surface_code_routing.qcb_tree import QCBTree
+from surface_code_routing.mapper import QCBMapper
+from surface_code_routing.circuit_model import PatchGraph
+from surface_code_routing.speculative_routing import SpeculativeRouter, init_worker, route_chunk, clusters, bounding_box
+
+import random
+import unittest
+
+class SpeculativeRoutingTest(unittest.TestCase):
+
+    def patch_graph(self, height=6, width=6, n_registers=2, **kwargs):
+        dag = DAG(Symbol('Test'))
+        registers = [f'r{i}' for i in range(n_registers)]
+        dag.add_gate(INIT(*registers))
+        dag.add_gate(CNOT(registers[0], registers[1]))
+
+        qcb = QCB(height, width, dag)
+        allocator = Allocator(qcb)
+
+        graph = QCBGraph(qcb)
+        tree = QCBTree(graph)
+        mapper = QCBMapper(dag, tree)
+
+        return PatchGraph(qcb.shape, mapper, None, **kwargs)
+
+    def route_request(self, circuit_model):
+        route_patches = [patch for patch in circuit_model.graph.flatten() if patch.state is SCPatch.ROUTE]
+        start, end = route_patches[0], route_patches[-1]
+        request = (0, ((start.y, start.x), (end.y, end.x)), [((start.y, start.x), (end.y, end.x), None)])
+        return start, end, request
+
+    def test_clusters(self):
+        boxes = [bounding_box([(0, 0), (1, 1)]), bounding_box([(10, 10)]), bounding_box([(2, 2)])]
+        assert clusters(boxes) == [[0, 2], [1]]
+
+    def test_snapshot_route(self):
+        circuit_model = self.patch_graph()
+        speculative_router = SpeculativeRouter(circuit_model, 1)
+        start, end, request = self.route_request(circuit_model)
+        gate = object()
+
+        # Worker tables are set in process
+        init_worker(circuit_model.route_mask, circuit_model.coordinate_adjacency)
+
+        path = circuit_model.route(start, end, gate)
+        results = route_chunk(speculative_router.snapshot(), circuit_model.orientations, [request])
+        assert results == [(0, [(patch.y, patch.x) for patch in path])]
+
+        # Routed gates block later gates in the same chunk
+        results = route_chunk(speculative_router.snapshot(), circuit_model.orientations, [request, (1,) + request[1:]])
+        assert [key for key, _ in results] == [0]
+
+        # Locked patches are blocked in the snapshot
+        for patch in path[1:-1]:
+            patch.lock(gate)
+        circuit_model.hold_locks(gate)
+        assert all(speculative_router.snapshot()[patch.y, patch.x] for patch in path[1:-1])
+
+    def test_snapshot_search_options(self):
+        # Workers search with the heuristic and bounds of the patch graph
+        circuit_model = self.patch_graph(distance_heuristic=True)
+        speculative_router = SpeculativeRouter(circuit_model, 1)
+        start, end, request = self.route_request(circuit_model)
+        init_worker(circuit_model.route_mask, circuit_model.coordinate_adjacency, circuit_model.distance_heuristic, circuit_model.distance_dtype)
+
+        path = circuit_model.route(start, end, object())
+        results = route_chunk(speculative_router.snapshot(), circuit_model.orientations, [request])
+        assert results == [(0, [(patch.y, patch.x) for patch in path])]
+
+        # Negotiation costs steer the worker as they do the patch graph
+        circuit_model.start_negotiation()
+        for patch in path[1:-1]:
+            circuit_model.history_costs[patch.y, patch.x] = 10
+        path = circuit_model.route(start, end, object())
+        results = route_chunk(speculative_router.snapshot(), circuit_model.orientations, [request], costs=circuit_model.costs())
+        assert results == [(0, [(patch.y, patch.x) for patch in path])]
+
+        # Abandoned searches produce no candidate
+        results = route_chunk(speculative_router.snapshot(), circuit_model.orientations, [request], max_expansions=1)
+        assert results == []
+
+    def test_pool_candidates(self):
+        circuit_model = self.patch_graph(16, 32, 40)
+        speculative_router = SpeculativeRouter(circuit_model, 2)
+        init_worker(circuit_model.route_mask, circuit_model.coordinate_adjacency)
+
+        # Two independent clusters of gates, one on each half of the QCB
+        rng = random.Random(0)
+        route_patches = [tuple(map(int, patch)) for patch in zip(*circuit_model.route_mask.nonzero())]
+        halves = [[patch for patch in route_patches if patch[1] < 14], [patch for patch in route_patches if patch[1] > 17]]
+        requests = []
+        for key in range(200):
+            start, end = rng.sample(halves[key % 2], 2)
+            requests.append((key, (start, end), [(start, end, None)]))
+
+        serial = dict(route_chunk(speculative_router.snapshot(), circuit_model.orientations, requests))
+        try:
+            candidates = speculative_router(requests)
+        finally:
+            speculative_router.shutdown()
+
+        assert len(candidates) > 0
+        assert candidates == serial
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,5 +1,6 @@
 from surface_code_routing.symbol import Symbol, ExternSymbol
 from surface_code_routing.scope import Scope
+import copy
 import unittest
 
 class SymbolTest(unittest.TestCase):
@@ -52,6 +53,17 @@ class SymbolTest(unittest.TestCase):
         assert esym.io_element == Symbol('y')
         assert esym.satisfies(matching_symbol)
 
+    def test_copy_extern(self):
+        factory = ExternSymbol('T_Factory', 'out')
+        sym = factory('x')
+        factory_copy, sym_copy = copy.deepcopy((factory, sym))
+
+        # Copies share a copied predicate
+        assert(factory_copy == sym_copy)
+        assert(factory_copy != factory)
+        assert(factory_copy.io == {factory_copy:factory_copy})
+        assert(factory_copy.satisfies(factory))
+
         
 
 if __name__ == '__main__':